@@ -4,11 +4,15 @@ import os
 from src.logger import logging
 from src.dairization import WhisperTranscriber
 from dotenv import load_dotenv
-from src.summarization import summarise_transcript
-from src.utils import extract_audio_duration, count_words, display_conversation, extract_speaker_texts, save_transcription
-from datetime import datetime
+from src.summarization import get_summarization_engine
+from src.utils import extract_audio_duration
+from src.ingest import normalize_audio_file
+from src.transcript import Transcript
+from src.workspace import JobWorkspace
 from src.constants import BUCKET_NAME
 from src.s3_syncer import S3Sync
+from src.artifact_uploader import ArtifactUploader
+import atexit
 import pandas as pd
 
 load_dotenv()
@@ -20,10 +24,16 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION = os.getenv("AWS_REGION")
 DEVICE = os.getenv("DEVICE")
 
-timestamp = datetime.now()
-timestamp = timestamp.strftime("%m_%d_%y_%H_%M_%S")
 s3_sync = S3Sync(AWS_ACCESS_KEY_ID,AWS_SECRET_ACCESS_KEY,AWS_REGION)
 
+@st.cache_resource
+def get_artifact_uploader():
+    # Streamlit re-runs this script on every interaction, keep a single uploader thread
+    uploader = ArtifactUploader(s3_sync, BUCKET_NAME)
+    uploader.start()
+    atexit.register(uploader.stop)
+    return uploader
+
 def show_transcription(conversation):
     st.subheader("Transcription")
     for entry in conversation:
@@ -90,70 +100,62 @@ def main(huggingface_token,groq_api_key):
     
     st.title("Audio Transcription and Speaker Diarization")
 
-    audio_file = st.file_uploader("Upload an audio file (.wav or .mp3)", type=['wav', 'mp3'])
+    audio_file = st.file_uploader("Upload an audio file (.wav, .mp3, .m4a, .flac or .ogg)", type=['wav', 'mp3', 'm4a', 'flac', 'ogg'])
 
     if audio_file is not None:
-        # Save uploaded audio file
-        with open("uploaded_audio.wav", "wb") as f:
-            f.write(audio_file.getbuffer())
-
-        transcriber = WhisperTranscriber("uploaded_audio.wav", huggingface_token)
-
-        transcriber.start_process()  # Record start time
-        if 'model_loaded' not in st.session_state:
-            with st.spinner("Loading model..."):
-                transcriber.load_model()
-                st.session_state.model_loaded = True  # Track model loading status
-                st.markdown("✅ Model Loaded successfully!")  # Immediate feedback
-
         if 'conversation' not in st.session_state:
-            with st.spinner("Transcribing audio..."):
-                transcriber.transcribe_audio()
-                st.markdown("✅ Transcribing completed!")  # Immediate feedback
-
-            with st.spinner("Aligning transcription..."):
-                transcriber.align_transcription()
-                st.markdown("✅ Alignment completed!")  # Immediate feedback
-
-            with st.spinner("Diarizing audio..."):
-                final_result, uniq_speakers = transcriber.diarize_audio()
-                st.markdown("✅ Diarization completed!")  # Immediate feedback
-
-            # Save results to JSON
-            transcriber.save_to_json(final_result)
-            conversation = display_conversation(filename='data.json', uniq_speakers=uniq_speakers)
-
-            directory_path = save_transcription(conversation=conversation)
-            s3_sync.sync_folder_to_s3(folder = directory_path,aws_bucket_name=BUCKET_NAME)
-            logging.info("Succesfully transcriptions are saved to s3 bucket")
-            speaker_texts = extract_speaker_texts(conversation)
-            print(speaker_texts)
-            individual_summary = {}
-            for speaker, speeches in speaker_texts.items():
-                individual_summary[speaker] = summarise_transcript(groq_api_key=groq_api_key, transcript=speeches)
-                
-            print(individual_summary)
-            summary_content = summarise_transcript(groq_api_key=groq_api_key, transcript=conversation)
-            
-            # Create a DataFrame for displaying summaries
-            summary_data = {
-                "Speaker": list(individual_summary.keys()) + ["Total Summary"],
-                "Summary": list(individual_summary.values()) + [summary_content]
-            }
-            print(summary_data)
-            logging.info(f"summary data: {summary_data}")
-            # Gathered data from previous steps
-            audio_duration = extract_audio_duration('uploaded_audio.wav')
-            total_words, words_by_speaker = count_words(conversation)
-            elapsed_time = transcriber.end_process()  # Record end time and calculate elapsed time
-            st.success(f"Audio processing complete in {elapsed_time:.2f} seconds!")
-
-            # Store results in session state for future use
-            st.session_state.conversation = conversation
-            st.session_state.summary_data = summary_data
-            st.session_state.audio_duration = audio_duration
-            st.session_state.total_words = total_words
-            st.session_state.words_by_speaker = words_by_speaker
+            # Each run works in its own directory so concurrent users don't overwrite each other. The directory
+            # is removed once the results are in the session state; the uploader keeps its own copy of the exports
+            with JobWorkspace() as workspace:
+                # Save the uploaded file and normalize it to 16 kHz mono WAV
+                raw_path = workspace.path(f"upload_{os.path.basename(audio_file.name)}")
+                with open(raw_path, "wb") as f:
+                    f.write(audio_file.getbuffer())
+                normalize_audio_file(raw_path, workspace.audio_path)
+                os.remove(raw_path)
+
+                transcriber = WhisperTranscriber(workspace.audio_path, huggingface_token)
+
+                transcriber.start_process()  # Record start time
+                if 'model_loaded' not in st.session_state:
+                    with st.spinner("Loading model..."):
+                        transcriber.load_model()
+                        st.session_state.model_loaded = True  # Track model loading status
+                        st.markdown("✅ Model Loaded successfully!")  # Immediate feedback
+
+                with st.spinner("Transcribing audio..."):
+                    transcriber.transcribe_audio()
+                    st.markdown("✅ Transcribing completed!")  # Immediate feedback
+
+                with st.spinner("Aligning transcription..."):
+                    transcriber.align_transcription()
+                    st.markdown("✅ Alignment completed!")  # Immediate feedback
+
+                with st.spinner("Diarizing audio..."):
+                    final_result, uniq_speakers = transcriber.diarize_audio()
+                    st.markdown("✅ Diarization completed!")  # Immediate feedback
+
+                transcript = Transcript.from_result(final_result, uniq_speakers=uniq_speakers)
+                conversation = transcript.to_html()
+
+                directory_path = transcript.write_exports(workspace.transcriptions_dir)
+                get_artifact_uploader().enqueue_folder(directory_path, prefix=workspace.s3_prefix)
+                # Speaker and overall summaries are requested concurrently
+                summary_data = get_summarization_engine(groq_api_key).summarise_conversation(transcript.speaker_texts, transcript.lines())
+                print(summary_data)
+                logging.info(f"summary data: {summary_data}")
+                # Gathered data from previous steps
+                audio_duration = extract_audio_duration(workspace.audio_path)
+                total_words, words_by_speaker = transcript.total_words, transcript.words_by_speaker
+                elapsed_time = transcriber.end_process()  # Record end time and calculate elapsed time
+                st.success(f"Audio processing complete in {elapsed_time:.2f} seconds!")
+
+                # Store results in session state for future use
+                st.session_state.conversation = conversation
+                st.session_state.summary_data = summary_data
+                st.session_state.audio_duration = audio_duration
+                st.session_state.total_words = total_words
+                st.session_state.words_by_speaker = words_by_speaker
         
         col1, col2 = st.columns(2)
     
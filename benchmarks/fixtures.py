@@ -0,0 +1,103 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import wave
+from types import SimpleNamespace
+from src.constants import SAMPLE_RATE
+
+WORDS = ("the call quarterly revenue customer account update please thanks meeting schedule report "
+         "issue ticket support manager budget review follow next week question answer team project").split()
+
+
+def synthetic_audio(path, seconds=60, sample_rate=SAMPLE_RATE, seed=0):
+    """
+    Write a deterministic 16-bit mono WAV of alternating "speakers" and pauses.
+
+    Each utterance is a voiced harmonic tone with a syllable-rate envelope; the two
+    speakers differ in pitch, so VAD, ASR and diarization all have work to do.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(seconds * sample_rate), dtype=np.float32)
+    position, speaker = 0.5, 0
+    while position < seconds - 1:
+        duration = min(rng.uniform(2, 6), seconds - position - 0.5)
+        t = np.arange(int(duration * sample_rate)) / sample_rate
+        pitch = (120, 210)[speaker] * (1 + 0.05 * np.sin(2 * np.pi * 0.7 * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+        envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t)) * np.minimum(1, np.minimum(t, duration - t) * 20)
+        start = int(position * sample_rate)
+        audio[start:start + len(t)] = 0.2 * voiced * envelope
+        position += duration + rng.uniform(0.3, 1.5)
+        speaker = 1 - speaker
+    audio += rng.normal(0, 0.002, len(audio)).astype(np.float32)
+
+    with wave.open(path, 'wb') as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(sample_rate)
+        file.writeframes((np.clip(audio, -1, 1) * 32767).astype('<i2').tobytes())
+    return path
+
+
+def synthetic_result(num_words, num_speakers=2, words_per_segment=20, seed=0):
+    """A diarized whisperx-style result with `num_words` words and word timings."""
+    rng = random.Random(seed)
+    segments = []
+    position, remaining = 0.0, num_words
+    while remaining > 0:
+        count = min(remaining, rng.randint(words_per_segment // 2, words_per_segment * 3 // 2))
+        # Keep a speaker for a few segments so turns merge like in real calls
+        speaker = segments[-1]["speaker"] if segments and rng.random() < 0.6 else f"SPEAKER_{rng.randrange(num_speakers):02d}"
+        words = []
+        for _ in range(count):
+            words.append({"word": rng.choice(WORDS), "start": round(position, 3), "end": round(position + 0.3, 3),
+                          "score": 0.9, "speaker": speaker})
+            position += 0.35
+        segments.append({"start": words[0]["start"], "end": words[-1]["end"], "speaker": speaker,
+                         "text": " " + " ".join(word["word"] for word in words), "words": words})
+        remaining -= count
+        position += 0.5
+    return {"segments": segments, "word_segments": [word for segment in segments for word in segment["words"]]}
+
+
+class FakeLLM:
+    """Chat model stand-in answering every request after `latency` seconds."""
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(content="Summary: the participants discussed the quarterly figures and next steps.")
+
+
+class FakeS3Sync:
+    """
+    S3Sync stand-in copying uploads into a local directory.
+
+    Every call sleeps for `latency` seconds plus the transfer time at `bandwidth_mb_s`,
+    roughly like a same-region S3 PUT.
+    """
+    def __init__(self, directory, latency=0.02, bandwidth_mb_s=100, max_workers=16):
+        self.directory = directory
+        self.latency = latency
+        self.bandwidth_mb_s = bandwidth_mb_s
+        self.max_workers = max_workers
+        self.uploads = 0
+        self._lock = threading.Lock()
+
+    def upload_file(self, local_path, bucket_name, s3_key):
+        size = os.path.getsize(local_path)
+        time.sleep(self.latency + size / (self.bandwidth_mb_s * 2 ** 20))
+        target = os.path.join(self.directory, bucket_name, s3_key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(local_path, 'rb') as source, open(target, 'wb') as destination:
+            destination.write(source.read())
+        with self._lock:
+            self.uploads += 1
@@ -0,0 +1,79 @@
+"""
+Import-time budget of the application entry points.
+
+    python -m benchmarks.import_time              # every entry point against its budget
+    python -m benchmarks.import_time main --top 20
+
+Each module is imported in a fresh interpreter with `python -X importtime`; the best
+cumulative time of `--repeat` runs is compared with the budget below, and the slowest
+imports are listed to show what to make lazy. Exits with status 1 when over budget.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds allowed for importing each entry point, before any model is loaded
+BUDGETS = {
+    "main": 1.0,
+    "src.pipeline": 0.3,
+    "src.utils": 0.05,
+    "src.s3_syncer": 0.05,
+    "app": 3.0,  # streamlit alone takes most of this
+}
+
+
+def _import_times(code, env=None):
+    """[(cumulative seconds, module), ...] reported by `python -X importtime -c code`."""
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                             cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Running {code!r} failed:\n{process.stderr[-2000:]}")
+
+    times = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split(":", 1)[1].split("|")
+        times.append((int(cumulative_us) / 1e6, name.strip()))
+    return times
+
+
+def measure_import(module, env=None):
+    """Return (seconds, [(cumulative seconds, imported module), ...]) for importing `module`."""
+    # Modules imported by interpreter startup (site, .pth files) are not the entry point's cost
+    startup = {name for _, name in _import_times("pass", env)}
+    total, imports = None, []
+    for seconds, name in _import_times(f"import {module}", env):
+        if name == module:
+            total = seconds
+        elif name not in startup:
+            imports.append((seconds, name))
+    return total, imports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the import time of the entry points.")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports listed per entry point.")
+    args = parser.parse_args(argv)
+
+    over_budget = []
+    for module in args.modules:
+        runs = [measure_import(module) for _ in range(args.repeat)]
+        total, imports = min(runs, key=lambda run: run[0])
+        budget = BUDGETS.get(module)
+        status = "ok" if budget is None or total <= budget else "OVER BUDGET"
+        print(f"{module:20} {total:.3f}s (budget {f'{budget}s' if budget else 'none'}) {status}")
+        for seconds, name in sorted(imports, reverse=True)[:args.top]:
+            print(f"    {seconds:.3f}s  {name}")
+        if status != "ok":
+            over_budget.append(module)
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""
+Offline benchmarks of the transcription pipeline and the transcript utilities.
+
+    python -m benchmarks.run                                  # every suite, compared to benchmarks/baseline.json
+    python -m benchmarks.run --suite utils --sizes 1000 10000
+    python -m benchmarks.run --save-baseline                  # store the results as the new baseline
+
+Audio, transcripts, the LLM and S3 are all generated or faked locally; only the
+pipeline suite needs whisperx and a (downloaded once) tiny Whisper model. The
+command exits with status 1 when a benchmark is slower or uses more memory than
+the baseline by more than `--tolerance`.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fixtures import FakeLLM, FakeS3Sync, synthetic_audio, synthetic_result
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results.json")
+SUITES = ("utils", "summarization", "uploader", "pipeline")
+
+
+def measure(fn, repeat=3, trace_memory=True):
+    """Best wall time of `repeat` runs of `fn` and the peak Python allocation of one more run."""
+    seconds = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        fn()
+        seconds = min(seconds, time.perf_counter() - start_time)
+
+    stats = {"seconds": round(seconds, 6)}
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            fn()
+            stats["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 3)
+        finally:
+            tracemalloc.stop()
+    return stats
+
+
+def bench_utils(args, workdir):
+    """Transcript helpers of src.utils next to their single-pass Transcript replacements."""
+    from src.utils import display_conversation, count_words, extract_speaker_texts, save_transcription
+    from src.transcript import Transcript
+
+    results = {}
+    for size in args.sizes:
+        result = synthetic_result(size)
+        conversation = display_conversation(result=result)
+        transcript = Transcript.from_result(result)
+        directory = os.path.join(workdir, f"transcriptions_{size}")
+        cases = {
+            "utils.display_conversation": lambda: display_conversation(result=result),
+            "utils.count_words": lambda: count_words(conversation),
+            "utils.extract_speaker_texts": lambda: extract_speaker_texts(conversation),
+            "utils.save_transcription": lambda: save_transcription(conversation, directory),
+            "transcript.from_result": lambda: Transcript.from_result(result),
+            "transcript.write_exports": lambda: transcript.write_exports(directory),
+        }
+        for name, fn in cases.items():
+            stats = measure(fn, args.repeat)
+            stats["words_per_second"] = round(size / stats["seconds"]) if stats["seconds"] else None
+            results[f"{name}[{size}]"] = stats
+    return results
+
+
+def bench_summarization(args, workdir):
+    """Map-reduce summarization of a whole call against a fake LLM with fixed latency."""
+    from src.summarization import SummarizationEngine
+    from src.transcript import Transcript
+
+    results = {}
+    for size in args.sizes:
+        transcript = Transcript.from_result(synthetic_result(size))
+        llm = FakeLLM(latency=args.llm_latency)
+
+        def run():
+            # A fresh engine per run so no event loop or semaphore state carries over
+            engine = SummarizationEngine(llm=llm)
+            engine.summarise_conversation(transcript.speaker_texts, transcript.lines())
+
+        llm.calls = 0
+        stats = measure(run, repeat=1, trace_memory=False)
+        stats["llm_calls"] = llm.calls
+        stats["words_per_second"] = round(size / stats["seconds"]) if stats["seconds"] else None
+        results[f"summarization.summarise_conversation[{size}]"] = stats
+    return results
+
+
+def bench_uploader(args, workdir):
+    """Draining the artifact spool into a fake S3 with per-request latency."""
+    from src.artifact_uploader import ArtifactUploader
+
+    results = {}
+    for folders in (1, 20):
+        source = os.path.join(workdir, "artifacts")
+        os.makedirs(source, exist_ok=True)
+        for name, size in (("transcription_with_speakers.txt", 64 * 1024),
+                           ("transcription_with_no_speakers.txt", 60 * 1024),
+                           ("diarized_result.json", 2 * 2 ** 20)):
+            with open(os.path.join(source, name), 'wb') as file:
+                file.write(os.urandom(size))
+        total_bytes = sum(os.path.getsize(os.path.join(source, name)) for name in os.listdir(source)) * folders
+
+        def run():
+            spool = tempfile.mkdtemp(dir=workdir)
+            s3_sync = FakeS3Sync(os.path.join(spool, "s3"), latency=args.s3_latency)
+            uploader = ArtifactUploader(s3_sync, "benchmark-bucket", spool_dir=os.path.join(spool, "spool"))
+            for i in range(folders):
+                uploader.enqueue_folder(source, prefix=f"transcription/{i}")
+            if not uploader.flush(timeout=300):
+                raise RuntimeError("Uploader did not drain the spool.")
+            shutil.rmtree(spool)
+
+        stats = measure(run, repeat=1, trace_memory=False)
+        stats["mb_per_second"] = round(total_bytes / 2 ** 20 / stats["seconds"], 2)
+        results[f"uploader.enqueue_and_flush[{folders}]"] = stats
+    return results
+
+
+def bench_pipeline(args, workdir):
+    """WhisperTranscriber stages on synthetic audio with a small CPU model."""
+    from src.dairization import WhisperTranscriber
+    from src.metrics import peak_rss_bytes
+
+    try:
+        import whisperx
+    except ImportError:
+        return {"pipeline": {"skipped": "whisperx is not installed"}}
+
+    audio_path = synthetic_audio(os.path.join(workdir, "synthetic.wav"), seconds=args.audio_seconds)
+    token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
+    transcriber = WhisperTranscriber(audio_path, token, device="cpu", compute_type=args.compute_type, audio_cache_dir="")
+
+    results = {}
+
+    def stage(name, fn, with_audio=True):
+        start_time = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start_time
+        # High-water mark of the process so far: a stage using less than an earlier one shows the earlier peak
+        stats = {"seconds": round(seconds, 4), "process_peak_rss_mb": round(peak_rss_bytes() / 2 ** 20, 1)}
+        if with_audio and seconds:
+            stats["real_time_factor"] = round(args.audio_seconds / seconds, 2)
+        results[f"pipeline.{name}[{args.model}]"] = stats
+
+    # The benchmark model replaces the production one, see WhisperTranscriber.load_model
+    def load_model():
+        transcriber.model = whisperx.load_model(args.model, "cpu", compute_type=args.compute_type, language="en")
+
+    stage("load_model", load_model, with_audio=False)
+    stage("decode", transcriber.load_audio)
+    stage("transcribe", transcriber.transcribe_audio)
+    if transcriber.result_trans["segments"]:
+        stage("align", transcriber.align_transcription)
+        if token:
+            stage("diarize", transcriber.diarize_audio)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=BENCHMARK_DIR).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return (name, metric, baseline, current) for every metric that regressed beyond `tolerance`."""
+    regressions = []
+    for name, stats in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for metric in ("seconds", "peak_memory_mb"):
+            old, new = reference.get(metric), stats.get(metric)
+            # Ignore differences too small to measure reliably
+            if old is None or new is None or max(old, new) < 0.001:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline pipeline benchmarks.")
+    parser.add_argument("--suite", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000, 1000000],
+                        help="Transcript sizes in words.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--audio-seconds", type=float, default=60)
+    parser.add_argument("--model", default="tiny", help="Whisper model used by the pipeline suite.")
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake LLM request.")
+    parser.add_argument("--s3-latency", type=float, default=0.02, help="Seconds per fake S3 request.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to the baseline file.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before failing.")
+    args = parser.parse_args(argv)
+
+    suites = {"utils": bench_utils, "summarization": bench_summarization,
+              "uploader": bench_uploader, "pipeline": bench_pipeline}
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="benchmarks_")
+    try:
+        for suite in args.suite:
+            print(f"Running {suite} benchmarks...", flush=True)
+            results.update(suites[suite](args, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"environment": environment(), "results": results}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    for name, stats in results.items():
+        print(f"{name:60} {json.dumps(stats)}")
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.isfile(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file).get("results", {})
+        baseline.update(results)
+        with open(args.baseline, 'w') as file:
+            json.dump({"environment": report["environment"], "results": baseline}, file, indent=2)
+        print(f"Baseline updated in {args.baseline}")
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print("No baseline to compare against, run with --save-baseline to create one.")
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare(results, baseline.get("results", {}), args.tolerance)
+    for name, metric, old, new in regressions:
+        print(f"REGRESSION {name} {metric}: {old} -> {new} ({new / old - 1:+.0%})")
+    if baseline.get("environment", {}).get("platform") != report["environment"]["platform"]:
+        print("Note: the baseline was recorded on a different platform.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,31 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-import json
+import functools
 import os
 from dotenv import load_dotenv
 from src.logger import logging
-from src.dairization import WhisperTranscriber
-from src.summarization import summarise_transcript
-from src.utils import extract_audio_duration, count_words, display_conversation, extract_speaker_texts, save_transcription
+from src.dairization import preload_models
+from src.compute_profile import get_compute_profile, calibrate
+from src.jobs import JobManager, JobQueueFull
+from src.job_queue import RemoteJobManager, build_broker, stage_audio
+from src.pipeline import run_transcription_pipeline
+from src.workspace import JobWorkspace
 from src.s3_syncer import S3Sync
-from datetime import datetime
-from src.constants import BUCKET_NAME
-import pandas as pd
-from typing import List, Dict
+from src.result_cache import build_result_cache
+from src.artifact_uploader import ArtifactUploader
+from src.transcript_store import TranscriptStore
+from src.metrics import metrics
+from src.audio import wav_seconds
+from src.asr_backends import build_backend_router
+from src.ingest import (ingest_upload, ingest_url, RequestFileReader, UploadTooLarge, UnsupportedAudioFormat, NormalizationFailed,
+                        FetchFailed, URLNotAllowed, MissingUpload)
+from src.constants import (BUCKET_NAME, PRELOAD_LANGUAGES, COMPUTE_CALIBRATION_AUDIO, MAX_UPLOAD_BYTES, JOB_BROKER_URL,
+                           JOB_QUEUE_AUDIO_URI)
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Dict, Optional
 
 load_dotenv()
 
@@ -23,12 +34,43 @@ groq_api_key = os.getenv("GROQ_API_KEY")
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION = os.getenv("AWS_REGION")
-DEVICE = os.getenv("DEVICE")
+DEVICE = os.getenv("DEVICE", "cpu")
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "true").lower() == "true"
 
-timestamp = datetime.now()
-timestamp = timestamp.strftime("%m_%d_%y_%H_%M_%S")
 s3_sync = S3Sync(AWS_ACCESS_KEY_ID,AWS_SECRET_ACCESS_KEY,AWS_REGION)
 
+# Services with state on disk or threads are created by the first startup hook, not at import, so importing
+# main stays fast and side-effect free. They are all built before the first request, so no locking is needed.
+@functools.cache
+def get_result_cache():
+    return build_result_cache(s3_sync)
+
+@functools.cache
+def get_artifact_uploader():
+    return ArtifactUploader(s3_sync, BUCKET_NAME)
+
+@functools.cache
+def get_transcript_store():
+    return TranscriptStore()
+
+@functools.cache
+def get_job_manager():
+    # Runs transcription jobs off the event loop and keeps their results; with a broker,
+    # standalone workers (`transcribe-worker`) run them instead and this process only enqueues
+    if JOB_BROKER_URL:
+        job_manager = RemoteJobManager(build_broker(JOB_BROKER_URL), transcript_store=get_transcript_store())
+    else:
+        job_manager = JobManager()
+    metrics.register_gauge("pipeline_jobs_active", "Jobs queued or running.", job_manager.active_count)
+    return job_manager
+
+@functools.cache
+def get_backend_router():
+    # Sends jobs to a remote speech-to-text service (ASR_REMOTE_BACKENDS) when the local queue backs up
+    job_manager = get_job_manager()
+    return build_backend_router(huggingface_token, DEVICE, get_result_cache(),
+                                queue_depth=job_manager.active_count if JOB_BROKER_URL else job_manager.local_backlog)
+
 
 app = FastAPI()
 
@@ -51,101 +93,245 @@ class TranscriptionResult(BaseModel):
     total_words: int
     words_by_speaker: Dict[str, int]
 
-# Global variable to store processing results
-processing_results = {}
+@app.on_event("startup")
+async def open_services():
+    for get_service in (get_transcript_store, get_result_cache, get_artifact_uploader, get_job_manager, get_backend_router):
+        await run_in_threadpool(get_service)
+
+@app.on_event("startup")
+async def warm_up_models():
+    if JOB_BROKER_URL:
+        # Models live in the standalone workers; their transcripts are indexed here for search
+        get_job_manager().start()
+        return
+    # Load models once per worker so requests don't pay for model construction
+    if COMPUTE_CALIBRATION_AUDIO and not get_compute_profile(DEVICE).calibrated:
+        # First start on this node type: pick the batch size before serving requests
+        await run_in_threadpool(calibrate, COMPUTE_CALIBRATION_AUDIO, DEVICE)
+    if PRELOAD_MODELS:
+        await run_in_threadpool(preload_models, huggingface_token, DEVICE, None, PRELOAD_LANGUAGES)
 
 @app.get("/")
 async def read_root():
     return FileResponse('static/index.html')
 
-async def process_audio(file_path: str):
-    transcriber = WhisperTranscriber(file_path, huggingface_token, device= DEVICE)
-
-    yield "data: Loading model...\n"
-    transcriber.load_model()
-    yield "data: Model loaded successfully\n"
-
-    yield "data: Transcribing audio...\n"
-    transcriber.transcribe_audio()
-    yield "data: Transcription completed\n"
-
-    yield "data: Aligning transcription...\n"
-    transcriber.align_transcription()
-    yield "data: Alignment completed\n"
-
-    yield "data: Diarizing audio...\n"
-    final_result, uniq_speakers = transcriber.diarize_audio()
-    yield "data: Diarization completed\n"
-
-    transcriber.save_to_json(final_result)
-    conversation = display_conversation(filename='data.json', uniq_speakers=uniq_speakers)
-    speaker_texts = extract_speaker_texts(conversation)
-
-    directory_path = save_transcription(conversation=conversation)
-    aws_bucket_url = f"s3://{BUCKET_NAME}/transcription/{timestamp}"
-    s3_sync.sync_folder_to_s3(folder = directory_path,aws_bucket_name=BUCKET_NAME)
-    logging.info("Succesfully transcriptions are saved to s3 bucket")
-
-
-    yield "data: Generating summaries...\n"
-    individual_summary = {}
-    for speaker, speeches in speaker_texts.items():
-        individual_summary[speaker] = summarise_transcript(groq_api_key=groq_api_key,  transcript=speeches)
-    
-    summary_content = summarise_transcript(groq_api_key=groq_api_key,transcript=conversation)
-    
-    summary_data = {
-        "Speaker": list(individual_summary.keys()) + ["Total Summary"],
-        "Summary": list(individual_summary.values()) + [summary_content]
-    }
+@app.on_event("startup")
+async def start_artifact_uploader():
+    get_artifact_uploader().start()
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    get_job_manager().shutdown(wait=False)
+    get_backend_router().close()
+    # Drain queued artifact uploads; anything left stays spooled for the next start
+    get_artifact_uploader().stop(flush=True)
+
+def queue_full():
+    """True when a new job could neither queue locally nor overflow to a remote speech-to-text service."""
+    job_manager = get_job_manager()
+    if JOB_BROKER_URL or not get_backend_router().remotes:
+        return job_manager.is_full()
+    return job_manager.is_full() and job_manager.is_full(io_bound=True)
+
+def busy_response():
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "30"},
+        content={"error": "Server is busy, try again later."}
+    )
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Reject oversized uploads from the headers, before the body is received
+    content_length = request.headers.get("content-length")
+    if request.method == "POST" and content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        return JSONResponse(status_code=413, content={"error": f"The upload exceeds the limit of {MAX_UPLOAD_BYTES // 2 ** 20} MB."})
+    return await call_next(request)
+
+def invalid_speaker_counts(min_speakers, max_speakers):
+    return (min_speakers is not None and min_speakers < 1) or (max_speakers is not None and max_speakers < 1) \
+        or (min_speakers and max_speakers and min_speakers > max_speakers)
+
+def speaker_counts_response():
+    return JSONResponse(status_code=422, content={"error": "Speaker counts must be positive with min_speakers <= max_speakers."})
 
-    audio_duration = extract_audio_duration(file_path)
-    total_words, words_by_speaker = count_words(conversation)
-    
+async def ingest_into(workspace, ingest, source):
+    """Run `ingest` into the workspace, returning an error response (and removing the workspace) on failure."""
+    try:
+        await ingest
+    except UploadTooLarge as e:
+        workspace.cleanup()
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    except UnsupportedAudioFormat as e:
+        workspace.cleanup()
+        return JSONResponse(status_code=415, content={"error": str(e)})
+    except NormalizationFailed as e:
+        workspace.cleanup()
+        logging.warning(f"Could not decode {source}: {e}")
+        return JSONResponse(status_code=415, content={"error": "The audio file could not be decoded."})
+    except FetchFailed as e:
+        workspace.cleanup()
+        logging.warning(str(e))
+        return JSONResponse(status_code=422, content={"error": "The audio could not be downloaded from the URL."})
+    except URLNotAllowed as e:
+        workspace.cleanup()
+        logging.warning(f"Refused to fetch {source}: {e}")
+        return JSONResponse(status_code=422, content={"error": str(e)})
+    except MissingUpload as e:
+        workspace.cleanup()
+        return JSONResponse(status_code=422, content={"error": str(e)})
+    return None
 
-    processing_results['conversation'] = conversation
-    processing_results['summary_data'] = summary_data
-    processing_results['audio_duration'] = audio_duration
-    processing_results['total_words'] = total_words
-    processing_results['words_by_speaker'] = words_by_speaker
+async def submit_job(workspace, filename, stream, min_speakers, max_speakers):
+    if JOB_BROKER_URL:
+        # Hand the normalized audio to whichever worker leases the job
+        audio_uri = await run_in_threadpool(stage_audio, workspace.audio_path, workspace.job_id, JOB_QUEUE_AUDIO_URI, s3_sync)
+        workspace.cleanup()
+        job = get_job_manager().enqueue({"audio_uri": audio_uri, "filename": filename, "stream": stream,
+                                   "min_speakers": min_speakers, "max_speakers": max_speakers}, job_id=workspace.job_id)
+        return {"job_id": job.id, "status": job.status, "events_url": f"/jobs/{job.id}/events"}
 
-    yield "data: Processing complete\n"
+    # Route before queueing: remote jobs wait on HTTP in their own pool instead of holding a CPU worker slot,
+    # and fall back to the CPU workers only when the remote service fails
+    job_manager, backend_router = get_job_manager(), get_backend_router()
+    backend = backend_router.select(wav_seconds(workspace.audio_path), stream=stream)
+    try:
+        job = job_manager.submit(run_transcription_pipeline, workspace, job_id=workspace.job_id, hugging_face_token=huggingface_token,
+                                 groq_api_key=groq_api_key, artifact_uploader=get_artifact_uploader(), device=DEVICE, stream=stream,
+                                 result_cache=get_result_cache(), transcript_store=get_transcript_store(), filename=filename,
+                                 min_speakers=min_speakers, max_speakers=max_speakers, router=backend_router, backend=backend,
+                                 run_local=None if backend.local else job_manager.run_on_workers, io_bound=not backend.local)
+    except JobQueueFull:
+        workspace.cleanup()
+        return busy_response()
+    return {"job_id": job.id, "status": job.status, "events_url": f"/jobs/{job.id}/events"}
 
-@app.post("/transcribe/")
-async def transcribe_audio(file: UploadFile = File(...)):
-    file_path = "uploaded_audio.wav"
-    
-    # Save uploaded audio file
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+# The body is parsed by hand, so the form is declared for the API docs only
+UPLOAD_REQUEST_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}}}}}}}
 
+@app.post("/transcribe/", openapi_extra=UPLOAD_REQUEST_BODY)
+async def transcribe_audio(request: Request, stream: bool = False,
+                           min_speakers: Optional[int] = None, max_speakers: Optional[int] = None):
+    if invalid_speaker_counts(min_speakers, max_speakers):
+        return speaker_counts_response()
+    # Reject early, before the upload is read, when no queue slot is free
+    if queue_full():
+        return busy_response()
+
+    # Every job gets its own directory, so concurrent uploads never share files
+    workspace = JobWorkspace()
+
+    # Parse the body as it arrives and stream the file through ffmpeg into 16 kHz mono PCM. UploadFile would
+    # spool the whole body first, so unsupported formats and oversized uploads could not be refused early
+    upload = RequestFileReader(request.stream(), request.headers.get("content-type"))
+    error = await ingest_into(workspace, ingest_upload(upload, workspace.audio_path), "the upload")
+    if error is not None:
+        return error
+    return await submit_job(workspace, upload.filename, stream, min_speakers, max_speakers)
+
+@app.post("/transcribe/url")
+async def transcribe_url(url: str, stream: bool = False, min_speakers: Optional[int] = None, max_speakers: Optional[int] = None):
+    if not url.startswith(("http://", "https://")):
+        return JSONResponse(status_code=422, content={"error": "Only http and https URLs are supported."})
+    if invalid_speaker_counts(min_speakers, max_speakers):
+        return speaker_counts_response()
+    if queue_full():
+        return busy_response()
+
+    workspace = JobWorkspace()
+    # YouTube links stream their audio-only track, other URLs are fetched directly; both are decoded as they download
+    error = await ingest_into(workspace, ingest_url(url, workspace.audio_path), url)
+    if error is not None:
+        return error
+    return await submit_job(workspace, url, stream, min_speakers, max_speakers)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found."})
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    job_manager = get_job_manager()
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found."})
     # Stream status updates as the processing progresses
-    return StreamingResponse(process_audio(file_path), media_type="text/event-stream")
+    return StreamingResponse(job_manager.stream_events(job), media_type="text/event-stream")
+
+def get_job_result(job_id: Optional[str]):
+    """Return the result of `job_id`, or of the most recently completed job when no id is given."""
+    job_manager = get_job_manager()
+    job = job_manager.get(job_id) if job_id else job_manager.latest_completed()
+    if job is None or job.status != "completed":
+        return None
+    return job.result
 
 @app.get("/summary/")
-async def get_summary():
-    if 'summary_data' not in processing_results:
+async def get_summary(job_id: Optional[str] = None):
+    result = get_job_result(job_id)
+    if result is None:
         return {"error": "Summary not available. Process an audio file first."}
-    return processing_results['summary_data']
+    return result['summary_data']
 
 @app.get("/stats/")
-async def get_stats():
-    if 'audio_duration' not in processing_results:
+async def get_stats(job_id: Optional[str] = None):
+    result = get_job_result(job_id)
+    if result is None:
         return JSONResponse(
             status_code=400,
             content={"error": "Stats not available. Process an audio file first."}
         )
     return {
-        "audio_duration": processing_results['audio_duration'],
-        "total_words": processing_results['total_words'],
-        "words_by_speaker": processing_results['words_by_speaker']
+        "audio_duration": result['audio_duration'],
+        "total_words": result['total_words'],
+        "words_by_speaker": result['words_by_speaker']
     }
 
 @app.get("/transcription/")
-async def get_transcription():
-    if 'conversation' not in processing_results:
+async def get_transcription(job_id: Optional[str] = None):
+    result = get_job_result(job_id)
+    if result is None:
         return {"error": "Transcription not available. Process an audio file first."}
-    return {"conversation": processing_results['conversation']}
+    return {"conversation": result['conversation']}
+
+def get_word_index(job_id: str):
+    result = get_job_result(job_id)
+    return None if result is None else result['word_index']
+
+@app.get("/jobs/{job_id}/words")
+async def get_words(job_id: str, start: float = 0.0, end: Optional[float] = None):
+    word_index = get_word_index(job_id)
+    if word_index is None:
+        return JSONResponse(status_code=404, content={"error": "Words not available for this job."})
+    return {"words": word_index.words_between(start, float("inf") if end is None else end)}
+
+@app.get("/jobs/{job_id}/turns")
+async def get_turns(job_id: str, speaker: Optional[str] = None):
+    word_index = get_word_index(job_id)
+    if word_index is None:
+        return JSONResponse(status_code=404, content={"error": "Turns not available for this job."})
+    return {"turns": word_index.turns(speaker)}
+
+@app.get("/jobs/{job_id}/talk-time")
+async def get_talk_time(job_id: str, start: Optional[float] = None, end: Optional[float] = None):
+    word_index = get_word_index(job_id)
+    if word_index is None:
+        return JSONResponse(status_code=404, content={"error": "Talk time not available for this job."})
+    return {"talk_time": word_index.talk_time(start, end)}
+
+@app.get("/search/")
+async def search_transcripts(q: str, limit: int = 20, offset: int = 0, speaker: Optional[str] = None):
+    # Ranked full-text search over every stored transcript
+    return await run_in_threadpool(get_transcript_store().search, q, limit, max(0, offset), speaker)
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
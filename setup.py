@@ -26,5 +26,11 @@ setup(name=PROJECT_NAME,
       author=AUTHOR,
       author_email=AUTHOR_EMAIL,
       packages=find_packages(),
-      install_requires = get_requirements_list()
+      install_requires = get_requirements_list(),
+      entry_points={
+          "console_scripts": [
+              "transcribe-worker=src.worker:main",
+              "transcribe-batch=src.batch:main",
+          ]
+      }
      )
\ No newline at end of file
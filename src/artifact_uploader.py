@@ -0,0 +1,170 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from src.logger import logging
+from src.metrics import track_stage
+from src.constants import (ARTIFACT_SPOOL_DIR, ARTIFACT_UPLOAD_BATCH_SIZE, ARTIFACT_UPLOAD_MAX_RETRIES,
+                           ARTIFACT_UPLOAD_BACKOFF_SECONDS, ARTIFACT_FLUSH_TIMEOUT_SECONDS)
+
+
+class ArtifactUploader:
+    """
+    Uploads pipeline artifacts to S3 from a background thread.
+
+    Enqueued files are copied into a spool directory together with a JSON manifest, so
+    pending uploads survive restarts and the caller may delete or overwrite its copies
+    right away. Entries are uploaded in batches and retried with exponential backoff;
+    entries that exhaust their retries are moved to `failed/` instead of being dropped.
+
+    Spool layout: `queue/<entry>.json` manifests, `data/<entry>/` file copies, `failed/`.
+    """
+    def __init__(self, s3_sync, bucket_name, spool_dir=ARTIFACT_SPOOL_DIR, batch_size=ARTIFACT_UPLOAD_BATCH_SIZE,
+                 max_retries=ARTIFACT_UPLOAD_MAX_RETRIES, backoff_seconds=ARTIFACT_UPLOAD_BACKOFF_SECONDS):
+        self.s3_sync = s3_sync
+        self.bucket_name = bucket_name
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.queue_dir = os.path.join(spool_dir, "queue")
+        self.data_dir = os.path.join(spool_dir, "data")
+        self.failed_dir = os.path.join(spool_dir, "failed")
+        for directory in (self.queue_dir, self.data_dir, self.failed_dir):
+            os.makedirs(directory, exist_ok=True)
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._process_lock = threading.Lock()
+
+    def start(self):
+        """Start the upload thread; entries left over from a previous run are picked up first."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="artifact-uploader", daemon=True)
+            self._thread.start()
+            self._wakeup.set()
+
+    def enqueue_folder(self, folder, prefix=''):
+        """Queue every file under `folder` for upload under the key `prefix`."""
+        entry_id = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+        entry_data = os.path.join(self.data_dir, entry_id)
+        shutil.copytree(folder, entry_data)
+
+        files = []
+        for root, _, names in os.walk(entry_data):
+            for name in names:
+                relative_path = os.path.relpath(os.path.join(root, name), entry_data).replace(os.sep, '/')
+                files.append(relative_path)
+
+        self._write_manifest(entry_id, {"prefix": prefix, "files": files, "attempts": 0, "next_attempt_at": 0})
+        logging.info(f"Queued {len(files)} artifacts from {folder} for upload.")
+        self._wakeup.set()
+        return entry_id
+
+    def pending(self):
+        return sorted(name[:-5] for name in os.listdir(self.queue_dir) if name.endswith(".json"))
+
+    def _write_manifest(self, entry_id, manifest):
+        path = os.path.join(self.queue_dir, f"{entry_id}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, path)
+
+    def _read_manifest(self, entry_id):
+        with open(os.path.join(self.queue_dir, f"{entry_id}.json")) as file:
+            return json.load(file)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                handled = self.process_batch()
+            except Exception as e:
+                logging.exception(f"Artifact uploader failed: {e}")
+                handled = 0
+            # Keep draining while full batches are due, otherwise sleep until new work arrives
+            if handled < self.batch_size:
+                self._wakeup.wait(timeout=self.backoff_seconds)
+                self._wakeup.clear()
+
+    def process_batch(self):
+        """Upload the next batch of entries that are due; returns the number of entries handled."""
+        now = time.time()
+        due = [entry_id for entry_id in self.pending() if self._read_manifest(entry_id)["next_attempt_at"] <= now]
+        return self._process_entries(due[:self.batch_size])
+
+    def _process_entries(self, entry_ids):
+        with self._process_lock:
+            batch = []
+            for entry_id in entry_ids:
+                try:
+                    batch.append((entry_id, self._read_manifest(entry_id)))
+                except FileNotFoundError:
+                    pass  # Already handled by a concurrent flush
+            if not batch:
+                return 0
+
+            with ThreadPoolExecutor(max_workers=self.s3_sync.max_workers) as executor:
+                outcomes = list(executor.map(lambda item: self._upload_entry(*item), batch))
+            for (entry_id, manifest), error in zip(batch, outcomes):
+                if error is None:
+                    self._remove_entry(entry_id)
+                else:
+                    self._retry_later(entry_id, manifest, error)
+            return len(batch)
+
+    def _upload_entry(self, entry_id, manifest):
+        """Upload every file of an entry, returning the error or None on success."""
+        prefix = manifest["prefix"].rstrip('/')
+        try:
+            with track_stage("s3_upload"):
+                for relative_path in manifest["files"]:
+                    key = f"{prefix}/{relative_path}" if prefix else relative_path
+                    self.s3_sync.upload_file(os.path.join(self.data_dir, entry_id, relative_path), self.bucket_name, key)
+        except Exception as e:
+            return e
+        return None
+
+    def _remove_entry(self, entry_id):
+        os.remove(os.path.join(self.queue_dir, f"{entry_id}.json"))
+        shutil.rmtree(os.path.join(self.data_dir, entry_id), ignore_errors=True)
+
+    def _retry_later(self, entry_id, manifest, error):
+        manifest["attempts"] += 1
+        manifest["last_error"] = str(error)
+        if manifest["attempts"] > self.max_retries:
+            logging.error(f"Giving up on artifact upload {entry_id} after {manifest['attempts']} attempts: {error}")
+            os.replace(os.path.join(self.queue_dir, f"{entry_id}.json"), os.path.join(self.failed_dir, f"{entry_id}.json"))
+            return
+        manifest["next_attempt_at"] = time.time() + self.backoff_seconds * (2 ** (manifest["attempts"] - 1))
+        logging.warning(f"Artifact upload {entry_id} failed (attempt {manifest['attempts']}), retrying later: {error}")
+        self._write_manifest(entry_id, manifest)
+
+    def flush(self, timeout=ARTIFACT_FLUSH_TIMEOUT_SECONDS):
+        """
+        Attempt every queued entry once, ignoring backoff, within `timeout` seconds.
+
+        Entries that still fail stay queued for the next start. Returns True when drained.
+        """
+        deadline = time.time() + timeout
+        attempted = set()
+        while time.time() < deadline:
+            remaining = [entry_id for entry_id in self.pending() if entry_id not in attempted]
+            if not remaining:
+                break
+            attempted.update(remaining[:self.batch_size])
+            self._process_entries(remaining[:self.batch_size])
+        return not self.pending()
+
+    def stop(self, flush=True, timeout=ARTIFACT_FLUSH_TIMEOUT_SECONDS):
+        """Stop the upload thread, draining the queue first when `flush` is set."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        if flush and not self.flush(timeout):
+            logging.warning(f"{len(self.pending())} artifact uploads are still queued in {self.spool_dir}.")
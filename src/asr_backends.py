@@ -0,0 +1,376 @@
+"""
+Speech-to-text backends and the router choosing between them.
+
+Each backend implements `TranscriptionBackend`:
+
+- `transcribe(audio_path, min_speakers=None, max_speakers=None)` blocks until the recording
+  is transcribed. It returns `(result, speakers)`: `result` is a whisperx-style diarized
+  result (segments with speaker-tagged words) and `speakers` lists the speaker labels.
+- `atranscribe(...)` is the awaitable version.
+- `close()` releases pooled connections.
+
+`LocalBackend` runs `WhisperTranscriber` on this host; the pipeline uses it for every job
+that is not routed elsewhere. `DeepgramBackend` and
+`AssemblyAIBackend` call the hosted APIs with one pooled httpx client each, kept on the
+backend's own event loop. `BackendRouter` keeps jobs local and sends them to the
+cheapest healthy remote backend when the local queue backs up or a recording is long.
+"""
+import asyncio
+import mimetypes
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from src.logger import logging
+from src.metrics import track_stage
+from src.constants import (DEEPGRAM_API_URL, DEEPGRAM_MODEL, ASSEMBLYAI_API_URL, ASSEMBLYAI_POLL_SECONDS,
+                           ASR_HTTP_MAX_CONNECTIONS, ASR_HTTP_TIMEOUT_SECONDS, ASR_REMOTE_BACKENDS, ASR_COST_PER_MINUTE,
+                           ASR_ROUTER_MAX_LOCAL_BACKLOG, ASR_ROUTER_REMOTE_MIN_SECONDS, UPLOAD_CHUNK_BYTES)
+
+
+class RemoteTranscriptionFailed(Exception):
+    """Raised when a hosted speech-to-text service rejects or fails a recording."""
+
+
+def speaker_label(index):
+    """Diarization label in the whisperx format."""
+    return f"SPEAKER_{index:02d}"
+
+
+def build_result(utterances, duration=None, language=None):
+    """
+    Whisperx-style diarized result from remote utterances.
+
+    :param utterances: Iterable of (start, end, speaker, text, [(word, start, end, score), ...])
+    :return: (result, speakers in order of appearance)
+    """
+    segments, speakers = [], []
+    for start, end, speaker, text, words in utterances:
+        if speaker not in speakers:
+            speakers.append(speaker)
+        segment_words = []
+        for word, word_start, word_end, score in words:
+            segment_words.append({"word": word, "start": word_start, "end": word_end, "speaker": speaker})
+            if score is not None:
+                segment_words[-1]["score"] = score
+        segments.append({"start": start, "end": end, "text": text, "speaker": speaker, "words": segment_words})
+    return {"segments": segments, "language": language, "duration": duration}, speakers
+
+
+async def _file_chunks(path, chunk_size=UPLOAD_CHUNK_BYTES):
+    """Stream a file as an async request body without reading it into memory."""
+    with open(path, "rb") as file:
+        while True:
+            chunk = await asyncio.to_thread(file.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class TranscriptionBackend(ABC):
+    """Base of the speech-to-text backends; see the module docstring for the contract."""
+    name = None
+    local = False
+
+    @abstractmethod
+    def transcribe(self, audio_path, min_speakers=None, max_speakers=None):
+        """Transcribe and diarize the recording, returning (result, speakers)."""
+
+    async def atranscribe(self, audio_path, min_speakers=None, max_speakers=None):
+        return await asyncio.to_thread(self.transcribe, audio_path, min_speakers, max_speakers)
+
+    def close(self):
+        pass
+
+
+class LocalBackend(TranscriptionBackend):
+    """Whisper, alignment and pyannote diarization on this host."""
+    name = "local"
+    local = True
+
+    def __init__(self, hugging_face_token, device="cpu", result_cache=None):
+        self.hugging_face_token = hugging_face_token
+        self.device = device
+        self.result_cache = result_cache
+
+    def transcribe(self, audio_path, min_speakers=None, max_speakers=None):
+        from src.dairization import WhisperTranscriber
+
+        transcriber = WhisperTranscriber(audio_path, self.hugging_face_token, device=self.device,
+                                         result_cache=self.result_cache, min_speakers=min_speakers, max_speakers=max_speakers)
+        return self.run(transcriber)
+
+    @staticmethod
+    def run(transcriber, progress=None, stream=False, on_segment=None):
+        """
+        Load the model, then transcribe, align and diarize with a prepared `WhisperTranscriber`.
+
+        :param progress: Optional callable receiving a status message whenever a stage starts or finishes
+        :param stream: Transcribe window by window, passing every finished segment to `on_segment`
+        :return: (result, speakers)
+        """
+        progress = progress or (lambda message, event=None: None)
+        progress("Loading model...")
+        with track_stage("load_model", progress):
+            transcriber.load_model()
+        progress("Model loaded successfully")
+
+        if stream:
+            progress("Transcribing audio...")
+            with track_stage("transcribe_stream", progress, transcriber.audio_seconds):
+                for segment in transcriber.transcribe_stream():
+                    if on_segment is not None:
+                        on_segment(segment)
+            final_result, uniq_speakers = transcriber.stream_result
+            progress("Transcription completed")
+            return final_result, uniq_speakers
+
+        progress("Transcribing audio...")
+        with track_stage("transcribe", progress, transcriber.audio_seconds):
+            transcriber.transcribe_audio()
+        progress("Transcription completed")
+
+        progress("Aligning transcription...")
+        with track_stage("align", progress, transcriber.audio_seconds):
+            transcriber.align_transcription()
+        progress("Alignment completed")
+
+        progress("Diarizing audio...")
+        with track_stage("diarize", progress, transcriber.audio_seconds):
+            final_result, uniq_speakers = transcriber.diarize_audio()
+        progress("Diarization completed")
+        return final_result, uniq_speakers
+
+
+class RemoteBackend(TranscriptionBackend):
+    """
+    Hosted backend with a pooled httpx client.
+
+    The client and every request live on one event loop thread owned by the backend, so
+    blocking callers from any thread share the same connection pool.
+    """
+    def __init__(self, api_key, base_url, max_connections=ASR_HTTP_MAX_CONNECTIONS, timeout=ASR_HTTP_TIMEOUT_SECONDS,
+                 transport=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.transport = transport  # Optional httpx transport, e.g. httpx.MockTransport in tests
+        self._client = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, transport=self.transport,
+                                             limits=httpx.Limits(max_connections=self.max_connections,
+                                                                 max_keepalive_connections=self.max_connections))
+        return self._client
+
+    def _submit(self, coroutine):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name=f"{self.name}-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def transcribe(self, audio_path, min_speakers=None, max_speakers=None):
+        return self._submit(self._transcribe_checked(audio_path, min_speakers, max_speakers)).result()
+
+    async def atranscribe(self, audio_path, min_speakers=None, max_speakers=None):
+        return await asyncio.wrap_future(self._submit(self._transcribe_checked(audio_path, min_speakers, max_speakers)))
+
+    async def _transcribe_checked(self, audio_path, min_speakers, max_speakers):
+        import httpx
+
+        try:
+            return await self._transcribe(audio_path, min_speakers, max_speakers)
+        except httpx.HTTPError as e:
+            raise RemoteTranscriptionFailed(f"{self.name} request failed: {e}") from e
+
+    @abstractmethod
+    async def _transcribe(self, audio_path, min_speakers, max_speakers):
+        """Run the service's requests on the backend loop, returning (result, speakers)."""
+
+    def _upload_headers(self, audio_path, headers):
+        # An explicit length lets the file be streamed without chunked transfer encoding
+        return {**headers, "Content-Length": str(os.path.getsize(audio_path))}
+
+    def close(self):
+        if self._loop is not None:
+            if self._client is not None:
+                self._submit(self._client.aclose()).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop, self._client = None, None
+
+
+class DeepgramBackend(RemoteBackend):
+    """Deepgram pre-recorded audio API; it picks the number of speakers by itself."""
+    name = "deepgram"
+
+    def __init__(self, api_key, base_url=DEEPGRAM_API_URL, model=DEEPGRAM_MODEL, **kwargs):
+        super().__init__(api_key, base_url, **kwargs)
+        self.model = model
+
+    async def _transcribe(self, audio_path, min_speakers, max_speakers):
+        params = {"model": self.model, "diarize": "true", "punctuate": "true", "smart_format": "true",
+                  "utterances": "true", "detect_language": "true"}
+        content_type = mimetypes.guess_type(audio_path)[0] or "audio/wav"
+        headers = self._upload_headers(audio_path, {"Authorization": f"Token {self.api_key}", "Content-Type": content_type})
+        response = await self.client.post("/v1/listen", params=params, headers=headers, content=_file_chunks(audio_path))
+        response.raise_for_status()
+        data = response.json()
+
+        results = data.get("results", {})
+        utterances = [
+            (utterance["start"], utterance["end"], speaker_label(utterance.get("speaker", 0)), utterance["transcript"],
+             [(word.get("punctuated_word", word["word"]), word["start"], word["end"], word.get("confidence"))
+              for word in utterance.get("words", [])])
+            for utterance in results.get("utterances", [])
+        ]
+        channels = results.get("channels") or [{}]
+        return build_result(utterances, data.get("metadata", {}).get("duration"), channels[0].get("detected_language"))
+
+
+class AssemblyAIBackend(RemoteBackend):
+    """AssemblyAI: upload, create a transcript with speaker labels, then poll until it is done."""
+    name = "assemblyai"
+
+    def __init__(self, api_key, base_url=ASSEMBLYAI_API_URL, poll_seconds=ASSEMBLYAI_POLL_SECONDS, **kwargs):
+        super().__init__(api_key, base_url, **kwargs)
+        self.poll_seconds = poll_seconds
+
+    async def _transcribe(self, audio_path, min_speakers, max_speakers):
+        headers = {"authorization": self.api_key}
+        response = await self.client.post("/v2/upload", headers=self._upload_headers(audio_path, headers),
+                                          content=_file_chunks(audio_path))
+        response.raise_for_status()
+
+        request = {"audio_url": response.json()["upload_url"], "speaker_labels": True, "language_detection": True}
+        if min_speakers or max_speakers:
+            request["speaker_options"] = {key: value for key, value in (("min_speakers_expected", min_speakers),
+                                                                        ("max_speakers_expected", max_speakers)) if value}
+        response = await self.client.post("/v2/transcript", headers=headers, json=request)
+        response.raise_for_status()
+        transcript_id = response.json()["id"]
+
+        while True:
+            response = await self.client.get(f"/v2/transcript/{transcript_id}", headers=headers)
+            response.raise_for_status()
+            data = response.json()
+            if data["status"] == "completed":
+                break
+            if data["status"] == "error":
+                raise RemoteTranscriptionFailed(f"assemblyai failed transcript {transcript_id}: {data.get('error')}")
+            await asyncio.sleep(self.poll_seconds)
+
+        labels = {}
+
+        def label(speaker):
+            # Speakers are lettered "A", "B", ... in order of appearance
+            return labels.setdefault(speaker, speaker_label(len(labels)))
+
+        utterances = [
+            (utterance["start"] / 1000, utterance["end"] / 1000, label(utterance["speaker"]), utterance["text"],
+             [(word["text"], word["start"] / 1000, word["end"] / 1000, word.get("confidence"))
+              for word in utterance.get("words", [])])
+            for utterance in data.get("utterances") or []
+        ]
+        return build_result(utterances, data.get("audio_duration"), data.get("language_code"))
+
+
+REMOTE_BACKENDS = {
+    "deepgram": (DeepgramBackend, "DG_KEY"),
+    "assemblyai": (AssemblyAIBackend, "ASSEMBLYAI_API_KEY"),
+}
+
+_remote_backends = {}
+_remote_backends_lock = threading.Lock()
+
+
+def get_remote_backend(name, api_key=None):
+    """Process-wide backend `name`, keyed by API key so its connection pool is shared."""
+    backend_class, key_variable = REMOTE_BACKENDS[name]
+    api_key = api_key or os.getenv(key_variable)
+    if not api_key:
+        raise ValueError(f"Set {key_variable} to use the {name} backend.")
+    with _remote_backends_lock:
+        if (name, api_key) not in _remote_backends:
+            _remote_backends[(name, api_key)] = backend_class(api_key)
+        return _remote_backends[(name, api_key)]
+
+
+class BackendRouter:
+    """
+    Chooses the backend of each job.
+
+    Jobs stay local unless more than `max_local_backlog` jobs are queued or running locally
+    (`queue_depth()`) or the recording is longer than `remote_min_seconds`. Overflowing
+    jobs go to the remote backend with the lowest cost per minute, ties broken by the
+    observed real-time factor. A remote backend that fails is skipped for
+    `failure_cooldown` seconds. Streaming jobs always stay local.
+    """
+    def __init__(self, local, remotes=(), queue_depth=None, max_local_backlog=ASR_ROUTER_MAX_LOCAL_BACKLOG,
+                 remote_min_seconds=ASR_ROUTER_REMOTE_MIN_SECONDS, costs=ASR_COST_PER_MINUTE, failure_cooldown=300):
+        self.local = local
+        self.remotes = list(remotes)
+        self.queue_depth = queue_depth
+        self.max_local_backlog = max_local_backlog
+        self.remote_min_seconds = remote_min_seconds
+        self.costs = costs
+        self.failure_cooldown = failure_cooldown
+        self._real_time_factors = {}  # backend name -> moving average of seconds per audio second
+        self._unavailable_until = {}
+        self._lock = threading.Lock()
+
+    def select(self, audio_seconds=None, stream=False):
+        if stream or not self.remotes:
+            return self.local
+        backlog = self.queue_depth() if self.queue_depth is not None else 0
+        long_audio = bool(self.remote_min_seconds) and audio_seconds is not None and audio_seconds > self.remote_min_seconds
+        if backlog <= self.max_local_backlog and not long_audio:
+            return self.local
+
+        now = time.time()
+        with self._lock:
+            available = [backend for backend in self.remotes if self._unavailable_until.get(backend.name, 0) <= now]
+            if not available:
+                return self.local
+            backend = min(available, key=lambda backend: (self.costs.get(backend.name, float("inf")),
+                                                           self._real_time_factors.get(backend.name, 0.0)))
+        logging.info(f"Routing {audio_seconds or 0:.0f} seconds of audio to {backend.name} "
+                     f"(local backlog {backlog}, long audio {long_audio}).")
+        return backend
+
+    def transcribe(self, backend, audio_path, audio_seconds=None, min_speakers=None, max_speakers=None):
+        """Run `backend.transcribe`, tracking its speed and taking it out of rotation when it fails."""
+        start_time = time.perf_counter()
+        try:
+            result = backend.transcribe(audio_path, min_speakers, max_speakers)
+        except Exception:
+            with self._lock:
+                self._unavailable_until[backend.name] = time.time() + self.failure_cooldown
+            raise
+        if audio_seconds:
+            real_time_factor = (time.perf_counter() - start_time) / audio_seconds
+            with self._lock:
+                previous = self._real_time_factors.get(backend.name)
+                self._real_time_factors[backend.name] = real_time_factor if previous is None else 0.8 * previous + 0.2 * real_time_factor
+        return result
+
+    def close(self):
+        for backend in self.remotes:
+            backend.close()
+
+
+def build_backend_router(hugging_face_token, device="cpu", result_cache=None, queue_depth=None, remote_names=ASR_REMOTE_BACKENDS):
+    """Router over the local backend and every configured remote backend that has an API key."""
+    remotes = []
+    for name in remote_names:
+        try:
+            remotes.append(get_remote_backend(name))
+        except (KeyError, ValueError) as e:
+            logging.warning(f"Remote ASR backend {name} is not available: {e}")
+    return BackendRouter(LocalBackend(hugging_face_token, device, result_cache), remotes, queue_depth)
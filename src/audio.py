@@ -0,0 +1,87 @@
+import hashlib
+import os
+import tempfile
+from src.logger import logging
+from src.constants import AUDIO_CACHE_DIR, SAMPLE_RATE
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_normalized_wav(file_path):
+    """
+    Read a 16-bit mono WAV at the pipeline sample rate without spawning ffmpeg.
+
+    Uploads are normalized to this format on ingestion. Returns None for any other file.
+    """
+    import numpy as np
+    import wave
+
+    try:
+        with wave.open(file_path, 'rb') as audio_file:
+            if (audio_file.getnchannels(), audio_file.getsampwidth(), audio_file.getframerate()) != (1, 2, SAMPLE_RATE):
+                return None
+            frames = audio_file.readframes(audio_file.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    return np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768.0
+
+
+def wav_seconds(file_path):
+    """Duration of a WAV file from its header, None when it is not a readable WAV."""
+    import wave
+
+    try:
+        with wave.open(file_path, 'rb') as audio_file:
+            return audio_file.getnframes() / audio_file.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def _load_waveform(file_path):
+    audio = read_normalized_wav(file_path)
+    if audio is None:
+        import whisperx
+        audio = whisperx.load_audio(file_path)
+    return audio
+
+
+def decode_audio(file_path, cache_dir=AUDIO_CACHE_DIR, content_hash=None):
+    """
+    Decode an audio file into a mono 16 kHz float32 waveform.
+
+    When `cache_dir` is set the waveform is stored there as `<sha256>.npy` and
+    returned memory-mapped, so repeated decodes of the same content are free.
+    Pass `content_hash` when the file's SHA-256 is already known.
+    """
+    import numpy as np
+
+    if not cache_dir:
+        return _load_waveform(file_path)
+
+    cache_path = os.path.join(cache_dir, f"{content_hash or file_sha256(file_path)}.npy")
+    if not os.path.isfile(cache_path):
+        logging.info(f"Decoding {file_path} into the audio cache.")
+        os.makedirs(cache_dir, exist_ok=True)
+        audio = _load_waveform(file_path)
+        # Write to a temporary file unique to this writer first, so readers never see a partial array
+        with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.npy.tmp', delete=False) as file:
+            tmp_path = file.name
+            try:
+                np.save(file, audio)
+            except BaseException:
+                file.close()
+                os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, cache_path)
+    else:
+        logging.info(f"Using cached waveform {cache_path}.")
+
+    # Copy-on-write mapping: pages are shared between jobs and never written back
+    return np.load(cache_path, mmap_mode='c')
@@ -0,0 +1,304 @@
+"""
+Bulk transcription of a local directory or an S3 prefix.
+
+    transcribe-batch recordings/ --output batch_output
+    transcribe-batch s3://focus-transcribe/calls/2024-06/ --upload
+
+Every file goes through four stages: fetch and decode, transcribe and align, diarize,
+then summarize, export and upload. Each stage runs on its own thread and the stages
+are joined by bounded queues. The stages overlap across files: one file is transcribed
+while the next is decoded and the previous one is diarized and summarized.
+
+Every finished file is appended to `manifest.jsonl` in the output directory. A rerun
+skips files recorded as completed whose size and modification time (ETag on S3) are
+unchanged, so an interrupted backfill resumes where it stopped. With the result cache
+enabled, a file that was interrupted part-way also skips the stages it already finished.
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from src.logger import logging
+from src.constants import (BUCKET_NAME, TRANSCRIPTION_S3_PREFIX, BATCH_AUDIO_EXTENSIONS, BATCH_OUTPUT_DIR,
+                           BATCH_MANIFEST_FILENAME, BATCH_QUEUE_SIZE)
+
+# Marks the end of the input on every stage queue
+_DONE = object()
+
+
+def _parse_s3_uri(uri):
+    bucket, _, prefix = uri[len("s3://"):].partition("/")
+    return bucket, prefix
+
+
+def list_sources(location, s3_sync=None, extensions=BATCH_AUDIO_EXTENSIONS):
+    """
+    Audio files under a directory or `s3://bucket/prefix`, sorted by name.
+
+    :return: List of dicts with the `source` URI or path, its `name` relative to `location`
+             and a `version` that changes whenever the file does
+    """
+    sources = []
+    if location.startswith("s3://"):
+        bucket, prefix = _parse_s3_uri(location)
+        for key, obj in s3_sync.list_objects(bucket, prefix).items():
+            if key.lower().endswith(extensions):
+                etag = obj['ETag'].strip('"')
+                sources.append({"source": f"s3://{bucket}/{key}", "name": key[len(prefix):].lstrip("/"),
+                                "version": f"{obj['Size']}:{etag}", "object": obj})
+    else:
+        for directory, _, files in os.walk(location):
+            for file in files:
+                if file.lower().endswith(extensions):
+                    path = os.path.join(directory, file)
+                    stat = os.stat(path)
+                    sources.append({"source": path, "name": os.path.relpath(path, location),
+                                    "version": f"{stat.st_size}:{int(stat.st_mtime)}"})
+    return sorted(sources, key=lambda item: item["name"])
+
+
+class BatchManifest:
+    """Append-only JSON lines record of processed files; the last entry of a source wins."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.isfile(path):
+            with open(path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by a crash
+                    self.entries[entry["source"]] = entry
+
+    def is_completed(self, item):
+        entry = self.entries.get(item["source"])
+        return entry is not None and entry["status"] == "completed" and entry["version"] == item["version"]
+
+    def record(self, entry):
+        with self._lock:
+            self.entries[entry["source"]] = entry
+            with open(self.path, "a") as file:
+                file.write(json.dumps(entry) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+
+class BatchItem:
+    """One file travelling through the stages."""
+    def __init__(self, source):
+        self.source = source
+        # Stable id, so a rerun of the same file writes to the same S3 prefix
+        self.id = hashlib.sha1(source["source"].encode()).hexdigest()[:16]
+        # Keep the extension, so `call.wav` and `call.mp3` of one batch get their own directories
+        root, extension = os.path.splitext(source["name"])
+        self.output_name = f"{root}_{extension[1:]}" if extension else root
+        self.workspace = None
+        self.transcriber = None
+        self.audio_seconds = None
+        self.final_result = None
+        self.speakers = None
+        self.output = None
+        self.stage_seconds = {}
+
+
+class BatchRunner:
+    """
+    Runs the batch stages on their own threads.
+
+    :param output_dir: Exports, summaries and the manifest are written here, one directory per file
+                       named after the file with its extension (`calls/a.wav` -> `calls/a_wav`)
+    :param artifact_uploader: Optional started ArtifactUploader that ships the exports to S3
+    :param summarize: Summarize every transcript with the LLM
+    """
+    def __init__(self, hugging_face_token, groq_api_key, output_dir=BATCH_OUTPUT_DIR, s3_sync=None, device="cpu",
+                 artifact_uploader=None, result_cache=None, transcript_store=None, summarize=True,
+                 min_speakers=None, max_speakers=None, queue_size=BATCH_QUEUE_SIZE):
+        self.hugging_face_token = hugging_face_token
+        self.groq_api_key = groq_api_key
+        self.output_dir = output_dir
+        self.s3_sync = s3_sync
+        self.device = device
+        self.artifact_uploader = artifact_uploader
+        self.result_cache = result_cache
+        self.transcript_store = transcript_store
+        self.summarize = summarize
+        self.min_speakers = min_speakers
+        self.max_speakers = max_speakers
+        self.queue_size = queue_size
+        os.makedirs(output_dir, exist_ok=True)
+        self.manifest = BatchManifest(os.path.join(output_dir, BATCH_MANIFEST_FILENAME))
+        self.completed = 0
+        self.failed = 0
+
+    def run(self, sources):
+        """Process `sources` (see `list_sources`), skipping those the manifest records as completed."""
+        pending = [source for source in sources if not self.manifest.is_completed(source)]
+        logging.info(f"Batch of {len(sources)} files, {len(sources) - len(pending)} already completed.")
+
+        stages = [self._fetch, self._transcribe, self._diarize, self._finish]
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in stages]
+        threads = []
+        for i, stage in enumerate(stages):
+            output = queues[i + 1] if i + 1 < len(queues) else None
+            threads.append(threading.Thread(target=self._run_stage, args=(stage, queues[i], output),
+                                            name=f"batch-{stage.__name__.strip('_')}", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        for source in pending:
+            queues[0].put(BatchItem(source))
+        queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+        logging.info(f"Batch finished: {self.completed} completed, {self.failed} failed.")
+        return self.completed, self.failed
+
+    def _run_stage(self, stage, input_queue, output_queue):
+        while True:
+            item = input_queue.get()
+            if item is _DONE:
+                if output_queue is not None:
+                    output_queue.put(_DONE)
+                return
+            name = stage.__name__.strip('_')
+            start_time = time.perf_counter()
+            try:
+                stage(item)
+                item.stage_seconds[name] = round(time.perf_counter() - start_time, 3)
+            except Exception as e:
+                item.stage_seconds[name] = round(time.perf_counter() - start_time, 3)
+                logging.exception(f"Stage {name} failed for {item.source['source']}: {e}")
+                self._record(item, "failed", error=f"{name}: {e}")
+                continue
+            if output_queue is not None:
+                output_queue.put(item)
+            else:
+                self._record(item, "completed")
+
+    def _fetch(self, item):
+        from src.dairization import WhisperTranscriber
+        from src.ingest import normalize_audio_file
+        from src.workspace import JobWorkspace
+
+        item.workspace = JobWorkspace(item.id)
+        source = item.source["source"]
+        if source.startswith("s3://"):
+            bucket, _ = _parse_s3_uri(source)
+            original = item.workspace.path("original" + os.path.splitext(source)[1])
+            self.s3_sync.download_file(bucket, item.source["object"], original)
+            normalize_audio_file(original, item.workspace.audio_path)
+            os.remove(original)
+        else:
+            normalize_audio_file(source, item.workspace.audio_path)
+
+        item.transcriber = WhisperTranscriber(item.workspace.audio_path, self.hugging_face_token, device=self.device,
+                                              result_cache=self.result_cache, min_speakers=self.min_speakers,
+                                              max_speakers=self.max_speakers)
+        item.transcriber.load_audio()
+
+    def _transcribe(self, item):
+        item.transcriber.load_model()
+        item.transcriber.transcribe_audio()
+        item.transcriber.align_transcription()
+
+    def _diarize(self, item):
+        transcriber = item.transcriber
+        item.final_result, item.speakers = transcriber.diarize_audio()
+        item.audio_seconds = transcriber.audio_seconds()
+        # The waveform is no longer needed; drop it before the file waits for summarization
+        item.transcriber = None
+
+    def _finish(self, item):
+        from src.summarization import get_summarization_engine
+        from src.transcript import Transcript
+
+        transcript = Transcript.from_result(item.final_result, uniq_speakers=item.speakers)
+        directory = os.path.join(self.output_dir, item.output_name)
+        transcript.write_exports(directory)
+
+        summary_data = None
+        if self.summarize:
+            summary_data = get_summarization_engine(self.groq_api_key).summarise_conversation(
+                transcript.speaker_texts, transcript.lines(), result_cache=self.result_cache)
+            with open(os.path.join(directory, "summary.json"), "w") as file:
+                json.dump(summary_data, file, indent=2)
+
+        if self.transcript_store is not None:
+            self.transcript_store.ingest(item.id, transcript, summary_data, round(item.audio_seconds / 60, 2),
+                                         item.source["source"])
+        if self.artifact_uploader is not None:
+            self.artifact_uploader.enqueue_folder(directory, prefix=f"{TRANSCRIPTION_S3_PREFIX}/{item.id}")
+        item.output = directory
+
+    def _record(self, item, status, error=None):
+        if item.workspace is not None:
+            item.workspace.cleanup()
+        entry = {
+            "source": item.source["source"],
+            "version": item.source["version"],
+            "id": item.id,
+            "status": status,
+            "error": error,
+            "output": item.output,
+            "audio_seconds": item.audio_seconds,
+            "stage_seconds": item.stage_seconds,
+            "finished_at": time.time(),
+        }
+        self.manifest.record(entry)
+        if status == "completed":
+            self.completed += 1
+        else:
+            self.failed += 1
+        logging.info(f"{status.capitalize()}: {item.source['source']}")
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+    from src.s3_syncer import S3Sync
+    from src.result_cache import build_result_cache
+    from src.artifact_uploader import ArtifactUploader
+    from src.transcript_store import TranscriptStore
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Transcribe every recording in a directory or S3 prefix.")
+    parser.add_argument("input", help="Local directory or s3://bucket/prefix")
+    parser.add_argument("--output", default=BATCH_OUTPUT_DIR, help="Directory for exports, summaries and the manifest.")
+    parser.add_argument("--device", default=os.getenv("DEVICE", "cpu"))
+    parser.add_argument("--upload", action="store_true", help=f"Upload the exports to the {BUCKET_NAME} bucket.")
+    parser.add_argument("--skip-summary", action="store_true", help="Do not summarize the transcripts.")
+    parser.add_argument("--index", action="store_true", help="Add the transcripts to the search index.")
+    parser.add_argument("--min-speakers", type=int)
+    parser.add_argument("--max-speakers", type=int)
+    parser.add_argument("--limit", type=int, help="Process at most this many pending files.")
+    args = parser.parse_args(argv)
+
+    s3_sync = S3Sync(os.getenv("AWS_ACCESS_KEY_ID"), os.getenv("AWS_SECRET_ACCESS_KEY"), os.getenv("AWS_REGION"))
+    artifact_uploader = ArtifactUploader(s3_sync, BUCKET_NAME) if args.upload else None
+    runner = BatchRunner(os.getenv("HUGGINGFACEHUB_API_TOKEN"), os.getenv("GROQ_API_KEY"), args.output, s3_sync,
+                         device=args.device, artifact_uploader=artifact_uploader, result_cache=build_result_cache(s3_sync),
+                         transcript_store=TranscriptStore() if args.index else None, summarize=not args.skip_summary,
+                         min_speakers=args.min_speakers, max_speakers=args.max_speakers)
+
+    sources = list_sources(args.input, s3_sync)
+    if args.limit is not None:
+        sources = [source for source in sources if not runner.manifest.is_completed(source)][:args.limit]
+
+    if artifact_uploader is not None:
+        artifact_uploader.start()
+    try:
+        completed, failed = runner.run(sources)
+    finally:
+        if artifact_uploader is not None:
+            artifact_uploader.stop(flush=True)
+    print(f"{completed} completed, {failed} failed; manifest in {runner.manifest.path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
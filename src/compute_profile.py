@@ -0,0 +1,209 @@
+import json
+import os
+import platform
+import threading
+import time
+from src.logger import logging
+from src.metrics import peak_rss_bytes
+from src.constants import (COMPUTE_TYPE, COMPUTE_CPU_THREADS, COMPUTE_NUM_WORKERS, COMPUTE_BATCH_SIZE,
+                           COMPUTE_PROFILE_PATH, COMPUTE_MEMORY_BUDGET_MB, COMPUTE_BATCH_SIZE_CANDIDATES,
+                           COMPUTE_TYPE_PREFERENCES, JOB_MAX_WORKERS, SAMPLE_RATE)
+
+
+class ComputeProfile:
+    """
+    How Whisper inference runs on this host: CTranslate2 compute type, intra-op threads
+    (`cpu_threads`) and parallel model replicas (`num_workers`), plus the batch size.
+    """
+    def __init__(self, device, compute_type, cpu_threads, num_workers, batch_size, calibrated=False):
+        self.device = device
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+        self.calibrated = calibrated
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __repr__(self):
+        return f"ComputeProfile({self.to_dict()})"
+
+
+def available_cores():
+    """CPU cores this process may use, honouring CPU affinity and cgroup quotas."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS and Windows
+        cores = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def total_memory_mb():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2 ** 20
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def host_signature(device="cpu"):
+    """
+    Key under which profiles are stored: the hardware rather than the host name, so
+    nodes of the same type share one calibration.
+    """
+    return f"{platform.machine()}|{platform.processor() or 'unknown'}|{available_cores()}cores|{total_memory_mb()}MB|{device}"
+
+
+def select_compute_type(device="cpu", requested=COMPUTE_TYPE):
+    """Pick the fastest compute type CTranslate2 supports on `device` unless one was requested."""
+    if requested and requested != "auto":
+        return requested
+    preferences = COMPUTE_TYPE_PREFERENCES.get(device, ("float32",))
+    try:
+        import ctranslate2
+        supported = ctranslate2.get_supported_compute_types(device)
+    except Exception as e:
+        logging.warning(f"Could not query supported compute types on {device}: {e}")
+        return preferences[0]
+    return next((compute_type for compute_type in preferences if compute_type in supported), "float32")
+
+
+def default_profile(device="cpu"):
+    """Profile derived from the host without a calibration run."""
+    cores = available_cores()
+    # Concurrent jobs share the model, so give every job its own replica and split the cores between them
+    num_workers = COMPUTE_NUM_WORKERS or max(1, min(JOB_MAX_WORKERS, cores))
+    cpu_threads = COMPUTE_CPU_THREADS or max(1, cores // num_workers)
+    batch_size = COMPUTE_BATCH_SIZE or (16 if device == "cuda" else 8)
+    return ComputeProfile(device, select_compute_type(device), cpu_threads, num_workers, batch_size)
+
+
+def load_profiles(path=COMPUTE_PROFILE_PATH):
+    if not path or not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable compute profiles in {path}: {e}")
+        return {}
+
+
+def save_profile(profile, path=COMPUTE_PROFILE_PATH):
+    """Store `profile` for this host next to the profiles of other hosts."""
+    profiles = load_profiles(path)
+    profiles[host_signature(profile.device)] = profile.to_dict()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(profiles, file, indent=2)
+    os.replace(tmp_path, path)
+    logging.info(f"Saved compute profile for {host_signature(profile.device)} to {path}.")
+
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def get_compute_profile(device="cpu", path=COMPUTE_PROFILE_PATH):
+    """
+    Return the compute profile of this host for `device`.
+
+    A profile stored by `calibrate` is used when one exists for this hardware, otherwise
+    the defaults derived from the core count. Environment overrides win in both cases.
+    """
+    with _profiles_lock:
+        if device not in _profiles:
+            profile = default_profile(device)
+            stored = load_profiles(path).get(host_signature(device))
+            if stored:
+                profile = ComputeProfile.from_dict(stored)
+                if COMPUTE_TYPE != "auto":
+                    profile.compute_type = COMPUTE_TYPE
+                profile.cpu_threads = COMPUTE_CPU_THREADS or profile.cpu_threads
+                profile.num_workers = COMPUTE_NUM_WORKERS or profile.num_workers
+                profile.batch_size = COMPUTE_BATCH_SIZE or profile.batch_size
+            logging.info(f"Using {profile}.")
+            _profiles[device] = profile
+        return _profiles[device]
+
+
+def configure_threads(profile):
+    """Limit PyTorch (alignment and diarization) to the same number of threads per job."""
+    try:
+        import torch
+        torch.set_num_threads(profile.cpu_threads)
+    except ImportError:
+        pass
+
+
+def autotune_batch_size(model, audio, candidates=COMPUTE_BATCH_SIZE_CANDIDATES, memory_budget_mb=COMPUTE_MEMORY_BUDGET_MB):
+    """
+    Transcribe `audio` with growing batch sizes and return the fastest one within the memory budget.
+
+    Tuning stops once the process peak memory exceeds `memory_budget_mb` or a larger batch
+    is no longer at least 5% faster.
+    """
+    model.transcribe(audio[:30 * SAMPLE_RATE], batch_size=1)  # Warm-up, so the first candidate is not penalised
+    best_size, best_seconds = candidates[0], None
+    for batch_size in candidates:
+        start_time = time.perf_counter()
+        result = model.transcribe(audio, batch_size=batch_size)
+        seconds = time.perf_counter() - start_time
+        if not result["segments"]:
+            raise ValueError("The calibration audio contains no speech.")
+        peak_mb = peak_rss_bytes() / 2 ** 20
+        logging.info(f"Calibration: batch size {batch_size} took {seconds:.2f} seconds, peak memory {peak_mb:.0f} MB.")
+
+        if memory_budget_mb and peak_mb > memory_budget_mb:
+            logging.info(f"Batch size {batch_size} exceeds the memory budget of {memory_budget_mb} MB.")
+            break
+        if best_seconds is not None and seconds > best_seconds * 0.95:
+            break
+        best_size, best_seconds = batch_size, seconds
+    return best_size
+
+
+def calibrate(audio_file, device="cpu", seconds=120, path=COMPUTE_PROFILE_PATH):
+    """
+    Measure the best batch size for this host on up to `seconds` of `audio_file` and store the profile.
+
+    The audio should contain speech, otherwise there is nothing to batch.
+    """
+    from src.audio import decode_audio
+    from src.dairization import load_whisper_model
+
+    profile = get_compute_profile(device, path)
+    audio = decode_audio(audio_file, cache_dir="")[:int(seconds * SAMPLE_RATE)]
+    model = load_whisper_model(device, profile.compute_type)
+
+    profile.batch_size = autotune_batch_size(model, audio)
+    profile.calibrated = True
+    save_profile(profile, path)
+    return profile
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show or calibrate the compute profile of this host.")
+    parser.add_argument("--device", default=os.getenv("DEVICE", "cpu"))
+    parser.add_argument("--calibrate", metavar="AUDIO_FILE", help="Autotune the batch size on this recording.")
+    parser.add_argument("--seconds", type=float, default=120, help="Audio used for calibration.")
+    args = parser.parse_args()
+
+    if args.calibrate:
+        print(calibrate(args.calibrate, args.device, args.seconds))
+    else:
+        print(host_signature(args.device))
+        print(get_compute_profile(args.device))
@@ -7,14 +7,228 @@ MODEL_NAME = "distil-large-v2"
 MODEL_DIR = os.path.join(os.getcwd(),"distil_whisper_model")
 MODEL_PATH = os.path.join(MODEL_DIR,"models--Systran--faster-distil-whisper-large-v2",
                           "snapshots","fe9b404fc56de3f7c38606ef9ba6fd83526d05e4")
-COMPUTE_TYPE= "float32"
+# CTranslate2 compute type, "auto" picks the fastest type the device supports (see src/compute_profile.py)
+COMPUTE_TYPE = os.getenv("COMPUTE_TYPE", "auto")
+
+
+""" Constants related to the compute profile """
+
+# Preferred compute types per device, the first one CTranslate2 supports is used
+COMPUTE_TYPE_PREFERENCES = {
+    "cpu": ("int8_float32", "int8", "float32"),
+    "cuda": ("float16", "int8_float16", "float32"),
+}
+# Intra-op threads per model replica and number of replicas, derived from the cores when 0
+COMPUTE_CPU_THREADS = int(os.getenv("COMPUTE_CPU_THREADS", 0))
+COMPUTE_NUM_WORKERS = int(os.getenv("COMPUTE_NUM_WORKERS", 0))
+# Whisper batch size, taken from the calibrated profile when 0
+COMPUTE_BATCH_SIZE = int(os.getenv("COMPUTE_BATCH_SIZE", 0))
+COMPUTE_BATCH_SIZE_CANDIDATES = (1, 2, 4, 8, 16, 32)
+# Peak process memory (in MB) allowed while calibrating the batch size, unlimited when 0
+COMPUTE_MEMORY_BUDGET_MB = int(os.getenv("COMPUTE_MEMORY_BUDGET_MB", 0))
+# Calibrated profiles keyed by host hardware
+COMPUTE_PROFILE_PATH = os.getenv("COMPUTE_PROFILE_PATH", os.path.join(os.getcwd(), "compute_profiles.json"))
+# Recording used to calibrate the batch size at startup when this host has no stored profile
+COMPUTE_CALIBRATION_AUDIO = os.getenv("COMPUTE_CALIBRATION_AUDIO", "")
 
 
 """ Constants related to Summarization """
 
 SUMMARIZATION_MODEL = "Llama3-8b-8192"
+# Maximum number of summarization requests in flight at once
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", 4))
+# Retries of a summarization request that was rate limited
+SUMMARY_MAX_RETRIES = 5
+SUMMARY_BACKOFF_SECONDS = 1.0
+# Token budget of the transcript text sent in a single summarization request.
+# Longer transcripts are split on speaker turns, summarised in parts and reduced.
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", 3000))
+# Rough characters per token used to estimate prompt sizes
+SUMMARY_CHARS_PER_TOKEN = 4
 
 
 """ Constants related to S3 """
 BUCKET_NAME= "focus-transcribe"
 
+
+
+""" Constants related to the model registry """
+
+# Maximum number of models kept warm in a single worker process
+MODEL_REGISTRY_MAX_MODELS = int(os.getenv("MODEL_REGISTRY_MAX_MODELS", 6))
+# Memory budget (in MB) shared by all warm models of a worker process
+MODEL_REGISTRY_MEMORY_BUDGET_MB = int(os.getenv("MODEL_REGISTRY_MEMORY_BUDGET_MB", 8192))
+# Fallback size estimates (in MB) for models whose footprint can not be measured
+MODEL_MEMORY_ESTIMATES_MB = {
+    "whisper": 1600,
+    "align": 400,
+    "diarization": 300,
+}
+# Languages whose alignment models are loaded at application startup
+PRELOAD_LANGUAGES = [lang for lang in os.getenv("PRELOAD_LANGUAGES", "en").split(",") if lang]
+
+
+""" Constants related to transcription jobs """
+
+# Number of jobs processed concurrently by a worker process
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", 2))
+# Number of jobs allowed to wait for a free worker before uploads are rejected
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", 8))
+# Number of jobs transcribed by remote speech-to-text services at once; they wait on HTTP, not on a CPU worker
+JOB_MAX_IO_WORKERS = int(os.getenv("JOB_MAX_IO_WORKERS", 16))
+# Number of finished jobs whose results are kept in memory
+JOB_MAX_STORED_RESULTS = int(os.getenv("JOB_MAX_STORED_RESULTS", 100))
+# Broker shared with standalone workers (sqlite:///path or redis://host), jobs run in-process when empty
+JOB_BROKER_URL = os.getenv("JOB_BROKER_URL", "")
+# Where uploads are staged for workers: s3://bucket/prefix or a directory on shared storage
+JOB_QUEUE_AUDIO_URI = os.getenv("JOB_QUEUE_AUDIO_URI", "queued_audio")
+# Number of jobs allowed in the broker queue before uploads are rejected
+JOB_QUEUE_MAX_PENDING = int(os.getenv("JOB_QUEUE_MAX_PENDING", 100))
+# A worker's lease on a job expires unless renewed by a heartbeat
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 120))
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", 30))
+# Attempts before a job is dead-lettered, retries wait backoff * 2 ** (attempt - 1) seconds
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_BACKOFF_SECONDS = int(os.getenv("JOB_RETRY_BACKOFF_SECONDS", 30))
+# Seconds the progress events of a finished job are kept in the broker
+JOB_EVENT_RETENTION_SECONDS = int(os.getenv("JOB_EVENT_RETENTION_SECONDS", 24 * 60 * 60))
+# Seconds an idle worker waits before asking the broker again
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", 1.0))
+# Seconds between checks of the HTTP tier for jobs completed by workers, whose transcripts it indexes
+JOB_INDEX_POLL_SECONDS = float(os.getenv("JOB_INDEX_POLL_SECONDS", 2.0))
+
+
+""" Constants related to audio decoding """
+
+SAMPLE_RATE = 16000
+# Directory for memory-mapped decoded waveforms keyed by content hash, disabled when empty
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "")
+# Upper bound on the audio transcribed at once in streaming mode
+STREAM_WINDOW_SECONDS = 30
+# Audio before each streaming window that is diarized again to carry speaker labels over
+STREAM_DIARIZATION_OVERLAP_SECONDS = 5
+# Speech detection before transcription and diarization: "whisperx" (neural VAD with the energy
+# detector as fallback), "energy" or "off"
+VAD_METHOD = os.getenv("VAD_METHOD", "whisperx")
+# Audio kept around every speech region and silence inserted between regions when they are joined
+VAD_PAD_SECONDS = 0.2
+VAD_GAP_SECONDS = 0.2
+# Only trim when at least this fraction of the recording is silence
+VAD_MIN_TRIM_RATIO = float(os.getenv("VAD_MIN_TRIM_RATIO", 0.1))
+
+
+""" Constants related to speaker diarization """
+
+DIARIZATION_MODEL = "pyannote/speaker-diarization-3.1"
+# Speaker count bounds used when a request does not set them
+DIARIZATION_MIN_SPEAKERS = int(os.getenv("DIARIZATION_MIN_SPEAKERS", 2))
+DIARIZATION_MAX_SPEAKERS = int(os.getenv("DIARIZATION_MAX_SPEAKERS", 2))
+# Recordings longer than this (in seconds) are diarized in shards on a process pool, 0 disables sharding
+DIARIZATION_SHARDING_MIN_SECONDS = float(os.getenv("DIARIZATION_SHARDING_MIN_SECONDS", 1800))
+DIARIZATION_SHARD_SECONDS = 600
+# Audio before each shard diarized again to match speakers that have too little speech for an embedding
+DIARIZATION_SHARD_OVERLAP_SECONDS = 30
+DIARIZATION_SHARD_WORKERS = int(os.getenv("DIARIZATION_SHARD_WORKERS", 2))
+# Cosine similarity above which speakers of different shards are considered the same person
+DIARIZATION_SPEAKER_SIMILARITY = 0.5
+
+""" Constants related to upload ingestion """
+
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+# Uploads above this size are rejected with 413
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", 500)) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Bytes inspected to recognise the container of an upload
+SNIFF_BYTES = 64
+# Containers ffmpeg can decode while reading them from a pipe; others are spooled to disk first
+STREAMABLE_AUDIO_FORMATS = ("wav", "mp3", "flac", "ogg", "webm", "aiff", "amr")
+# Audio-only YouTube streams in order of preference; WebM/Opus can be piped into ffmpeg as it arrives
+YOUTUBE_AUDIO_MIME_TYPES = ("audio/webm", "audio/mp4")
+YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com", "youtu.be")
+URL_FETCH_TIMEOUT_SECONDS = int(os.getenv("URL_FETCH_TIMEOUT_SECONDS", 30))
+URL_MAX_REDIRECTS = 5
+# URLs resolving to private, loopback or link-local addresses are refused unless their host is listed here
+URL_ALLOWED_PRIVATE_HOSTS = tuple(host.strip().lower() for host in os.getenv("URL_ALLOWED_PRIVATE_HOSTS", "").split(",") if host.strip())
+# Number of URLs fetched and decoded at once by ingest_urls
+URL_INGEST_MAX_CONCURRENCY = int(os.getenv("URL_INGEST_MAX_CONCURRENCY", 4))
+
+""" Constants related to the result cache """
+
+# Local directory of cached stage outputs, disabled when empty
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", os.path.join(os.getcwd(), "result_cache"))
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", 2048))
+# Share cached stage outputs between nodes through the S3 bucket
+RESULT_CACHE_S3 = os.getenv("RESULT_CACHE_S3", "false").lower() == "true"
+RESULT_CACHE_S3_PREFIX = "result-cache"
+
+
+""" Constants related to S3 transfers """
+
+S3_MAX_WORKERS = int(os.getenv("S3_MAX_WORKERS", 16))
+# Files above the threshold are transferred in parts of S3_MULTIPART_CHUNKSIZE
+S3_MULTIPART_THRESHOLD = 16 * 1024 * 1024
+S3_MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+
+
+""" Constants related to the background artifact uploader """
+
+# Durable queue of artifacts waiting to be uploaded to S3
+ARTIFACT_SPOOL_DIR = os.getenv("ARTIFACT_SPOOL_DIR", os.path.join(os.getcwd(), "artifact_spool"))
+ARTIFACT_UPLOAD_BATCH_SIZE = 20
+ARTIFACT_UPLOAD_MAX_RETRIES = 8
+ARTIFACT_UPLOAD_BACKOFF_SECONDS = 2.0
+# Time allowed for draining the queue when the application shuts down
+ARTIFACT_FLUSH_TIMEOUT_SECONDS = 30
+
+
+""" Constants related to job workspaces """
+
+# Parent directory of per-job working directories, the system temp directory when empty
+JOB_WORKSPACE_ROOT = os.getenv("JOB_WORKSPACE_ROOT", "") or None
+# S3 key prefix of the transcription files of a job, followed by the job id
+TRANSCRIPTION_S3_PREFIX = "transcription"
+# Also store the diarized whisperx result (with word timings) next to the transcription exports
+PERSIST_DIARIZED_RESULT = os.getenv("PERSIST_DIARIZED_RESULT", "false").lower() == "true"
+# File name of the stored result, .msgpack selects msgpack instead of compact JSON
+DIARIZED_RESULT_FILENAME = os.getenv("DIARIZED_RESULT_FILENAME", "diarized_result.json")
+
+
+""" Constants related to the transcript store """
+
+# SQLite database holding every processed transcript for full-text search
+TRANSCRIPT_STORE_PATH = os.getenv("TRANSCRIPT_STORE_PATH", os.path.join(os.getcwd(), "transcripts.db"))
+SEARCH_MAX_LIMIT = 100
+
+
+""" Constants related to batch transcription """
+
+# Files picked up from a directory or S3 prefix by transcribe-batch
+BATCH_AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".mp4", ".flac", ".ogg", ".webm", ".aac", ".aiff", ".amr")
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", "batch_output")
+# Append-only record of processed files, used to resume interrupted runs
+BATCH_MANIFEST_FILENAME = "manifest.jsonl"
+# Files waiting between two stages; bounds memory since decoded audio waits in these queues
+BATCH_QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", 2))
+
+
+""" Constants related to ASR backends """
+
+DEEPGRAM_API_URL = os.getenv("DEEPGRAM_API_URL", "https://api.deepgram.com")
+DEEPGRAM_MODEL = "nova-2"
+ASSEMBLYAI_API_URL = os.getenv("ASSEMBLYAI_API_URL", "https://api.assemblyai.com")
+ASSEMBLYAI_POLL_SECONDS = 3.0
+# Pooled HTTP connections per remote backend and the time allowed for a single request
+ASR_HTTP_MAX_CONNECTIONS = int(os.getenv("ASR_HTTP_MAX_CONNECTIONS", 16))
+ASR_HTTP_TIMEOUT_SECONDS = float(os.getenv("ASR_HTTP_TIMEOUT_SECONDS", 300))
+# Remote backends jobs may overflow to, e.g. "deepgram,assemblyai"; only local transcription when empty
+ASR_REMOTE_BACKENDS = [name for name in os.getenv("ASR_REMOTE_BACKENDS", "").split(",") if name]
+# USD per audio minute, used to pick the cheapest remote backend (list prices, adjust to the contract)
+ASR_COST_PER_MINUTE = {
+    "local": 0.0,
+    "deepgram": float(os.getenv("DEEPGRAM_COST_PER_MINUTE", 0.0043)),
+    "assemblyai": float(os.getenv("ASSEMBLYAI_COST_PER_MINUTE", 0.0062)),
+}
+# Jobs queued or running locally beyond which new jobs overflow to a remote backend
+ASR_ROUTER_MAX_LOCAL_BACKLOG = int(os.getenv("ASR_ROUTER_MAX_LOCAL_BACKLOG", 4))
+# Recordings longer than this (in seconds) always go to a remote backend, 0 disables
+ASR_ROUTER_REMOTE_MIN_SECONDS = float(os.getenv("ASR_ROUTER_REMOTE_MIN_SECONDS", 0))
@@ -1,22 +1,297 @@
 import json
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from src.logger import logging
 import time
 load_dotenv()
-from src.constants import COMPUTE_TYPE, MODEL_PATH , MODEL_NAME, MODEL_DIR
+from src.constants import MODEL_PATH , MODEL_NAME, MODEL_DIR
+from src.compute_profile import get_compute_profile, configure_threads
+from src.constants import AUDIO_CACHE_DIR
+from src.audio import decode_audio, file_sha256
+from src.metrics import track_stage
+from src.vad import detect_speech_regions, split_into_windows, whisperx_speech_regions, SpeechMap
+from src.constants import SAMPLE_RATE, STREAM_WINDOW_SECONDS, STREAM_DIARIZATION_OVERLAP_SECONDS
+from src.constants import VAD_METHOD, VAD_MIN_TRIM_RATIO
+from src.constants import DIARIZATION_MODEL, DIARIZATION_MIN_SPEAKERS, DIARIZATION_MAX_SPEAKERS, DIARIZATION_SHARDING_MIN_SECONDS
+from src.sharded_diarization import diarize_sharded
+from src.constants import MODEL_REGISTRY_MAX_MODELS, MODEL_REGISTRY_MEMORY_BUDGET_MB, MODEL_MEMORY_ESTIMATES_MB
 huggingface_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
 
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models.
+
+    Models are keyed by (name, device, compute_type, language), loaded at most once
+    and evicted in least-recently-used order when either the number of models or
+    the estimated memory footprint exceeds the configured budget.
+    """
+    def __init__(self, max_models=MODEL_REGISTRY_MAX_MODELS, memory_budget_mb=MODEL_REGISTRY_MEMORY_BUDGET_MB):
+        self.max_models = max_models
+        self.memory_budget_mb = memory_budget_mb
+        self._models = OrderedDict()  # key -> (model, size_mb)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def get(self, key, loader, kind):
+        """
+        Return the model stored under `key`, calling `loader()` to build it on a miss.
+
+        Concurrent callers asking for the same key wait for a single load. `kind` ("whisper",
+        "align" or "diarization") selects the size estimate for models that can not be measured.
+        """
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key][0]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key][0]
+
+            start_time = time.time()
+            model = loader()
+            size_mb = _estimate_model_size_mb(kind, model)
+            logging.info(f"Loaded model {key} ({size_mb:.0f} MB) in {time.time() - start_time:.2f} seconds.")
+
+            with self._lock:
+                self._models[key] = (model, size_mb)
+                self._evict()
+                self._load_locks.pop(key, None)
+            return model
+
+    def _evict(self):
+        """Drop least recently used models until the registry fits its budget."""
+        while len(self._models) > 1 and (
+            len(self._models) > self.max_models or self.memory_usage_mb() > self.memory_budget_mb
+        ):
+            key, _ = self._models.popitem(last=False)
+            logging.info(f"Evicted model {key} from the registry.")
+
+    def memory_usage_mb(self):
+        return sum(size_mb for _, size_mb in self._models.values())
+
+    def keys(self):
+        with self._lock:
+            return list(self._models.keys())
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+
+def _estimate_model_size_mb(kind, model):
+    """Measure torch models from their parameters, fall back to static estimates otherwise."""
+    candidate = model[0] if isinstance(model, tuple) else model
+    parameters = getattr(candidate, "parameters", None)
+    if callable(parameters):
+        try:
+            return sum(p.numel() * p.element_size() for p in parameters()) / (1024 * 1024)
+        except Exception:
+            pass
+    return MODEL_MEMORY_ESTIMATES_MB.get(kind, 0)
+
+
+model_registry = ModelRegistry()
+
+
+def load_whisper_model(device="cpu", compute_type=None, language=None):
+    """
+    Return the warm Distil Whisper model, loading it from disk or downloading it on first use.
+
+    Compute type and thread counts come from the host's compute profile unless `compute_type` is given.
+    """
+    profile = get_compute_profile(device)
+    compute_type = compute_type or profile.compute_type
+
+    def loader():
+        import whisperx
+        from whisperx.asr import WhisperModel
+        logging.info(f"Loading the Distil Whisper model ({compute_type}, {profile.num_workers} x {profile.cpu_threads} threads).")
+        configure_threads(profile)
+
+        required_files = ['model.bin', 'config.json', 'tokenizer.json']  # Add other required files if necessary
+        model_files_exist = all(os.path.isfile(os.path.join(MODEL_PATH, file)) for file in required_files)
+
+        def build(model_path, **kwargs):
+            # whisperx does not expose num_workers, so its CTranslate2 model subclass is built here
+            whisper_model = WhisperModel(model_path, device=device, compute_type=compute_type,
+                                         cpu_threads=profile.cpu_threads, num_workers=profile.num_workers, **kwargs)
+            return whisperx.load_model(model_path, device, compute_type=compute_type, language=language,
+                                       model=whisper_model, threads=profile.cpu_threads)
+
+        if os.path.exists(MODEL_DIR) and model_files_exist:
+            # Load the model from the local directory
+            model = build(MODEL_PATH)
+            logging.info("Model loaded successfully from local directory.")
+        else:
+            logging.info("Model not found locally. Downloading...")
+            os.makedirs(MODEL_DIR, exist_ok=True)
+            # Downloading and saving the model in specified path
+            model = build(MODEL_NAME, download_root=MODEL_DIR)
+            logging.info("Model downloaded and saved successfully.")
+        return model
+
+    return model_registry.get((MODEL_NAME, device, compute_type, language), loader, "whisper")
+
+
+def load_align_model(language, device="cpu"):
+    """Return the warm (alignment model, metadata) pair for `language`."""
+    def loader():
+        import whisperx
+        return whisperx.load_align_model(language_code=language, device=device)
+
+    return model_registry.get(("align", device, None, language), loader, "align")
+
+
+def load_diarization_model(hugging_face_token, device="cpu"):
+    """Return the warm speaker diarization pipeline."""
+    def loader():
+        import whisperx
+        return whisperx.DiarizationPipeline(model_name=DIARIZATION_MODEL, use_auth_token=hugging_face_token, device=device)
+
+    return model_registry.get(("diarization", device, None, None), loader, "diarization")
+
+
+def preload_models(hugging_face_token, device="cpu", compute_type=None, languages=("en",)):
+    """Warm up every model the pipeline needs so the first request does not pay for loading."""
+    logging.info(f"Preloading models on {device} for languages {list(languages)}.")
+    load_whisper_model(device, compute_type)
+    for language in languages:
+        load_align_model(language, device)
+    load_diarization_model(hugging_face_token, device)
+
+_persistence_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="result-persistence")
+
+
+def _to_builtin(value):
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def save_result(result, filename):
+    """Serialize a whisperx result without indentation, using orjson or msgpack when installed."""
+    if filename.endswith('.msgpack'):
+        import msgpack
+        with open(filename, 'wb') as file:
+            file.write(msgpack.packb(result, default=_to_builtin, use_bin_type=True))
+        return
+
+    try:
+        import orjson
+    except ImportError:
+        with open(filename, 'w') as json_file:
+            json.dump(result, json_file, separators=(',', ':'), default=_to_builtin)
+        return
+    with open(filename, 'wb') as json_file:
+        json_file.write(orjson.dumps(result, default=_to_builtin, option=orjson.OPT_SERIALIZE_NUMPY))
+
+
+def load_result(filename):
+    """Read a result written by `save_result`."""
+    if filename.endswith('.msgpack'):
+        import msgpack
+        with open(filename, 'rb') as file:
+            return msgpack.unpackb(file.read(), raw=False)
+    with open(filename, 'rb') as json_file:
+        return json.loads(json_file.read())
+
+
+class SpeakerTracker:
+    """Maps window-local diarization labels onto stable speaker labels across streaming windows."""
+    def __init__(self, max_speakers=None):
+        self.max_speakers = max_speakers
+        self.speakers = []
+        self._previous = None  # Turns of the previous window, already using global labels
+
+    def assign(self, diarization, overlap_start, overlap_end):
+        """Return a {local label: global label} mapping for one window's diarization (absolute times)."""
+        overlap = {}
+        if self._previous is not None:
+            for local in diarization.itertuples():
+                for known in self._previous.itertuples():
+                    shared = min(local.end, known.end, overlap_end) - max(local.start, known.start, overlap_start)
+                    if shared > 0:
+                        pair = (local.speaker, known.speaker)
+                        overlap[pair] = overlap.get(pair, 0.0) + shared
+
+        mapping = {}
+        # Greedily match the pairs that talked together the longest inside the overlap
+        for (local, known), _ in sorted(overlap.items(), key=lambda item: -item[1]):
+            if local not in mapping and known not in mapping.values():
+                mapping[local] = known
+
+        for local in diarization['speaker'].unique():
+            if local in mapping:
+                continue
+            unused = [speaker for speaker in self.speakers if speaker not in mapping.values()]
+            if self.max_speakers is None or len(self.speakers) < self.max_speakers or not unused:
+                mapping[local] = f"SPEAKER_{len(self.speakers):02d}"
+                self.speakers.append(mapping[local])
+            else:
+                mapping[local] = unused[0]
+
+        self._previous = diarization.assign(speaker=diarization['speaker'].map(mapping))
+        return mapping
+
+
+def _timed_items(result):
+    """Segments and words of a whisperx result, each object once."""
+    words = [word for segment in result["segments"] for word in segment.get("words", [])]
+    words_seen = {id(word) for word in words}
+    words += [word for word in result.get("word_segments", []) if id(word) not in words_seen]
+    return result["segments"] + words
+
+
+def _shift_timestamps(result, offset):
+    """Move segment and word timestamps of a whisperx result by `offset` seconds, in place."""
+    for item in _timed_items(result):
+        for key in ("start", "end"):
+            if key in item:
+                item[key] += offset
+
+
+def _remap_timestamps(result, speech_map):
+    """Map timestamps of a result computed on `speech_map.compact(audio)` back to the recording, in place."""
+    fields = [(item, key) for item in _timed_items(result) for key in ("start", "end") if item.get(key) is not None]
+    times = speech_map.to_original([item[key] for item, key in fields])
+    for (item, key), time_ in zip(fields, times.tolist()):
+        item[key] = round(time_, 3)
+
+
 class WhisperTranscriber:
-    def __init__(self, audio_file,hugging_face_token, device="cpu", compute_type=COMPUTE_TYPE, batch_size=16):
+    def __init__(self, audio_file,hugging_face_token, device="cpu", compute_type=None, batch_size=None,
+                 audio=None, audio_cache_dir=AUDIO_CACHE_DIR, min_speakers=None, max_speakers=None, result_cache=None,
+                 progress=None, vad_method=VAD_METHOD, sharding_min_seconds=DIARIZATION_SHARDING_MIN_SECONDS):
         self.audio_file = audio_file
+        self.audio = audio  # Decoded waveform shared by every stage
+        self.audio_cache_dir = audio_cache_dir
         self.device = device
-        self.compute_type = compute_type
-        self.batch_size = batch_size
+        # Unset values come from the host's compute profile
+        profile = get_compute_profile(device)
+        self.compute_type = compute_type or profile.compute_type
+        self.batch_size = batch_size or profile.batch_size
+        self.min_speakers = min_speakers or DIARIZATION_MIN_SPEAKERS
+        self.max_speakers = max_speakers or DIARIZATION_MAX_SPEAKERS
+        self.sharding_min_seconds = sharding_min_seconds  # Longer speech is diarized in shards, 0 disables
+        self.result_cache = result_cache  # Optional ResultCache for stage outputs
+        self._content_hash = None
+        self.progress = progress  # Optional callable receiving stage metrics events
+        self.vad_method = vad_method
+        self.speech_map = None  # SpeechMap of the trimmed audio, None when the full audio is processed
+        self._speech_audio = None
         self.model = None
         self.result_trans = None
         self.result_align = None
         self.diarize_segments = None
+        self.stream_result = None
         self.hugging_face_token = hugging_face_token
         self.cancel_process = False  # Initialize cancel_process attribute
 
@@ -34,65 +309,212 @@ class WhisperTranscriber:
         return 0
     
     def load_model(self):
-        import whisperx
-        logging.info("Loading the Distil Whisper model.")
-        
+        try:
+            self.model = load_whisper_model(self.device, self.compute_type)
+        except Exception as e:
+            logging.error(f"Error loading the Distil Whisper model: {e}")
 
-        
-        required_files = ['model.bin', 'config.json', 'tokenizer.json']  # Add other required files if necessary
-        model_files_exist = all(os.path.isfile(os.path.join(MODEL_PATH, file)) for file in required_files)
+    def load_audio(self):
+        """Decode the audio file once; transcription, alignment and diarization reuse the buffer."""
+        if self.audio is None:
+            logging.info("Decode audio file.")
+            with track_stage("decode", self.progress, audio_seconds=lambda: len(self.audio) / SAMPLE_RATE):
+                self.audio = decode_audio(self.audio_file, cache_dir=self.audio_cache_dir,
+                                          content_hash=self.content_hash() if self.audio_cache_dir else None)
+        return self.audio
 
-        if os.path.exists(MODEL_DIR) and model_files_exist:
-            try:
-                # Load the model from the local directory
-                self.model = whisperx.load_model(MODEL_PATH, self.device, compute_type=self.compute_type)
-                logging.info("Model loaded successfully from local directory.")
-            except Exception as e:
-                logging.error(f"Error loading model from local directory: {e}")
-        else:
-            logging.info("Model not found locally. Downloading...")
-            os.makedirs(MODEL_DIR, exist_ok=True)
+    def speech_audio(self):
+        """
+        The waveform with silence and non-speech removed, as processed by transcription and diarization.
+
+        Falls back to the full waveform when trimming is off or would save less than
+        `VAD_MIN_TRIM_RATIO` of the audio. `self.speech_map` maps its times back.
+        """
+        if self._speech_audio is None:
+            audio = self.load_audio()
+            self._speech_audio = audio
+            if self.vad_method != "off":
+                with track_stage("vad", self.progress, audio_seconds=len(audio) / SAMPLE_RATE):
+                    speech_map = self._detect_speech(audio)
+                if speech_map is not None and speech_map.speech_seconds <= (1 - VAD_MIN_TRIM_RATIO) * speech_map.total_seconds:
+                    logging.info(f"Trimmed audio to {speech_map.speech_seconds:.1f} of {speech_map.total_seconds:.1f} seconds of speech.")
+                    self.speech_map = speech_map
+                    self._speech_audio = speech_map.compact(audio)
+        return self._speech_audio
+
+    def _detect_speech(self, audio):
+        regions = None
+        vad_model = getattr(self.model, "vad_model", None)
+        if self.vad_method == "whisperx" and vad_model is not None:
             try:
-                # Downloading and saving the model in specified path
-                self.model = whisperx.load_model(MODEL_NAME, self.device, compute_type=self.compute_type, download_root=MODEL_DIR)
-                logging.info("Model downloaded and saved successfully.")
+                regions = whisperx_speech_regions(audio, vad_model)
             except Exception as e:
-                logging.error(f"Error downloading the model: {e}")
+                logging.warning(f"whisperx VAD failed, using the energy detector: {e}")
+        if regions is None:
+            regions = detect_speech_regions(audio)
+        # Without any detected speech the whole recording is processed as is
+        return SpeechMap(regions, len(audio) / SAMPLE_RATE) if regions else None
+
+    def content_hash(self):
+        if self._content_hash is None:
+            self._content_hash = file_sha256(self.audio_file)
+        return self._content_hash
+
+    def audio_seconds(self):
+        """Audio length in seconds, taken from cached results when the file was not decoded."""
+        if self.audio is None and self.result_trans is not None and "duration" in self.result_trans:
+            return self.result_trans["duration"]
+        return len(self.load_audio()) / SAMPLE_RATE
+
+    def _cached(self, stage, compute, **params):
+        """Run `compute()` through the result cache, keyed by audio content, model and stage settings."""
+        if self.result_cache is None:
+            return compute()
+        key = self.result_cache.key(stage, self.content_hash(), model=MODEL_NAME,
+                                    compute_type=self.compute_type, **params)
+        return self.result_cache.get_or_compute(key, compute)
 
     def transcribe_audio(self):
-        import whisperx
         logging.info("Transcribe audio file.")
-        audio = whisperx.load_audio(self.audio_file)
-        self.result_trans = self.model.transcribe(audio, batch_size=self.batch_size)
+
+        def compute():
+            result = self.model.transcribe(self.speech_audio(), batch_size=self.batch_size)
+            if self.speech_map is not None:
+                _remap_timestamps(result, self.speech_map)
+            result["duration"] = len(self.load_audio()) / SAMPLE_RATE
+            return result
+
+        self.result_trans = self._cached("transcribe", compute, vad=self.vad_method)
 
     def align_transcription(self):
         import whisperx
         logging.info("Align the transcription output.")
-        model_a, metadata = whisperx.load_align_model(language_code=self.result_trans["language"], device=self.device)
-        self.result_align = whisperx.align(self.result_trans["segments"], model_a, metadata, self.audio_file, self.device, return_char_alignments=False)
+
+        def compute():
+            model_a, metadata = load_align_model(self.result_trans["language"], self.device)
+            return whisperx.align(self.result_trans["segments"], model_a, metadata, self.load_audio(), self.device, return_char_alignments=False)
+
+        # Keyed like the transcription it aligns, which depends on the VAD method
+        self.result_align = self._cached("align", compute, vad=self.vad_method)
 
     def diarize_audio(self):
         import whisperx
         logging.info("Identify multiple speakers in audio.")
-        diarize_model = whisperx.DiarizationPipeline(use_auth_token= self.hugging_face_token , device=self.device)
-        
-        audio_data = whisperx.load_audio(self.audio_file)
-        self.diarize_segments = diarize_model(audio_data, min_speakers=2, max_speakers=2)
-        
-        logging.info(self.diarize_segments.speaker.unique())
-
-        uniq_speakers = self.diarize_segments.speaker.unique()
-        
-        final_result = whisperx.assign_word_speakers(self.diarize_segments, self.result_align)
-        
-        return final_result, uniq_speakers
+
+        sharded = bool(self.sharding_min_seconds) and self.audio_seconds() > self.sharding_min_seconds
+
+        def compute():
+            audio = self.speech_audio()
+            if sharded:
+                # Bounded memory and every core for long recordings; speakers are stitched by embedding
+                self.diarize_segments = diarize_sharded(audio, self.hugging_face_token, self.device,
+                                                        max_speakers=self.max_speakers)
+            else:
+                diarize_model = load_diarization_model(self.hugging_face_token, self.device)
+                self.diarize_segments = diarize_model(audio, min_speakers=self.min_speakers, max_speakers=self.max_speakers)
+            if self.speech_map is not None:
+                # Turns are mapped back before words are assigned, so output timestamps are unchanged
+                self.diarize_segments['start'] = self.speech_map.to_original(self.diarize_segments['start'].to_numpy())
+                self.diarize_segments['end'] = self.speech_map.to_original(self.diarize_segments['end'].to_numpy())
+
+            logging.info(self.diarize_segments.speaker.unique())
+
+            uniq_speakers = self.diarize_segments.speaker.unique()
+
+            final_result = whisperx.assign_word_speakers(self.diarize_segments, self.result_align)
+
+            return {"result": final_result, "speakers": list(uniq_speakers)}
+
+        # Sharded runs only enforce max_speakers, see diarize_sharded
+        cached = self._cached("diarize", compute, min_speakers=None if sharded else self.min_speakers, max_speakers=self.max_speakers,
+                              vad=self.vad_method, sharded=sharded)
+        return cached["result"], cached["speakers"]
+
+    def transcribe_stream(self, window_seconds=STREAM_WINDOW_SECONDS, overlap_seconds=STREAM_DIARIZATION_OVERLAP_SECONDS):
+        """
+        Transcribe, align and diarize the audio window by window, yielding segments as they are ready.
+
+        Windows are cut in silence found by the energy VAD. Each window is diarized together
+        with the `overlap_seconds` before it, and speaker labels are carried over from the
+        previous window by matching turns inside that overlap. Once the generator is exhausted
+        `self.stream_result` holds the same (final_result, uniq_speakers) pair as `diarize_audio`.
+        """
+        params = dict(window_seconds=window_seconds, overlap_seconds=overlap_seconds, max_speakers=self.max_speakers)
+        if self.result_cache is not None:
+            key = self.result_cache.key("stream", self.content_hash(), model=MODEL_NAME, compute_type=self.compute_type, **params)
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                logging.info("Replaying streamed transcription from the result cache.")
+                self.result_trans = {"duration": cached["duration"]}
+                self.result_align = cached["result"]
+                yield from self.result_align["segments"]
+                self.stream_result = (self.result_align, cached["speakers"])
+                return
+
+        import pandas as pd
+        import whisperx
+        max_speakers = self.max_speakers
+        audio = self.load_audio()
+        diarize_model = load_diarization_model(self.hugging_face_token, self.device)
+        model_a, metadata, language = None, None, None
+
+        tracker = SpeakerTracker(max_speakers)
+        segments, word_segments, diarize_frames = [], [], []
+
+        for start, end in split_into_windows(detect_speech_regions(audio), window_seconds):
+            if self.cancel_process:
+                break
+            chunk = audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+
+            result_trans = self.model.transcribe(chunk, batch_size=self.batch_size, language=language)
+            if not result_trans["segments"]:
+                continue
+            if language is None:
+                language = result_trans["language"]
+                model_a, metadata = load_align_model(language, self.device)
+            result_align = whisperx.align(result_trans["segments"], model_a, metadata, chunk, self.device, return_char_alignments=False)
+
+            # Diarize with some context before the window so labels can be matched across windows
+            context_start = max(0.0, start - overlap_seconds)
+            window_diarization = diarize_model(audio[int(context_start * SAMPLE_RATE):int(end * SAMPLE_RATE)], max_speakers=max_speakers)
+            window_diarization = window_diarization.copy()
+            window_diarization['start'] += context_start
+            window_diarization['end'] += context_start
+            window_diarization['speaker'] = window_diarization['speaker'].map(tracker.assign(window_diarization, context_start, start))
+
+            # Word assignment happens in window-relative time
+            relative_diarization = window_diarization.copy()
+            relative_diarization['start'] -= start
+            relative_diarization['end'] -= start
+            window_result = whisperx.assign_word_speakers(relative_diarization, result_align)
+            _shift_timestamps(window_result, start)
+
+            diarize_frames.append(window_diarization[window_diarization['end'] > start])
+            segments.extend(window_result["segments"])
+            word_segments.extend(window_result.get("word_segments", []))
+            for segment in window_result["segments"]:
+                yield segment
+
+        self.result_align = {"segments": segments, "word_segments": word_segments}
+        self.diarize_segments = pd.concat(diarize_frames, ignore_index=True) if diarize_frames else None
+        uniq_speakers = tracker.speakers
+        logging.info(uniq_speakers)
+        self.stream_result = (self.result_align, uniq_speakers)
+        if self.result_cache is not None and not self.cancel_process:
+            self.result_cache.put(key, {"result": self.result_align, "speakers": uniq_speakers,
+                                        "duration": len(audio) / SAMPLE_RATE})
 
     def save_to_json(self, result, filename='data.json'):
-        logging.info("Save transcription results to a JSON file.")
-        with open(filename, 'w') as json_file:
-            json.dump(result, json_file, indent=4)
+        """Save the results compactly, as msgpack when `filename` ends with .msgpack and JSON otherwise."""
+        logging.info("Save transcription results to a file.")
+        with track_stage("persist_result"):
+            save_result(result, filename)
         logging.info(f"Dictionary has been successfully stored in {filename}.")
 
+    def save_to_json_async(self, result, filename='data.json'):
+        """Save the results on a background thread, returning a Future."""
+        return _persistence_executor.submit(self.save_to_json, result, filename)
+
 
 # if __name__ == "__main__":
 #     audio_file_path = "chunk2.wav"
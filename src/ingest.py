@@ -0,0 +1,455 @@
+import asyncio
+import ipaddress
+import os
+import socket
+import subprocess
+import threading
+from urllib.parse import urlparse, urljoin
+from multipart.multipart import MultipartParser, parse_options_header
+from src.logger import logging
+from src.constants import (SAMPLE_RATE, FFMPEG_BINARY, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_BYTES, SNIFF_BYTES,
+                           STREAMABLE_AUDIO_FORMATS, YOUTUBE_AUDIO_MIME_TYPES, YOUTUBE_HOSTS, URL_FETCH_TIMEOUT_SECONDS,
+                           URL_INGEST_MAX_CONCURRENCY, URL_MAX_REDIRECTS, URL_ALLOWED_PRIVATE_HOSTS)
+
+
+class UnsupportedAudioFormat(Exception):
+    """Raised when an upload does not look like any supported audio container."""
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+
+class NormalizationFailed(Exception):
+    """Raised when ffmpeg can not decode an upload."""
+
+
+class FetchFailed(Exception):
+    """Raised when the audio behind a URL can not be downloaded."""
+
+
+class MissingUpload(Exception):
+    """Raised when a request carries no file to transcribe."""
+
+
+class URLNotAllowed(Exception):
+    """Raised for URLs that are not http(s) or point into private, loopback or link-local networks."""
+
+
+def sniff_format(header):
+    """Guess the container of an audio file from its first bytes, None when unknown."""
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav"
+    if header[:3] == b"ID3" or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return "mp3"
+    if header[:4] == b"fLaC":
+        return "flac"
+    if header[:4] == b"OggS":
+        return "ogg"
+    if header[4:8] == b"ftyp":
+        return "mp4"
+    if header[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if header[:4] == b"FORM" and header[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    if header[:6] == b"#!AMR\n":
+        return "amr"
+    return None
+
+
+def ffmpeg_normalize_command(source, destination, sample_rate=SAMPLE_RATE):
+    """ffmpeg arguments turning `source` (a path or pipe:0) into 16-bit mono PCM WAV at `sample_rate`."""
+    return [FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-i", source,
+            "-vn", "-ac", "1", "-ar", str(sample_rate), "-c:a", "pcm_s16le", "-f", "wav", destination]
+
+
+def normalize_audio_file(input_file_path, output_file_path, sample_rate=SAMPLE_RATE):
+    """Convert any audio file ffmpeg understands to 16 kHz mono PCM WAV without loading it into memory."""
+    process = subprocess.run(ffmpeg_normalize_command(input_file_path, output_file_path, sample_rate),
+                             stdin=subprocess.DEVNULL, capture_output=True)
+    if process.returncode != 0:
+        raise NormalizationFailed(process.stderr.decode(errors="replace").strip() or "ffmpeg failed")
+    return output_file_path
+
+
+async def ingest_upload(upload, destination, max_bytes=MAX_UPLOAD_BYTES, chunk_size=UPLOAD_CHUNK_BYTES):
+    """
+    Stream an uploaded file into `destination` as 16 kHz mono PCM WAV.
+
+    The upload is read in `chunk_size` pieces. Formats ffmpeg can decode from a pipe are
+    piped straight into it; others (MP4/M4A keep their index at the end) are spooled to
+    disk first. Unknown formats are rejected from the first bytes and oversized uploads as
+    soon as they cross `max_bytes`; partial output is removed in both cases.
+
+    :param upload: Object with an async `read(size)`, e.g. a `RequestFileReader`
+    :return: Number of bytes received
+    """
+    header = await upload.read(SNIFF_BYTES)
+    audio_format = sniff_format(header)
+    if audio_format is None:
+        raise UnsupportedAudioFormat("The upload is not a supported audio file.")
+
+    if audio_format in STREAMABLE_AUDIO_FORMATS:
+        process = await asyncio.create_subprocess_exec(*ffmpeg_normalize_command("pipe:0", destination),
+                                                       stdin=asyncio.subprocess.PIPE,
+                                                       stdout=asyncio.subprocess.DEVNULL,
+                                                       stderr=asyncio.subprocess.PIPE)
+        # Read stderr concurrently so a chatty ffmpeg never blocks on a full pipe
+        stderr_task = asyncio.create_task(process.stderr.read())
+
+        async def write(chunk):
+            process.stdin.write(chunk)
+            await process.stdin.drain()
+    else:
+        process, stderr_task = None, None
+        spool_path = f"{destination}.{audio_format}"
+        spool = open(spool_path, "wb")
+
+        async def write(chunk):
+            spool.write(chunk)
+
+    received = 0
+    try:
+        chunk = header
+        while chunk:
+            received += len(chunk)
+            if received > max_bytes:
+                raise UploadTooLarge(f"The upload exceeds the limit of {max_bytes // 2 ** 20} MB.")
+            try:
+                await write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                break  # ffmpeg gave up on the input, its exit status tells why
+            chunk = await upload.read(chunk_size)
+
+        if process is not None:
+            process.stdin.close()
+            stderr = await stderr_task
+            if await process.wait() != 0:
+                raise NormalizationFailed(stderr.decode(errors="replace").strip() or "ffmpeg failed")
+        else:
+            spool.close()
+            await asyncio.to_thread(normalize_audio_file, spool_path, destination)
+    except BaseException:
+        if process is not None and process.returncode is None:
+            process.kill()
+            await process.wait()
+        if os.path.exists(destination):
+            os.remove(destination)
+        raise
+    finally:
+        if process is None:
+            spool.close()
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+
+    logging.info(f"Ingested {received} bytes of {audio_format} audio into {destination}.")
+    return received
+
+
+class RequestFileReader:
+    """
+    Async `read(size)` over the file in an HTTP request body, parsed as the body arrives.
+
+    For `multipart/form-data` bodies this reads the content of the `field` part, and reading
+    stops once that part ends. Any other body is the file itself. Nothing is spooled, unlike
+    Starlette's form parsing, which writes the whole upload to a temporary file before the
+    endpoint runs. A body over `max_bytes` raises `UploadTooLarge` as soon as it crosses the
+    limit, whatever its Content-Length claims. `filename` is set once the part headers are read.
+
+    :param chunks: Async iterator of body chunks, e.g. Starlette's `request.stream()`
+    """
+    def __init__(self, chunks, content_type, field="file", max_bytes=MAX_UPLOAD_BYTES):
+        self._chunks = chunks.__aiter__()
+        self._buffer = bytearray()
+        self._received = 0
+        self._body_done = False
+        self.max_bytes = max_bytes
+        self.filename = None
+        self._parser = None
+        self._field = field.encode()
+        self._file_seen = False
+        self._file_done = False
+        self._in_file = False
+        self._header_field, self._header_value, self._headers = b"", b"", {}
+
+        media_type, options = parse_options_header(content_type or "")
+        self._multipart = media_type == b"multipart/form-data"
+        if self._multipart and options.get(b"boundary"):
+            self._parser = MultipartParser(options[b"boundary"], callbacks={
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+            })
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field, self._header_value = b"", b""
+
+    def _on_headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if params.get(b"name") == self._field and not self._file_seen:
+            self._file_seen = self._in_file = True
+            self.filename = params.get(b"filename", b"").decode("utf-8", errors="replace") or None
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            self._buffer += data[start:end]
+
+    def _on_part_end(self):
+        if self._in_file:
+            self._in_file = False
+            self._file_done = True
+
+    async def read(self, size):
+        if self._multipart and self._parser is None:
+            raise MissingUpload("The multipart request has no boundary.")
+        while len(self._buffer) < size and not self._body_done and not self._file_done:
+            try:
+                chunk = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                self._body_done = True
+                break
+            self._received += len(chunk)
+            if self._received > self.max_bytes:
+                raise UploadTooLarge(f"The upload exceeds the limit of {self.max_bytes // 2 ** 20} MB.")
+            if self._parser is not None:
+                self._parser.write(chunk)
+            else:
+                self._buffer += chunk
+        if self._parser is not None and not self._file_seen and (self._body_done or self._file_done):
+            raise MissingUpload(f"The request has no '{self._field.decode()}' file field.")
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class ChunkReader:
+    """
+    Async `read(size)` over a blocking iterator of byte chunks, such as an HTTP response body.
+
+    Every chunk is pulled on a worker thread, so slow downloads never block the event loop.
+    `close()` closes a generator, and with it the download, when reading stops early.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def close(self):
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+
+    async def read(self, size):
+        while len(self._buffer) < size:
+            chunk = await asyncio.to_thread(next, self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _http_session():
+    """Process-wide requests session, so URLs on the same host reuse connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            adapter = _public_address_adapter(HTTPAdapter)(pool_connections=URL_INGEST_MAX_CONCURRENCY,
+                                                           pool_maxsize=URL_INGEST_MAX_CONCURRENCY)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def _public_address_adapter(adapter_class):
+    """
+    Subclass of the requests `adapter_class` whose connections refuse non-public peers.
+
+    `check_url` resolves the host before the request, but the connection resolves it again,
+    and a DNS answer that changes in between (DNS rebinding) could point it at an internal
+    address. The address actually connected to is therefore checked too, before anything is
+    sent. Hosts in `URL_ALLOWED_PRIVATE_HOSTS` are exempt, as in `check_url`.
+    """
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class PublicPeerMixin:
+        def _new_conn(self):
+            sock = super()._new_conn()
+            if self.host.lower() not in URL_ALLOWED_PRIVATE_HOSTS:
+                try:
+                    _check_address(sock.getpeername()[0])
+                except URLNotAllowed:
+                    sock.close()
+                    raise
+            return sock
+
+    class PublicHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = type("PublicHTTPConnection", (PublicPeerMixin, HTTPConnection), {})
+
+    class PublicHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = type("PublicHTTPSConnection", (PublicPeerMixin, HTTPSConnection), {})
+
+    class PublicAddressAdapter(adapter_class):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {"http": PublicHTTPConnectionPool, "https": PublicHTTPSConnectionPool}
+
+    return PublicAddressAdapter
+
+
+def _check_address(address):
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if getattr(ip, "ipv4_mapped", None):
+        ip = ip.ipv4_mapped
+    if not ip.is_global:
+        raise URLNotAllowed("The URL points to a private or local network address.")
+
+
+def check_url(url, allowed_hosts=None):
+    """
+    Refuse URLs the server should not fetch on behalf of a client.
+
+    Only http and https are accepted, and every address the host resolves to must be
+    public unless the host is in `allowed_hosts` (`URL_ALLOWED_PRIVATE_HOSTS` by default).
+    This keeps cloud metadata endpoints, localhost and internal services out of reach.
+    """
+    allowed_hosts = URL_ALLOWED_PRIVATE_HOSTS if allowed_hosts is None else allowed_hosts
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise URLNotAllowed("Only http and https URLs are supported.")
+    host = parsed.hostname.lower()
+    if host in allowed_hosts:
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parsed.port or parsed.scheme, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise FetchFailed(f"Could not resolve {host}: {e}") from e
+    for address in addresses:
+        _check_address(address)
+
+
+def iter_http_chunks(url, chunk_size=UPLOAD_CHUNK_BYTES, timeout=URL_FETCH_TIMEOUT_SECONDS, max_redirects=URL_MAX_REDIRECTS):
+    """
+    Yield the body of `url` in chunks as it downloads.
+
+    Every redirect target is checked like `url`, and every connection is checked again against
+    the address it actually reached (see `_public_address_adapter`).
+    """
+    import requests
+
+    response = None
+    try:
+        for _ in range(max_redirects + 1):
+            check_url(url)
+            response = _http_session().get(url, stream=True, timeout=timeout, allow_redirects=False)
+            if not response.is_redirect:
+                break
+            url = urljoin(url, response.headers["location"])
+            response.close()
+        else:
+            raise FetchFailed(f"Too many redirects fetching {url}.")
+        response.raise_for_status()
+        yield from response.iter_content(chunk_size)
+    except requests.RequestException as e:
+        raise FetchFailed(f"Could not download {url}: {e}") from e
+    finally:
+        # Also runs when the reader gives up early, e.g. on an oversized or undecodable download
+        if response is not None:
+            response.close()
+
+
+def is_youtube_url(url):
+    return (urlparse(url).hostname or "").lower() in YOUTUBE_HOSTS
+
+
+def youtube_audio_chunks(url, timeout=URL_FETCH_TIMEOUT_SECONDS):
+    """
+    Chunks of the best audio-only stream of a YouTube video.
+
+    Only the audio stream is downloaded. pytube fetches it in ranged requests, which YouTube
+    does not throttle the way it throttles a single long download.
+    """
+    from pytube import YouTube, request
+
+    try:
+        streams = YouTube(url).streams.filter(only_audio=True)
+        candidates = [stream for stream in streams if stream.mime_type in YOUTUBE_AUDIO_MIME_TYPES]
+    except Exception as e:
+        raise FetchFailed(f"Could not resolve the audio stream of {url}: {e}") from e
+    if not candidates:
+        raise FetchFailed(f"{url} has no audio-only stream.")
+    # Preferred container first, then the highest bitrate
+    stream = min(candidates, key=lambda stream: (YOUTUBE_AUDIO_MIME_TYPES.index(stream.mime_type),
+                                                 -int(stream.abr[:-len("kbps")]) if stream.abr else 0))
+    logging.info(f"Streaming {stream.mime_type} audio at {stream.abr} from {url}.")
+
+    def chunks():
+        download = request.stream(stream.url, timeout=timeout)
+        try:
+            yield from download
+        except Exception as e:
+            raise FetchFailed(f"Could not download the audio of {url}: {e}") from e
+        finally:
+            download.close()
+    return chunks()
+
+
+async def ingest_url(url, destination, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Download the audio behind `url` straight into `destination` as 16 kHz mono PCM WAV.
+
+    YouTube links are resolved to their audio-only stream; any other URL is fetched as is,
+    once `check_url` accepts it and each of its redirects.
+    The download is decoded as it arrives (see `ingest_upload`), without an intermediate
+    file or re-encode for formats ffmpeg can read from a pipe.
+
+    :return: Number of bytes downloaded
+    """
+    if is_youtube_url(url):
+        chunks = await asyncio.to_thread(youtube_audio_chunks, url)
+    else:
+        chunks = iter_http_chunks(url)
+    reader = ChunkReader(chunks)
+    try:
+        return await ingest_upload(reader, destination, max_bytes)
+    finally:
+        await asyncio.to_thread(reader.close)
+
+
+async def ingest_urls(urls, directory, max_concurrency=URL_INGEST_MAX_CONCURRENCY, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Ingest many URLs concurrently into `directory`, at most `max_concurrency` at a time.
+
+    :return: One entry per URL, in order: the WAV path, or the exception that stopped it
+    """
+    os.makedirs(directory, exist_ok=True)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def ingest(index, url):
+        destination = os.path.join(directory, f"url_{index:05d}.wav")
+        async with semaphore:
+            await ingest_url(url, destination, max_bytes)
+        return destination
+
+    return await asyncio.gather(*(ingest(index, url) for index, url in enumerate(urls)), return_exceptions=True)
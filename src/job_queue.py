@@ -0,0 +1,541 @@
+"""
+Broker-backed transcription job queue shared by the HTTP tier and standalone workers.
+
+Brokers (`SQLiteBroker`, `RedisBroker`) expose the same methods:
+
+- `enqueue(job_id, payload)` adds a job.
+- `lease(worker_id, lease_seconds)` hands the oldest due job to a worker, or returns None.
+- `heartbeat(job_id, worker_id, lease_seconds)` extends a lease; False means the lease was lost.
+- `complete(job_id, worker_id, result)` stores the result of a leased job; False when the worker
+  no longer holds the lease.
+- `fail(job_id, worker_id, error)` retries the job with exponential backoff. Once `max_attempts`
+  is used up the job is dead-lettered instead.
+- `publish(job_id, message, event=None)` and `events_since(job_id, cursor)` carry progress events.
+  The events of a finished job are dropped `event_retention_seconds` after it finished.
+- `completed_since(since, limit)` lists `(job_id, finished_at)` of jobs completed after `since`.
+- `get(job_id)`, `latest_completed()`, `depth()` and `dead_letters()` are for inspection.
+
+Leases that expire without a heartbeat (a crashed worker) put the job back in the queue.
+Expiry counts as a failed attempt, and the expired lease can no longer be renewed or completed.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from src.logger import logging
+from src.jobs import stream_job_events
+from src.constants import (JOB_MAX_ATTEMPTS, JOB_RETRY_BACKOFF_SECONDS, JOB_LEASE_SECONDS, JOB_QUEUE_MAX_PENDING,
+                           JOB_INDEX_POLL_SECONDS, JOB_EVENT_RETENTION_SECONDS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue_jobs (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_expires_at REAL,
+    worker_id TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS queue_jobs_due ON queue_jobs(status, available_at);
+CREATE INDEX IF NOT EXISTS queue_jobs_finished ON queue_jobs(status, finished_at);
+CREATE TABLE IF NOT EXISTS queue_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    event TEXT,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS queue_events_job ON queue_events(job_id, seq);
+"""
+
+JOB_FIELDS = ("id", "payload", "status", "attempts", "max_attempts", "worker_id", "result", "error",
+              "created_at", "started_at", "finished_at")
+
+
+def retry_delay(attempts, backoff_seconds=JOB_RETRY_BACKOFF_SECONDS):
+    return backoff_seconds * 2 ** max(0, attempts - 1)
+
+
+class SQLiteBroker:
+    """
+    Job broker on a SQLite database, for a single machine or a shared volume.
+
+    Leases are taken in `BEGIN IMMEDIATE` transactions, so concurrent workers never
+    receive the same job. Every completion also deletes the events of jobs that finished
+    more than `event_retention_seconds` ago.
+    """
+    def __init__(self, path, max_attempts=JOB_MAX_ATTEMPTS, backoff_seconds=JOB_RETRY_BACKOFF_SECONDS,
+                 event_retention_seconds=JOB_EVENT_RETENTION_SECONDS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.event_retention_seconds = event_retention_seconds
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    @staticmethod
+    def _decode(row):
+        if row is None:
+            return None
+        job = {field: row[field] for field in JOB_FIELDS}
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def enqueue(self, job_id, payload):
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO queue_jobs (id, payload, status, max_attempts, available_at, created_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(payload), self.max_attempts, now, now),
+            )
+        return job_id
+
+    def lease(self, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        now = time.time()
+        with self._transaction() as connection:
+            # Jobs of workers that stopped sending heartbeats count as failed attempts
+            for row in connection.execute("SELECT id, attempts, max_attempts FROM queue_jobs "
+                                          "WHERE status = 'running' AND lease_expires_at < ?", (now,)).fetchall():
+                logging.warning(f"Lease of job {row['id']} expired.")
+                self._retry_or_bury(connection, row, "Lease expired", now)
+
+            row = connection.execute("SELECT id FROM queue_jobs WHERE status = 'queued' AND available_at <= ? "
+                                     "ORDER BY available_at, created_at LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE queue_jobs SET status = 'running', attempts = attempts + 1, worker_id = ?, "
+                "lease_expires_at = ?, started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row["id"]),
+            )
+            return self._decode(connection.execute("SELECT * FROM queue_jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    # A lease past its expiry is lost even before another worker's `lease` call reclaims it
+    _HOLDS_LEASE = "id = ? AND worker_id = ? AND status = 'running' AND lease_expires_at >= ?"
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(f"UPDATE queue_jobs SET lease_expires_at = ? WHERE {self._HOLDS_LEASE}",
+                                        (now + lease_seconds, job_id, worker_id, now))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result):
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE queue_jobs SET status = 'completed', result = ?, error = NULL, finished_at = ?, "
+                f"lease_expires_at = NULL WHERE {self._HOLDS_LEASE}",
+                (json.dumps(result), now, job_id, worker_id, now),
+            )
+            self._prune_events(connection, now)
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Record a failed attempt; returns True when the job was dead-lettered."""
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(f"SELECT id, attempts, max_attempts FROM queue_jobs WHERE {self._HOLDS_LEASE}",
+                                     (job_id, worker_id, now)).fetchone()
+            if row is None:
+                return False
+            return self._retry_or_bury(connection, row, error, now)
+
+    def _prune_events(self, connection, now):
+        connection.execute("DELETE FROM queue_events WHERE job_id IN (SELECT id FROM queue_jobs "
+                           "WHERE status IN ('completed', 'failed') AND finished_at < ?)",
+                           (now - self.event_retention_seconds,))
+
+    def _retry_or_bury(self, connection, row, error, now):
+        if row["attempts"] >= row["max_attempts"]:
+            connection.execute("UPDATE queue_jobs SET status = 'failed', error = ?, finished_at = ?, "
+                               "lease_expires_at = NULL WHERE id = ?", (error, now, row["id"]))
+            logging.error(f"Job {row['id']} dead-lettered after {row['attempts']} attempts: {error}")
+            return True
+        connection.execute("UPDATE queue_jobs SET status = 'queued', error = ?, worker_id = NULL, lease_expires_at = NULL, "
+                           "available_at = ? WHERE id = ?",
+                           (error, now + retry_delay(row["attempts"], self.backoff_seconds), row["id"]))
+        return False
+
+    def publish(self, job_id, message, event=None):
+        self._connection().execute("INSERT INTO queue_events (job_id, event, message) VALUES (?, ?, ?)",
+                                   (job_id, event, message))
+
+    def events_since(self, job_id, cursor):
+        rows = self._connection().execute("SELECT event, message FROM queue_events WHERE job_id = ? "
+                                          "ORDER BY seq LIMIT -1 OFFSET ?", (job_id, cursor)).fetchall()
+        return [(row["event"], row["message"]) for row in rows]
+
+    def get(self, job_id):
+        return self._decode(self._connection().execute("SELECT * FROM queue_jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def latest_completed(self):
+        row = self._connection().execute("SELECT id FROM queue_jobs WHERE status = 'completed' "
+                                         "ORDER BY finished_at DESC LIMIT 1").fetchone()
+        return None if row is None else row["id"]
+
+    def completed_since(self, since, limit=100):
+        rows = self._connection().execute("SELECT id, finished_at FROM queue_jobs WHERE status = 'completed' "
+                                          "AND finished_at > ? ORDER BY finished_at LIMIT ?", (since, limit)).fetchall()
+        return [(row["id"], row["finished_at"]) for row in rows]
+
+    def depth(self):
+        """Number of jobs queued or running."""
+        return self._connection().execute("SELECT COUNT(*) FROM queue_jobs "
+                                          "WHERE status IN ('queued', 'running')").fetchone()[0]
+
+    def dead_letters(self):
+        rows = self._connection().execute("SELECT * FROM queue_jobs WHERE status = 'failed' ORDER BY finished_at").fetchall()
+        return [self._decode(row) for row in rows]
+
+
+# Lua scripts keep every state transition atomic on the Redis server
+_REDIS_RETRY_OR_BURY = """
+local function retry_or_bury(prefix, id, error, now, backoff, retention)
+    local key = prefix .. 'job:' .. id
+    redis.call('ZREM', prefix .. 'leases', id)
+    local attempts = tonumber(redis.call('HGET', key, 'attempts'))
+    if attempts >= tonumber(redis.call('HGET', key, 'max_attempts')) then
+        redis.call('HSET', key, 'status', 'failed', 'error', error, 'finished_at', now)
+        redis.call('HDEL', key, 'lease_expires_at')
+        redis.call('RPUSH', prefix .. 'dead', id)
+        redis.call('EXPIRE', prefix .. 'events:' .. id, retention)
+        return 1
+    end
+    redis.call('HSET', key, 'status', 'queued', 'error', error)
+    redis.call('HDEL', key, 'worker_id', 'lease_expires_at')
+    redis.call('ZADD', prefix .. 'ready', now + backoff * 2 ^ math.max(0, attempts - 1), id)
+    return 0
+end
+"""
+
+_REDIS_LEASE = _REDIS_RETRY_OR_BURY + """
+local prefix, now, lease_seconds, worker_id, backoff = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3]), ARGV[4], tonumber(ARGV[5])
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', prefix .. 'leases', '-inf', now)) do
+    retry_or_bury(prefix, id, 'Lease expired', now, backoff, ARGV[6])
+end
+local due = redis.call('ZRANGEBYSCORE', prefix .. 'ready', '-inf', now, 'LIMIT', 0, 1)
+if #due == 0 then
+    return false
+end
+local id = due[1]
+local key = prefix .. 'job:' .. id
+redis.call('ZREM', prefix .. 'ready', id)
+redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('HSET', key, 'status', 'running', 'worker_id', worker_id, 'lease_expires_at', now + lease_seconds)
+redis.call('HSETNX', key, 'started_at', now)
+redis.call('ZADD', prefix .. 'leases', now + lease_seconds, id)
+return id
+"""
+
+_REDIS_OWNS = """
+local prefix, id, worker_id = ARGV[1], ARGV[2], ARGV[3]
+local key = prefix .. 'job:' .. id
+if redis.call('HGET', key, 'worker_id') ~= worker_id or redis.call('HGET', key, 'status') ~= 'running'
+        or tonumber(redis.call('HGET', key, 'lease_expires_at')) < tonumber(ARGV[4]) then
+    return -1
+end
+"""
+
+_REDIS_HEARTBEAT = _REDIS_OWNS + """
+local expires = tonumber(ARGV[4]) + tonumber(ARGV[5])
+redis.call('HSET', key, 'lease_expires_at', expires)
+redis.call('ZADD', prefix .. 'leases', expires, id)
+return 1
+"""
+
+_REDIS_COMPLETE = _REDIS_OWNS + """
+redis.call('HSET', key, 'status', 'completed', 'result', ARGV[5], 'finished_at', ARGV[4])
+redis.call('HDEL', key, 'error', 'lease_expires_at')
+redis.call('ZREM', prefix .. 'leases', id)
+redis.call('ZADD', prefix .. 'completed', ARGV[4], id)
+redis.call('EXPIRE', prefix .. 'events:' .. id, ARGV[6])
+return 1
+"""
+
+_REDIS_FAIL = _REDIS_RETRY_OR_BURY + _REDIS_OWNS + """
+return retry_or_bury(prefix, id, ARGV[5], tonumber(ARGV[4]), tonumber(ARGV[6]), ARGV[7])
+"""
+
+
+class RedisBroker:
+    """
+    Job broker on Redis, or any server speaking its protocol and Lua scripting, for
+    workers spread across machines. Needs the optional `redis` package.
+
+    Keys live under `prefix`: `job:<id>` hashes, the `ready` (by due time), `leases`
+    (by expiry) and `completed` sorted sets, the `dead` list and `events:<id>` lists. The events
+    list of a finished job expires `event_retention_seconds` after it finished.
+    """
+    def __init__(self, url, prefix="stt:", max_attempts=JOB_MAX_ATTEMPTS, backoff_seconds=JOB_RETRY_BACKOFF_SECONDS,
+                 event_retention_seconds=JOB_EVENT_RETENTION_SECONDS):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.event_retention_seconds = event_retention_seconds
+        self._lease = self.client.register_script(_REDIS_LEASE)
+        self._heartbeat = self.client.register_script(_REDIS_HEARTBEAT)
+        self._complete = self.client.register_script(_REDIS_COMPLETE)
+        self._fail = self.client.register_script(_REDIS_FAIL)
+
+    def _key(self, *parts):
+        return self.prefix + ":".join(parts)
+
+    def enqueue(self, job_id, payload):
+        now = time.time()
+        pipeline = self.client.pipeline()
+        pipeline.hset(self._key("job", job_id), mapping={
+            "id": job_id, "payload": json.dumps(payload), "status": "queued", "attempts": 0,
+            "max_attempts": self.max_attempts, "created_at": now,
+        })
+        pipeline.zadd(self._key("ready"), {job_id: now})
+        pipeline.execute()
+        return job_id
+
+    def lease(self, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        job_id = self._lease(args=[self.prefix, time.time(), lease_seconds, worker_id, self.backoff_seconds,
+                                   self.event_retention_seconds])
+        return self.get(job_id) if job_id else None
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        return self._heartbeat(args=[self.prefix, job_id, worker_id, time.time(), lease_seconds]) == 1
+
+    def complete(self, job_id, worker_id, result):
+        return self._complete(args=[self.prefix, job_id, worker_id, time.time(), json.dumps(result),
+                                    self.event_retention_seconds]) == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Record a failed attempt; returns True when the job was dead-lettered."""
+        return self._fail(args=[self.prefix, job_id, worker_id, time.time(), error, self.backoff_seconds,
+                                self.event_retention_seconds]) == 1
+
+    def publish(self, job_id, message, event=None):
+        self.client.rpush(self._key("events", job_id), json.dumps([event, message]))
+
+    def events_since(self, job_id, cursor):
+        return [tuple(json.loads(item)) for item in self.client.lrange(self._key("events", job_id), cursor, -1)]
+
+    def get(self, job_id):
+        data = self.client.hgetall(self._key("job", job_id))
+        if not data:
+            return None
+        job = {field: data.get(field) for field in JOB_FIELDS}
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        job["attempts"], job["max_attempts"] = int(job["attempts"]), int(job["max_attempts"])
+        for field in ("created_at", "started_at", "finished_at"):
+            job[field] = float(job[field]) if job[field] is not None else None
+        return job
+
+    def latest_completed(self):
+        latest = self.client.zrevrange(self._key("completed"), 0, 0)
+        return latest[0] if latest else None
+
+    def completed_since(self, since, limit=100):
+        return self.client.zrangebyscore(self._key("completed"), f"({since}", "+inf", start=0, num=limit, withscores=True)
+
+    def depth(self):
+        return self.client.zcard(self._key("ready")) + self.client.zcard(self._key("leases"))
+
+    def dead_letters(self):
+        return [self.get(job_id) for job_id in self.client.lrange(self._key("dead"), 0, -1)]
+
+
+def build_broker(url):
+    """Broker for `sqlite:///path/to/jobs.db` or `redis://host:port/db` URLs."""
+    if url.startswith("sqlite:///"):
+        return SQLiteBroker(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    raise ValueError(f"Unsupported job broker URL: {url}")
+
+
+def stage_audio(local_path, job_id, audio_uri, s3_sync=None):
+    """
+    Make an uploaded recording reachable by every worker.
+
+    :param audio_uri: `s3://bucket/prefix` or a directory on shared storage
+    :return: URI of the staged copy
+    """
+    if audio_uri.startswith("s3://"):
+        bucket, _, prefix = audio_uri[len("s3://"):].partition("/")
+        key = f"{prefix.rstrip('/')}/{job_id}.wav" if prefix else f"{job_id}.wav"
+        s3_sync.upload_file(local_path, bucket, key)
+        return f"s3://{bucket}/{key}"
+    os.makedirs(audio_uri, exist_ok=True)
+    destination = os.path.join(audio_uri, f"{job_id}.wav")
+    shutil.move(local_path, destination)
+    return destination
+
+
+def fetch_audio(uri, destination, s3_sync=None):
+    if uri.startswith("s3://"):
+        bucket, _, key = uri[len("s3://"):].partition("/")
+        s3_sync.s3_client.download_file(bucket, key, destination, Config=s3_sync.transfer_config)
+    else:
+        shutil.copyfile(uri, destination)
+    return destination
+
+
+def discard_audio(uri, s3_sync=None):
+    if uri.startswith("s3://"):
+        bucket, _, key = uri[len("s3://"):].partition("/")
+        s3_sync.s3_client.delete_object(Bucket=bucket, Key=key)
+    elif os.path.exists(uri):
+        os.remove(uri)
+
+
+class BrokerJob:
+    """Job-like view of a queued job, so the HTTP endpoints treat local and remote jobs alike."""
+    def __init__(self, broker, job_id):
+        self.broker = broker
+        self.id = job_id
+        self._result = None
+
+    def _record(self):
+        return self.broker.get(self.id) or {}
+
+    @property
+    def status(self):
+        return self._record().get("status")
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "failed")
+
+    @property
+    def result(self):
+        if self._result is None:
+            data = self._record().get("result")
+            if data is not None:
+                from src.pipeline import deserialize_result
+                self._result = deserialize_result(data)
+        return self._result
+
+    def events_since(self, cursor):
+        return self.broker.events_since(self.id, cursor)
+
+    def to_dict(self):
+        record = self._record()
+        return {
+            "job_id": self.id,
+            "status": record.get("status"),
+            "created_at": record.get("created_at"),
+            "started_at": record.get("started_at"),
+            "finished_at": record.get("finished_at"),
+            "error": record.get("error"),
+            "attempts": record.get("attempts"),
+        }
+
+
+class RemoteJobManager:
+    """
+    Producer side of the broker queue with the read interface of `JobManager`.
+
+    Jobs are only enqueued here; standalone workers (`python -m src.worker`) run them.
+    Once started, transcripts of jobs the workers complete are indexed in `transcript_store`,
+    so search on this node covers them.
+    """
+    def __init__(self, broker, max_pending=JOB_QUEUE_MAX_PENDING, transcript_store=None,
+                 index_poll_seconds=JOB_INDEX_POLL_SECONDS):
+        self.broker = broker
+        self.max_pending = max_pending
+        self.transcript_store = transcript_store
+        self.index_poll_seconds = index_poll_seconds
+        self._index_cursor = 0.0
+        self._stopping = threading.Event()
+        self._indexer = None
+
+    def start(self):
+        if self.transcript_store is not None and self._indexer is None:
+            self._indexer = threading.Thread(target=self._index_completed, name="transcript-indexer", daemon=True)
+            self._indexer.start()
+
+    def _index_completed(self):
+        while not self._stopping.is_set():
+            try:
+                if self.index_completed():
+                    continue  # More may be waiting beyond the page
+            except Exception as e:
+                logging.exception(f"Indexing completed jobs failed: {e}")
+            self._stopping.wait(self.index_poll_seconds)
+
+    def index_completed(self, limit=100):
+        """Store the transcripts of jobs completed since the last call; returns True when a full page was read."""
+        from src.pipeline import deserialize_result
+
+        completed = self.broker.completed_since(self._index_cursor, limit)
+        for job_id, finished_at in completed:
+            # Jobs completed before a restart are only stored once
+            if self.transcript_store.get_recording(job_id) is None:
+                record = self.broker.get(job_id)
+                result = deserialize_result(record["result"])
+                self.transcript_store.ingest(job_id, result['transcript'], result['summary_data'],
+                                             result['audio_duration'], record["payload"].get("filename"))
+            self._index_cursor = finished_at
+        return len(completed) == limit
+
+    def active_count(self):
+        return self.broker.depth()
+
+    def is_full(self):
+        return self.active_count() >= self.max_pending
+
+    def enqueue(self, payload, job_id=None):
+        job_id = job_id or uuid.uuid4().hex
+        self.broker.enqueue(job_id, payload)
+        self.broker.publish(job_id, "Job queued")
+        return BrokerJob(self.broker, job_id)
+
+    def get(self, job_id):
+        return BrokerJob(self.broker, job_id) if self.broker.get(job_id) is not None else None
+
+    def latest_completed(self):
+        job_id = self.broker.latest_completed()
+        return None if job_id is None else BrokerJob(self.broker, job_id)
+
+    async def stream_events(self, job, poll_interval=0.5):
+        async for event in stream_job_events(job, poll_interval):
+            yield event
+
+    def shutdown(self, wait=False):
+        self._stopping.set()
+        if wait and self._indexer is not None:
+            self._indexer.join()
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.logger import logging
+from src.metrics import metrics
+from src.constants import JOB_MAX_WORKERS, JOB_MAX_PENDING, JOB_MAX_STORED_RESULTS, JOB_MAX_IO_WORKERS
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while every worker and queue slot is taken."""
+
+
+class Job:
+    def __init__(self, job_id, io_bound=False):
+        self.id = job_id
+        self.io_bound = io_bound
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self._lock = threading.Lock()
+
+    def publish(self, message, event=None):
+        """Append a progress message to the job's event log, `event` names non-status events."""
+        with self._lock:
+            self.events.append((event, message))
+
+    def events_since(self, cursor):
+        with self._lock:
+            return self.events[cursor:]
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "failed")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Runs pipeline jobs on a bounded thread pool and keeps per-job results.
+
+    At most `max_workers` jobs run at once and at most `max_pending` wait for a
+    worker; further submissions raise `JobQueueFull` so callers can apply back-pressure.
+    Jobs submitted with `io_bound=True` (e.g. transcribed by a remote service) run on a
+    separate pool of `max_io_workers` threads with the same `max_pending`, so they never
+    hold a CPU worker slot or count towards the local backlog.
+    """
+    def __init__(self, max_workers=JOB_MAX_WORKERS, max_pending=JOB_MAX_PENDING, max_stored_results=JOB_MAX_STORED_RESULTS,
+                 max_io_workers=JOB_MAX_IO_WORKERS):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_stored_results = max_stored_results
+        self.max_io_workers = max_io_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcription-job")
+        self._io_executor = ThreadPoolExecutor(max_workers=max_io_workers, thread_name_prefix="remote-transcription-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _active(self, io_bound=None):
+        return sum(1 for job in self._jobs.values() if not job.finished and io_bound in (None, job.io_bound))
+
+    def _capacity(self, io_bound):
+        return (self.max_io_workers if io_bound else self.max_workers) + self.max_pending
+
+    def active_count(self):
+        with self._lock:
+            return self._active()
+
+    def local_backlog(self):
+        """Jobs queued or running on the CPU workers."""
+        with self._lock:
+            return self._active(io_bound=False)
+
+    def is_full(self, io_bound=False):
+        with self._lock:
+            return self._active(io_bound) >= self._capacity(io_bound)
+
+    def submit(self, fn, *args, job_id=None, io_bound=False, **kwargs):
+        """
+        Queue `fn(*args, progress=job.publish, **kwargs)` and return the new job.
+
+        The value returned by `fn` becomes the job result. A random id is used unless `job_id` is given.
+        """
+        with self._lock:
+            active = self._active(io_bound)
+            if active >= self._capacity(io_bound):
+                raise JobQueueFull(f"{active} {'remote' if io_bound else 'local'} jobs already queued or running.")
+            job = Job(job_id or uuid.uuid4().hex, io_bound=io_bound)
+            self._jobs[job.id] = job
+            self._prune()
+
+        job.publish("Job queued")
+        (self._io_executor if io_bound else self._executor).submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def run_on_workers(self, fn, *args, **kwargs):
+        """Run `fn` on the CPU workers and wait for its result, for I/O-bound jobs that fall back to local work."""
+        return self._executor.submit(fn, *args, **kwargs).result()
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        queue_wait = job.started_at - job.created_at
+        metrics.observe_queue_wait(queue_wait)
+        job.publish(json.dumps({"stage": "queue_wait", "duration": round(queue_wait, 4)}), event="metrics")
+        logging.info(f"Job {job.id} started after waiting {queue_wait:.2f} seconds.")
+        try:
+            job.result = fn(*args, progress=job.publish, **kwargs)
+            job.finished_at = time.time()
+            # Publish before flipping the status so streams never miss the final event
+            job.publish("Processing complete")
+            job.status = "completed"
+        except Exception as e:
+            logging.exception(f"Job {job.id} failed: {e}")
+            job.error = str(e)
+            job.finished_at = time.time()
+            job.publish(f"Processing failed: {e}")
+            job.status = "failed"
+
+    def _prune(self):
+        """Forget the oldest finished jobs once more than `max_stored_results` are kept."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_stored_results)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest_completed(self):
+        with self._lock:
+            completed = [job for job in self._jobs.values() if job.status == "completed"]
+        return max(completed, key=lambda job: job.finished_at, default=None)
+
+    async def stream_events(self, job, poll_interval=0.2):
+        async for event in stream_job_events(job, poll_interval):
+            yield event
+
+    def shutdown(self, wait=False):
+        self._io_executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+async def stream_job_events(job, poll_interval=0.2):
+    """Yield the job's progress messages as server-sent events until it finishes."""
+    cursor = 0
+    while True:
+        finished = job.finished
+        events = job.events_since(cursor)
+        cursor += len(events)
+        for event, message in events:
+            if event:
+                yield f"event: {event}\ndata: {message}\n\n"
+            else:
+                yield f"data: {message}\n\n"
+        if finished:
+            break
+        await asyncio.sleep(poll_interval)
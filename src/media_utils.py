@@ -0,0 +1,22 @@
+import asyncio
+import uuid
+from src.ingest import ingest_url
+from src.asr_backends import get_remote_backend, RemoteTranscriptionFailed
+
+
+def extract_audio_from_youtube(youtube_url, audio_path=None):
+    """Stream the audio of a YouTube video into a 16 kHz mono WAV file and return its path."""
+    audio_path = audio_path or f"youtube_{uuid.uuid4().hex}.wav"
+    try:
+        asyncio.run(ingest_url(youtube_url, audio_path))
+        return audio_path
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+def get_transcript_using_assemblyai(assembly_api_key, mp3file_path):
+    # The backend is shared per API key, so no global SDK settings are touched
+    try:
+        result, _ = get_remote_backend("assemblyai", assembly_api_key).transcribe(mp3file_path)
+    except RemoteTranscriptionFailed as e:
+        return str(e)
+    return " ".join(segment["text"] for segment in result["segments"]).strip()
@@ -0,0 +1,154 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from src.logger import logging
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process over its whole lifetime so far.
+
+    The value never goes down, so it bounds rather than measures the memory of any
+    single step taken after the peak was reached.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    In-process pipeline metrics rendered in the Prometheus text format.
+
+    Records per-stage wall time, processed audio seconds, real-time factor (audio
+    seconds per wall second), failures and job queue wait.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_durations = {}
+        self.stage_audio_seconds = {}
+        self.stage_real_time_factor = {}
+        self.stage_failures = {}
+        self.queue_wait = Histogram()
+        self._gauges = {}
+
+    def record_stage(self, stage, duration, audio_seconds=None):
+        """
+        Record one finished stage and return its summary.
+
+        Memory is not part of it: the peak RSS is a process-wide high-water mark that can not be
+        attributed to a stage, and is exported once as the `process_peak_rss_bytes` gauge.
+        """
+        summary = {"stage": stage, "duration": round(duration, 4)}
+        with self._lock:
+            self.stage_durations.setdefault(stage, Histogram()).observe(duration)
+            if audio_seconds:
+                self.stage_audio_seconds[stage] = self.stage_audio_seconds.get(stage, 0.0) + audio_seconds
+                if duration > 0:
+                    self.stage_real_time_factor[stage] = audio_seconds / duration
+                    summary["real_time_factor"] = round(audio_seconds / duration, 2)
+        logging.info(f"Stage metrics: {summary}")
+        return summary
+
+    def record_failure(self, stage):
+        with self._lock:
+            self.stage_failures[stage] = self.stage_failures.get(stage, 0) + 1
+
+    def observe_queue_wait(self, seconds):
+        with self._lock:
+            self.queue_wait.observe(seconds)
+
+    def register_gauge(self, name, help_text, callback):
+        """Expose the value returned by `callback()` as a gauge on every scrape."""
+        self._gauges[name] = (help_text, callback)
+
+    def render(self):
+        lines = []
+
+        def histogram(name, help_text, histograms):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in histograms:
+                label_prefix = f"{labels}," if labels else ""
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f'{name}_bucket{{{label_prefix}le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{label_prefix}le="+Inf"}} {hist.count}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {hist.sum}")
+                lines.append(f"{name}_count{suffix} {hist.count}")
+
+        def per_stage(name, metric_type, help_text, values):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for stage, value in values.items():
+                lines.append(f'{name}{{stage="{stage}"}} {value}')
+
+        with self._lock:
+            histogram("pipeline_stage_duration_seconds", "Wall time of pipeline stages.",
+                      [(f'stage="{stage}"', hist) for stage, hist in self.stage_durations.items()])
+            per_stage("pipeline_stage_audio_seconds_total", "counter", "Seconds of audio processed by each stage.",
+                      self.stage_audio_seconds)
+            per_stage("pipeline_stage_real_time_factor", "gauge",
+                      "Audio seconds per wall second of the latest run of each stage.", self.stage_real_time_factor)
+            per_stage("pipeline_stage_failures_total", "counter", "Pipeline stage failures.", self.stage_failures)
+            histogram("pipeline_job_queue_wait_seconds", "Time jobs waited for a free worker.", [("", self.queue_wait)])
+
+        lines.append("# HELP process_peak_rss_bytes Peak resident set size of the process since it started.")
+        lines.append("# TYPE process_peak_rss_bytes gauge")
+        lines.append(f"process_peak_rss_bytes {peak_rss_bytes()}")
+        for name, (help_text, callback) in self._gauges.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {callback()}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def track_stage(stage, progress=None, audio_seconds=None):
+    """
+    Time the enclosed block as pipeline stage `stage`.
+
+    `audio_seconds` (a number or a callable evaluated when the stage ends) enables the
+    real-time factor. When `progress` is given, the stage summary is published to it
+    as a `metrics` event.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.record_failure(stage)
+        raise
+    duration = time.perf_counter() - start_time
+    seconds = audio_seconds() if callable(audio_seconds) else audio_seconds
+    summary = metrics.record_stage(stage, duration, seconds)
+    if progress is not None:
+        progress(json.dumps(summary), event="metrics")
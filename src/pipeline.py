@@ -0,0 +1,135 @@
+import json
+import os
+from src.logger import logging
+from src.constants import PERSIST_DIARIZED_RESULT, DIARIZED_RESULT_FILENAME
+from src.dairization import WhisperTranscriber
+from src.summarization import get_summarization_engine
+from src.transcript import Transcript
+from src.word_index import WordIndex
+from src.metrics import track_stage
+from src.audio import wav_seconds
+from src.asr_backends import LocalBackend
+
+
+def run_transcription_pipeline(workspace, progress, hugging_face_token, groq_api_key, artifact_uploader, device="cpu", stream=False,
+                               result_cache=None, transcript_store=None, filename=None, min_speakers=None, max_speakers=None,
+                               router=None, backend=None, run_local=None):
+    """
+    Run every stage of the transcription pipeline for the audio uploaded into a job workspace.
+
+    The workspace is removed once the job finishes, whether it succeeded or not.
+
+    :param workspace: JobWorkspace holding the uploaded audio file
+    :param progress: Callable receiving a status message whenever a stage starts or finishes
+    :param artifact_uploader: ArtifactUploader that ships the transcription files to S3 in the background
+    :param stream: Transcribe window by window and report each segment as a `segment` event
+    :param result_cache: Optional ResultCache reused for every stage and the summaries
+    :param transcript_store: Optional TranscriptStore the finished transcript is indexed in
+    :param filename: Original name of the uploaded file, kept with the stored transcript
+    :param min_speakers: Lower bound on the number of speakers, the configured default when None
+    :param max_speakers: Upper bound on the number of speakers, the configured default when None
+    :param router: Optional BackendRouter that may send the job to a remote speech-to-text service
+    :param backend: Backend the router already picked for this job; the router picks one when None
+    :param run_local: Optional `run_local(fn, *args, **kwargs)` running the local transcription, e.g. on a CPU
+                      worker pool when a remotely routed job falls back to local
+    :return: Dictionary with conversation, summary data and statistics
+    """
+    try:
+        result = _process_workspace(workspace, progress, hugging_face_token, groq_api_key, artifact_uploader,
+                                    device, stream, result_cache, min_speakers, max_speakers, router, backend, run_local)
+        if transcript_store is not None:
+            with track_stage("store_transcript", progress):
+                transcript_store.ingest(workspace.job_id, result['transcript'], result['summary_data'],
+                                        result['audio_duration'], filename)
+        return result
+    finally:
+        workspace.cleanup()
+
+
+def _process_workspace(workspace, progress, hugging_face_token, groq_api_key, artifact_uploader, device, stream, result_cache,
+                       min_speakers=None, max_speakers=None, router=None, backend=None, run_local=None):
+    transcriber = WhisperTranscriber(workspace.audio_path, hugging_face_token, device=device, result_cache=result_cache,
+                                     progress=progress, min_speakers=min_speakers, max_speakers=max_speakers)
+
+    if backend is None and router is not None:
+        backend = router.select(wav_seconds(workspace.audio_path), stream=stream)
+    remote = None
+    if backend is not None and not backend.local:
+        remote = _transcribe_remotely(router, backend, workspace, progress, min_speakers, max_speakers)
+    if remote is not None:
+        final_result, uniq_speakers = remote
+    else:
+        run_local = run_local or (lambda fn, *args, **kwargs: fn(*args, **kwargs))
+        final_result, uniq_speakers = run_local(
+            LocalBackend.run, transcriber, progress, stream,
+            on_segment=lambda segment: progress(json.dumps(segment_event(segment)), event="segment"))
+
+    # The diarized result stays in memory; storing it is optional and overlaps with the next steps
+    os.makedirs(workspace.transcriptions_dir, exist_ok=True)
+    persisted = None
+    if PERSIST_DIARIZED_RESULT:
+        persisted = transcriber.save_to_json_async(final_result, os.path.join(workspace.transcriptions_dir, DIARIZED_RESULT_FILENAME))
+
+    transcript = Transcript.from_result(final_result, uniq_speakers=uniq_speakers)
+    directory_path = transcript.write_exports(workspace.transcriptions_dir)
+    if persisted is not None:
+        persisted.result()
+    artifact_uploader.enqueue_folder(directory_path, prefix=workspace.s3_prefix)
+
+    progress("Generating summaries...")
+    with track_stage("summarization", progress):
+        summary_data = get_summarization_engine(groq_api_key).summarise_conversation(
+            transcript.speaker_texts, transcript.lines(), result_cache=result_cache)
+
+    # Duration in minutes, taken from the WAV header, the decoded waveform or the cached transcription
+    seconds = wav_seconds(workspace.audio_path) if remote is not None else None
+    audio_duration = round((seconds or transcriber.audio_seconds()) / 60, 2)
+
+    return {
+        'conversation': transcript.to_html(),
+        'summary_data': summary_data,
+        'audio_duration': audio_duration,
+        'total_words': transcript.total_words,
+        'words_by_speaker': transcript.words_by_speaker,
+        'word_index': WordIndex.from_result(final_result, transcript.speaker_map),
+        'transcript': transcript,
+    }
+
+
+def _transcribe_remotely(router, backend, workspace, progress, min_speakers, max_speakers):
+    """Transcribe on the remote `backend`, None when it fails and the job falls back to local."""
+    seconds = wav_seconds(workspace.audio_path)
+    progress(f"Transcribing audio with {backend.name}...")
+    try:
+        with track_stage(f"transcribe_{backend.name}", progress, seconds):
+            result = router.transcribe(backend, workspace.audio_path, seconds, min_speakers, max_speakers)
+    except Exception as e:
+        logging.warning(f"Remote transcription with {backend.name} failed, transcribing locally: {e}")
+        progress(f"{backend.name} failed, transcribing locally")
+        return None
+    progress("Transcription completed")
+    return result
+
+
+def serialize_result(result):
+    """JSON-serialisable form of a pipeline result, as stored by the job broker."""
+    data = {key: value for key, value in result.items() if key not in ('word_index', 'transcript')}
+    data['word_index'] = result['word_index'].to_dict()
+    data['transcript'] = result['transcript'].to_dict()
+    return data
+
+
+def deserialize_result(data):
+    """Inverse of `serialize_result`."""
+    return dict(data, word_index=WordIndex.from_dict(data['word_index']),
+                transcript=Transcript.from_dict(data['transcript']))
+
+
+def segment_event(segment):
+    """Compact view of an aligned, speaker-tagged segment sent to streaming clients."""
+    return {
+        "start": round(segment.get("start", 0.0), 3),
+        "end": round(segment.get("end", 0.0), 3),
+        "speaker": segment.get("speaker"),
+        "text": segment["text"].strip(),
+    }
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from src.logger import logging
+from src.constants import RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB, RESULT_CACHE_S3, RESULT_CACHE_S3_PREFIX, BUCKET_NAME
+
+
+def _to_builtin(value):
+    """JSON fallback for numpy scalars and arrays found in whisperx results."""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class DiskCacheBackend:
+    """
+    Stores cache entries as files, evicting the least recently used ones past `max_bytes`.
+
+    The size of the directory is scanned once and then counted as entries are written,
+    so the directory is only walked again when the count passes `max_bytes`.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._bytes = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        # The modification time doubles as the last access time for LRU eviction
+        os.utime(path)
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A unique temporary file per writer, so concurrent writes of one key never mix
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as file:
+            tmp_path = file.name
+            try:
+                file.write(data)
+            except BaseException:
+                file.close()
+                os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._bytes += len(data)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue  # Evicted or replaced meanwhile
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._bytes = total
+
+
+class S3CacheBackend:
+    """Stores cache entries as objects under `prefix` in an S3 bucket."""
+    def __init__(self, s3_sync, bucket_name, prefix=RESULT_CACHE_S3_PREFIX):
+        self.s3_sync = s3_sync
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    def get(self, key):
+        client = self.s3_sync.s3_client
+        try:
+            response = client.get_object(Bucket=self.bucket_name, Key=f"{self.prefix}/{key}")
+        except client.exceptions.NoSuchKey:
+            return None
+        return response['Body'].read()
+
+    def put(self, key, data):
+        self.s3_sync.s3_client.put_object(Bucket=self.bucket_name, Key=f"{self.prefix}/{key}", Body=data)
+
+    def delete(self, key):
+        self.s3_sync.s3_client.delete_object(Bucket=self.bucket_name, Key=f"{self.prefix}/{key}")
+
+
+class ResultCache:
+    """
+    Content-addressed cache of pipeline stage outputs.
+
+    Keys hash the stage name, the audio (or text) content hash and every setting that
+    changes the stage output, so each stage can be reused independently. Backends are
+    tried in order; a hit in a later backend is copied into the earlier ones.
+    """
+    def __init__(self, backends):
+        self.backends = backends
+
+    @staticmethod
+    def key(stage, content_hash, **params):
+        payload = json.dumps({"stage": stage, "content": content_hash, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        for i, backend in enumerate(self.backends):
+            try:
+                data = backend.get(key)
+            except Exception as e:
+                logging.warning(f"Result cache backend {type(backend).__name__} failed to read: {e}")
+                continue
+            if data is None:
+                continue
+            try:
+                value = json.loads(data)
+            except ValueError as e:
+                # A truncated or corrupt entry is a miss; drop it so it is recomputed
+                logging.warning(f"Discarding corrupt result cache entry {key} from {type(backend).__name__}: {e}")
+                try:
+                    backend.delete(key)
+                except Exception as e:
+                    logging.warning(f"Result cache backend {type(backend).__name__} failed to delete: {e}")
+                continue
+            for earlier in self.backends[:i]:
+                self._put_into(earlier, key, data)
+            return value
+        return None
+
+    def put(self, key, value):
+        data = json.dumps(value, default=_to_builtin).encode()
+        for backend in self.backends:
+            self._put_into(backend, key, data)
+
+    @staticmethod
+    def _put_into(backend, key, data):
+        try:
+            backend.put(key, data)
+        except Exception as e:
+            logging.warning(f"Result cache backend {type(backend).__name__} failed to write: {e}")
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for `key`, or compute, store and return it."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        else:
+            logging.info(f"Result cache hit for {key}.")
+        return value
+
+
+def build_result_cache(s3_sync=None):
+    """Create the cache configured by the RESULT_CACHE_* constants, or None when disabled."""
+    backends = []
+    if RESULT_CACHE_DIR:
+        backends.append(DiskCacheBackend(RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB * 1024 * 1024))
+    if RESULT_CACHE_S3 and s3_sync is not None:
+        backends.append(S3CacheBackend(s3_sync, BUCKET_NAME))
+    return ResultCache(backends) if backends else None
@@ -1,65 +1,183 @@
+import hashlib
 import os
-import boto3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+from src.logger import logging
+from src.constants import S3_MAX_WORKERS, S3_MULTIPART_THRESHOLD, S3_MULTIPART_CHUNKSIZE
+
+
+def local_etag(file_path, chunksize=S3_MULTIPART_CHUNKSIZE, threshold=S3_MULTIPART_THRESHOLD):
+    """Compute the ETag S3 assigns to `file_path` when uploaded with the given multipart settings."""
+    whole_digest = hashlib.md5()
+    part_digests = []
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunksize), b''):
+            whole_digest.update(chunk)
+            part_digests.append(hashlib.md5(chunk).digest())
+
+    if os.path.getsize(file_path) < threshold:
+        return whole_digest.hexdigest()
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+def _same_content(local_file_path, obj, mtime_matches):
+    """
+    Compare a local file with an S3 object listing entry.
+
+    Sizes are compared first, then `mtime_matches(local mtime, remote LastModified)`, and
+    only when that fails is the local ETag computed and compared with the remote one.
+    """
+    if not os.path.isfile(local_file_path):
+        return False
+    stat = os.stat(local_file_path)
+    if stat.st_size != obj['Size']:
+        return False
+    if mtime_matches(stat.st_mtime, obj['LastModified'].timestamp()):
+        return True
+    return local_etag(local_file_path) == obj['ETag'].strip('"')
+
+
+def is_uploaded(local_file_path, obj):
+    """True when the object holds the local file: it was written to S3 after the file last changed."""
+    return _same_content(local_file_path, obj, lambda local_mtime, last_modified: local_mtime <= last_modified)
+
+
+def is_downloaded(local_file_path, obj):
+    """
+    True when the local file holds the object.
+
+    download_file stamps the file with the object's LastModified, so any other mtime means
+    either side changed since, including an object rewritten with the same size.
+    """
+    # LastModified has a resolution of one second
+    return _same_content(local_file_path, obj, lambda local_mtime, last_modified: abs(local_mtime - last_modified) < 1)
+
 
 class S3Sync:
-    def __init__(self,AWS_ACCESS_KEY_ID,AWS_SECRET_ACCESS_KEY,AWS_REGION):
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            region_name=AWS_REGION
-        )
-
-    def sync_folder_to_s3(self, folder, aws_bucket_name):
+    def __init__(self,AWS_ACCESS_KEY_ID,AWS_SECRET_ACCESS_KEY,AWS_REGION, max_workers=S3_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._credentials = (AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_REGION)
+        self._s3_client = None
+        self._transfer_config = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def s3_client(self):
+        """boto3 client, created on first use so importing and constructing S3Sync stays cheap."""
+        if self._s3_client is None:
+            with self._client_lock:
+                if self._s3_client is None:
+                    import boto3
+                    from botocore.config import Config
+                    aws_access_key_id, aws_secret_access_key, region_name = self._credentials
+                    self._s3_client = boto3.client(
+                        's3',
+                        aws_access_key_id=aws_access_key_id,
+                        aws_secret_access_key=aws_secret_access_key,
+                        region_name=region_name,
+                        # One pooled connection per worker thread plus one per concurrent part
+                        config=Config(max_pool_connections=self.max_workers * 2)
+                    )
+        return self._s3_client
+
+    @property
+    def transfer_config(self):
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+            self._transfer_config = TransferConfig(
+                multipart_threshold=S3_MULTIPART_THRESHOLD,
+                multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+                max_concurrency=4,
+            )
+        return self._transfer_config
+
+    def list_objects(self, aws_bucket_name, prefix=''):
+        """Return {key: object} for every object under `prefix`, following all listing pages."""
+        objects = {}
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=aws_bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                objects[obj['Key']] = obj
+        return objects
+
+    def upload_file(self, local_file_path, aws_bucket_name, key):
+        self.s3_client.upload_file(local_file_path, aws_bucket_name, key, Config=self.transfer_config)
+        logging.info(f"Uploaded {local_file_path} to s3://{aws_bucket_name}/{key}")
+
+    def download_file(self, aws_bucket_name, obj, local_file_path):
+        # Create directories if they don't exist
+        os.makedirs(os.path.dirname(local_file_path) or '.', exist_ok=True)
+        self.s3_client.download_file(aws_bucket_name, obj['Key'], local_file_path, Config=self.transfer_config)
+        # Align the local mtime with S3 so the next sync can skip the file without hashing it
+        last_modified = obj['LastModified'].timestamp()
+        os.utime(local_file_path, (last_modified, last_modified))
+        logging.info(f"Downloaded s3://{aws_bucket_name}/{obj['Key']} to {local_file_path}")
+
+    def sync_folder_to_s3(self, folder, aws_bucket_name, prefix=''):
         """
-        Sync a local folder to an S3 bucket.
+        Sync a local folder to an S3 bucket, skipping files that are already up to date.
         
         :param folder: Local folder path to sync
         :param aws_bucket_name: Name of the S3 bucket
+        :param prefix: Key prefix the folder is synced under
+        :return: List of uploaded keys
         """
         try:
+            remote = self.list_objects(aws_bucket_name, prefix)
+            uploads = []
+            local_files = 0
             for root, _, files in os.walk(folder):
                 for file in files:
                     local_file_path = os.path.join(root, file)
+                    local_files += 1
                     # Create the relative path for S3
-                    relative_path = os.path.relpath(local_file_path, folder)
-                    s3_file_path = os.path.join(aws_bucket_name, relative_path)
+                    relative_path = os.path.relpath(local_file_path, folder).replace(os.sep, '/')
+                    key = f"{prefix.rstrip('/')}/{relative_path}" if prefix else relative_path
+                    if key in remote and is_uploaded(local_file_path, remote[key]):
+                        continue
+                    uploads.append((local_file_path, key))
 
-                    # Upload the file
-                    self.s3_client.upload_file(local_file_path, aws_bucket_name, relative_path)
-                    print(f"Uploaded {local_file_path} to s3://{aws_bucket_name}/{relative_path}")
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                list(executor.map(lambda item: self.upload_file(item[0], aws_bucket_name, item[1]), uploads))
+            logging.info(f"Synced {folder} to s3://{aws_bucket_name}/{prefix}: "
+                         f"{len(uploads)} uploaded, {local_files - len(uploads)} skipped")
+            return [key for _, key in uploads]
 
         except (NoCredentialsError, PartialCredentialsError) as e:
             print("Credentials not available or incomplete.")
             print(e)
 
-    def sync_folder_from_s3(self, folder, aws_bucket_name):
+    def sync_folder_from_s3(self, folder, aws_bucket_name, prefix=''):
         """
-        Sync an S3 bucket to a local folder.
+        Sync an S3 bucket to a local folder, skipping files that are already up to date.
         
         :param folder: Local folder path to sync
         :param aws_bucket_name: Name of the S3 bucket
+        :param prefix: Only objects under this key prefix are synced
+        :return: List of downloaded keys
         """
         try:
             # List objects in the specified S3 bucket
-            response = self.s3_client.list_objects_v2(Bucket=aws_bucket_name)
-
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    s3_file_path = obj['Key']
-                    local_file_path = os.path.join(folder, s3_file_path)
+            remote = self.list_objects(aws_bucket_name, prefix)
+            if not remote:
+                print("No files found in the specified S3 bucket.")
+                return []
 
-                    # Create directories if they don't exist
-                    os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+            downloads = []
+            for key, obj in remote.items():
+                if key.endswith('/'):
+                    continue
+                local_file_path = os.path.join(folder, *key.split('/'))
+                if not is_downloaded(local_file_path, obj):
+                    downloads.append((obj, local_file_path))
 
-                    # Download the file
-                    self.s3_client.download_file(aws_bucket_name, s3_file_path, local_file_path)
-                    print(f"Downloaded s3://{aws_bucket_name}/{s3_file_path} to {local_file_path}")
-
-            else:
-                print("No files found in the specified S3 bucket.")
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                list(executor.map(lambda item: self.download_file(aws_bucket_name, item[0], item[1]), downloads))
+            logging.info(f"Synced s3://{aws_bucket_name}/{prefix} to {folder}: "
+                         f"{len(downloads)} downloaded, {len(remote) - len(downloads)} skipped")
+            return [obj['Key'] for obj, _ in downloads]
 
         except (NoCredentialsError, PartialCredentialsError) as e:
             print("Credentials not available or incomplete.")
-            print(e)
\ No newline at end of file
+            print(e)
@@ -0,0 +1,179 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from src.logger import logging
+from src.vad import detect_speech_regions, split_into_windows
+from src.constants import (SAMPLE_RATE, DIARIZATION_MODEL, DIARIZATION_SHARD_SECONDS, DIARIZATION_SHARD_OVERLAP_SECONDS,
+                           DIARIZATION_SHARD_WORKERS, DIARIZATION_SPEAKER_SIMILARITY)
+
+# Pipeline loaded once in every worker process
+_worker_pipeline = None
+
+
+def _init_worker(hugging_face_token, device, threads):
+    global _worker_pipeline
+    import torch
+    from pyannote.audio import Pipeline
+
+    torch.set_num_threads(threads)
+    _worker_pipeline = Pipeline.from_pretrained(DIARIZATION_MODEL, use_auth_token=hugging_face_token).to(torch.device(device))
+
+
+def _diarize_shard(audio, max_speakers):
+    """
+    Diarize one shard in a worker process.
+
+    :return: ([(start, end, speaker), ...] in shard time, {speaker: embedding or None})
+    """
+    import numpy as np
+    import torch
+
+    waveform = torch.from_numpy(np.ascontiguousarray(audio, dtype=np.float32)).unsqueeze(0)
+    diarization, embeddings = _worker_pipeline({"waveform": waveform, "sample_rate": SAMPLE_RATE},
+                                               max_speakers=max_speakers, return_embeddings=True)
+    turns = [(turn.start, turn.end, speaker) for turn, _, speaker in diarization.itertracks(yield_label=True)]
+    centroids = {}
+    for speaker, embedding in zip(diarization.labels(), embeddings):
+        # Speakers with too little speech get no embedding
+        centroids[speaker] = None if np.isnan(embedding).any() else np.asarray(embedding, dtype=np.float32)
+    return turns, centroids
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(hugging_face_token, device, workers):
+    """Process pool whose workers keep a diarization pipeline loaded between requests."""
+    from src.compute_profile import available_cores
+
+    with _pools_lock:
+        key = (hugging_face_token, device, workers)
+        if key not in _pools:
+            threads = max(1, available_cores() // workers)
+            # Spawned rather than forked, torch does not survive fork with threads running
+            _pools[key] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                              initializer=_init_worker, initargs=(hugging_face_token, device, threads))
+        return _pools[key]
+
+
+def plan_shards(audio, shard_seconds=DIARIZATION_SHARD_SECONDS, overlap_seconds=DIARIZATION_SHARD_OVERLAP_SECONDS):
+    """
+    Cut the audio in silence into shards of about `shard_seconds`.
+
+    :return: List of (context_start, start, end) in seconds. A shard is diarized from
+             `context_start` (up to `overlap_seconds` earlier) but owns only [start, end).
+    """
+    total_seconds = len(audio) / SAMPLE_RATE
+    windows = split_into_windows(detect_speech_regions(audio), shard_seconds) or [(0.0, total_seconds)]
+    # Shards own everything up to the next one, so turns in silence between windows are not lost
+    bounds = [0.0] + [start for start, _ in windows[1:]] + [total_seconds]
+    return [(max(0.0, start - overlap_seconds), start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+class SpeakerStitcher:
+    """
+    Maps shard-local speaker labels onto recording-wide labels.
+
+    Local speakers are matched to known speakers by cosine similarity of their embedding
+    centroids; speakers without an embedding fall back to the known speaker they overlap
+    with the most inside the shard's context.
+    """
+    def __init__(self, max_speakers=None, similarity_threshold=DIARIZATION_SPEAKER_SIMILARITY):
+        self.max_speakers = max_speakers
+        self.similarity_threshold = similarity_threshold
+        self.speakers = []
+        self._centroids = {}  # speaker -> (sum of embeddings, count)
+        self._turns = []
+
+    def _similarity(self, embedding, speaker):
+        import numpy as np
+
+        if embedding is None or speaker not in self._centroids:
+            return None
+        total, count = self._centroids[speaker]
+        centroid = total / count
+        return float(np.dot(embedding, centroid) / (np.linalg.norm(embedding) * np.linalg.norm(centroid) + 1e-10))
+
+    def _overlap(self, turns, local, known, context_start, start):
+        return sum(max(0.0, min(end, known_end, start) - max(turn_start, known_start, context_start))
+                   for turn_start, end, speaker in turns if speaker == local
+                   for known_start, known_end, known_speaker in self._turns if known_speaker == known)
+
+    def add_shard(self, turns, centroids, context_start, start, end):
+        """Relabel one shard's turns (absolute times) and return those inside [start, end)."""
+        scores = []
+        for local in centroids:
+            for known in self.speakers:
+                similarity = self._similarity(centroids[local], known)
+                if similarity is not None and similarity >= self.similarity_threshold:
+                    scores.append((similarity, local, known))
+                elif similarity is None:
+                    overlap = self._overlap(turns, local, known, context_start, start)
+                    if overlap > 0:
+                        # Ranked after every embedding match
+                        scores.append((-1.0 / overlap, local, known))
+
+        mapping = {}
+        for _, local, known in sorted(scores, reverse=True):
+            if local not in mapping and known not in mapping.values():
+                mapping[local] = known
+
+        for local in centroids:
+            if local in mapping:
+                continue
+            if self.max_speakers is None or len(self.speakers) < self.max_speakers or not self.speakers:
+                mapping[local] = f"SPEAKER_{len(self.speakers):02d}"
+                self.speakers.append(mapping[local])
+            else:
+                # Over the speaker limit: join the most similar known speaker
+                similarities = [(self._similarity(centroids[local], known) or -1.0, known) for known in self.speakers]
+                mapping[local] = max(similarities)[1]
+
+        for local, embedding in centroids.items():
+            if embedding is not None:
+                total, count = self._centroids.get(mapping[local], (0.0, 0))
+                self._centroids[mapping[local]] = (total + embedding, count + 1)
+
+        owned = []
+        for turn_start, turn_end, local in turns:
+            clipped_start, clipped_end = max(turn_start, start), min(turn_end, end)
+            if clipped_end > clipped_start:
+                owned.append((clipped_start, clipped_end, mapping[local]))
+        self._turns = [(turn_start, turn_end, mapping[local]) for turn_start, turn_end, local in turns]
+        return owned
+
+
+def diarize_sharded(audio, hugging_face_token, device="cpu", max_speakers=None, workers=DIARIZATION_SHARD_WORKERS,
+                    shard_seconds=DIARIZATION_SHARD_SECONDS, overlap_seconds=DIARIZATION_SHARD_OVERLAP_SECONDS):
+    """
+    Diarize long audio shard by shard on a process pool and stitch the speaker labels.
+
+    Only a few shards are in flight at once, so memory stays bounded by the shard length
+    rather than the recording length. There is no `min_speakers`: a shard can hold fewer
+    speakers than the whole recording, and forcing a minimum on it splits a speaker in two.
+
+    :return: DataFrame of start, end and speaker columns, as expected by whisperx.assign_word_speakers
+    """
+    import pandas as pd
+
+    shards = plan_shards(audio, shard_seconds, overlap_seconds)
+    logging.info(f"Diarizing {len(audio) / SAMPLE_RATE:.0f} seconds of audio in {len(shards)} shards on {workers} processes.")
+    pool = _get_pool(hugging_face_token, device, workers)
+
+    stitcher = SpeakerStitcher(max_speakers)
+    rows = []
+    pending = {}
+    for index, (context_start, start, end) in enumerate(shards):
+        chunk = audio[int(context_start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+        pending[index] = pool.submit(_diarize_shard, chunk, max_speakers)
+        # Stitch in order while keeping at most `workers` shards queued behind the running ones
+        while pending and (len(pending) > 2 * workers or index == len(shards) - 1):
+            done = min(pending)
+            turns, centroids = pending.pop(done).result()
+            shard_start = shards[done][0]
+            turns = [(turn_start + shard_start, turn_end + shard_start, speaker) for turn_start, turn_end, speaker in turns]
+            rows.extend(stitcher.add_shard(turns, centroids, *shards[done]))
+
+    logging.info(f"Stitched {len(stitcher.speakers)} speakers across shards.")
+    return pd.DataFrame(rows, columns=["start", "end", "speaker"])
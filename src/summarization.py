@@ -1,10 +1,15 @@
-from src.utils import get_transcript_using_assemblyai
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate
+import asyncio
+import hashlib
+import json
 import os
+import random
+import threading
+import time
 from dotenv import load_dotenv
-import assemblyai as aai
-from src.constants import SUMMARIZATION_MODEL
+from src.constants import SUMMARIZATION_MODEL, SUMMARY_MAX_CONCURRENCY, SUMMARY_MAX_RETRIES, SUMMARY_BACKOFF_SECONDS
+from src.constants import SUMMARY_CHUNK_TOKENS, SUMMARY_CHARS_PER_TOKEN
+from src.logger import logging
+from src.metrics import metrics
 load_dotenv()
 
 # assembly_api_key = os.getenv("ASSEMBLYAI_API_KEY")
@@ -16,20 +21,24 @@ load_dotenv()
 #     model_name="Llama3-8b-8192"
 # )
 
-def summarise_transcript(groq_api_key,transcript):
+SYSTEM_PROMPT = 'You are a helpful assistant who summarises the provided text concisely in no more than 1000 words.'
+
+
+REDUCE_PROMPT = """ Combine the following summaries of consecutive parts of one transcript into a single summary without any introductory phrases: {transcript} """
 
-    llm = ChatGroq(
-    groq_api_key=groq_api_key,
-    model_name= SUMMARIZATION_MODEL
-    )
+
+def build_messages(transcript, reduce=False):
     # Prepare the prompt for summarization
-    summarise_prompt = f""" Summarise the following transcript delimited by 3 backticks without any introductory phrases: {transcript} """
+    if reduce:
+        summarise_prompt = REDUCE_PROMPT.format(transcript=transcript)
+    else:
+        summarise_prompt = f""" Summarise the following transcript delimited by 3 backticks without any introductory phrases: {transcript} """
 
     # Create the chat message structure for Groq API
-    messages = [
+    return [
         {
             'role': 'system',
-            'content': 'You are a helpful assistant who summarises the provided text concisely in no more than 1000 words.'
+            'content': SYSTEM_PROMPT
         },
         {
             'role': 'user',
@@ -37,16 +46,178 @@ def summarise_transcript(groq_api_key,transcript):
         },
     ]
 
-    # Get the response from the Llama model
-    response = llm.invoke(messages)
 
-    # print(type(response))
+def estimate_tokens(text, chars_per_token=SUMMARY_CHARS_PER_TOKEN):
+    return len(text) // chars_per_token + 1
+
+
+def chunk_turns(turns, max_tokens, chars_per_token=SUMMARY_CHARS_PER_TOKEN):
+    """
+    Split a list of speaker turns into chunks of at most `max_tokens` estimated tokens.
+
+    Chunks break between turns; a single turn over the budget is split between words.
+    """
+    chunks = []
+    current, current_tokens = [], 0
+    for turn in turns:
+        pieces = [turn]
+        if estimate_tokens(turn, chars_per_token) > max_tokens:
+            pieces, words = [], turn.split()
+            piece_words = max(1, max_tokens * chars_per_token // 8)  # assume ~8 characters per word
+            for i in range(0, len(words), piece_words):
+                pieces.append(" ".join(words[i:i + piece_words]))
+
+        for piece in pieces:
+            tokens = estimate_tokens(piece, chars_per_token)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _is_rate_limit(error):
+    status_code = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    return status_code == 429 or 'rate limit' in str(error).lower()
+
+
+class SummarizationEngine:
+    """
+    Summarises transcripts concurrently with a single shared LLM client.
+
+    Requests run on a private event loop thread, so one client and one semaphore are shared
+    by every caller regardless of the thread or loop it comes from. Any chat model exposing
+    `ainvoke(messages)` can be passed as `llm`, e.g. langchain's `FakeListChatModel` in tests.
+
+    Transcripts over `chunk_tokens` are summarised map-reduce style: chunks split on speaker
+    turns are summarised in parallel, then the partial summaries are combined level by level.
+    """
+    def __init__(self, groq_api_key=None, llm=None, max_concurrency=SUMMARY_MAX_CONCURRENCY,
+                 max_retries=SUMMARY_MAX_RETRIES, backoff_seconds=SUMMARY_BACKOFF_SECONDS,
+                 chunk_tokens=SUMMARY_CHUNK_TOKENS):
+        self.groq_api_key = groq_api_key
+        self.chunk_tokens = chunk_tokens
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._llm = llm
+        self._loop = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from langchain_groq import ChatGroq
+            self._llm = ChatGroq(groq_api_key=self.groq_api_key, model_name=SUMMARIZATION_MODEL)
+        return self._llm
+
+    def _run(self, coroutine):
+        """Run `coroutine` on the engine loop and block until it finishes."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="summarization-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def asummarise(self, transcript):
+        """Summarise a transcript (a string or a list of speaker turns) of any length."""
+        turns = transcript if isinstance(transcript, list) else [transcript]
+        if estimate_tokens(str(transcript)) <= self.chunk_tokens:
+            return await self._summarise_once(transcript)
 
-    # Extract and print only the content from the response
-    summary_content = response.content
-    summary_content = summary_content.split(":", 1)[-1].strip() 
-    # print("Summary:", summary_content)
-    return summary_content
+        chunks = chunk_turns(turns, self.chunk_tokens)
+        logging.info(f"Summarising transcript in {len(chunks)} chunks.")
+        partials = await asyncio.gather(*(self._summarise_once(chunk) for chunk in chunks))
+
+        # Reduce the partial summaries hierarchically until a single one is left
+        while len(partials) > 1:
+            groups = chunk_turns(list(partials), self.chunk_tokens)
+            if len(groups) >= len(partials):
+                # Every summary fills a request on its own, or was even split between words, which would
+                # never shrink the list; combine whole summaries pairwise instead
+                groups = [list(partials[i:i + 2]) for i in range(0, len(partials), 2)]
+            partials = await asyncio.gather(*(self._summarise_once(group, reduce=True) for group in groups))
+        return partials[0]
+
+    async def _summarise_once(self, transcript, reduce=False):
+        """Summarise text that fits in one request, retrying with exponential backoff when rate limited."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            start_time = time.perf_counter()
+            for attempt in range(self.max_retries + 1):
+                try:
+                    # Get the response from the Llama model
+                    response = await self.llm.ainvoke(build_messages(transcript, reduce=reduce))
+                    break
+                except Exception as e:
+                    if not _is_rate_limit(e) or attempt == self.max_retries:
+                        raise
+                    delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random())
+                    logging.warning(f"Summarization rate limited, retrying in {delay:.1f} seconds.")
+                    await asyncio.sleep(delay)
+            metrics.record_stage("summarize_call", time.perf_counter() - start_time)
+
+        # Extract only the content from the response
+        summary_content = response.content
+        return summary_content.split(":", 1)[-1].strip()
+
+    async def asummarise_conversation(self, speaker_texts, conversation):
+        """Summarise every speaker and the whole conversation concurrently."""
+        speakers = list(speaker_texts.keys())
+        summaries = await asyncio.gather(
+            *(self.asummarise(speaker_texts[speaker]) for speaker in speakers),
+            self.asummarise(conversation),
+        )
+        return {
+            "Speaker": speakers + ["Total Summary"],
+            "Summary": list(summaries)
+        }
+
+    def summarise(self, transcript):
+        return self._run(self.asummarise(transcript))
+
+    def summarise_conversation(self, speaker_texts, conversation, result_cache=None):
+        """
+        Blocking wrapper around `asummarise_conversation` returning the summary table.
+
+        With a `result_cache` the table is reused for identical text, model and prompts.
+        """
+        compute = lambda: self._run(self.asummarise_conversation(speaker_texts, conversation))
+        if result_cache is None:
+            return compute()
+
+        content = json.dumps([speaker_texts, conversation], sort_keys=True)
+        key = result_cache.key("summary", hashlib.sha256(content.encode()).hexdigest(),
+                               model=SUMMARIZATION_MODEL, prompts=self.prompt_version(), chunk_tokens=self.chunk_tokens)
+        return result_cache.get_or_compute(key, compute)
+
+    @staticmethod
+    def prompt_version():
+        """Hash of the prompts, so editing them invalidates cached summaries."""
+        prompts = json.dumps([build_messages("{transcript}"), build_messages("{transcript}", reduce=True)])
+        return hashlib.sha256(prompts.encode()).hexdigest()[:16]
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_summarization_engine(groq_api_key):
+    """Return the process-wide engine for `groq_api_key`."""
+    with _engines_lock:
+        if groq_api_key not in _engines:
+            _engines[groq_api_key] = SummarizationEngine(groq_api_key=groq_api_key)
+        return _engines[groq_api_key]
+
+
+def summarise_transcript(groq_api_key,transcript):
+    return get_summarization_engine(groq_api_key).summarise(transcript)
 
 
 # Example usage
@@ -0,0 +1,105 @@
+import html
+import os
+from src.logger import logging
+
+
+class Turn:
+    """Consecutive speech of one speaker."""
+    __slots__ = ("speaker", "start", "end", "text", "word_count")
+
+    def __init__(self, speaker, start, end, text, word_count):
+        self.speaker = speaker
+        self.start = start
+        self.end = end
+        self.text = text
+        self.word_count = word_count
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class Transcript:
+    """
+    Speaker turns of a diarized recording with their statistics.
+
+    Everything is computed in a single pass over the whisperx segments; HTML is only
+    produced by `to_html` for the UI.
+    """
+    __slots__ = ("turns", "speakers", "speaker_map", "total_words", "words_by_speaker", "speaker_texts")
+
+    def __init__(self, turns, speakers, speaker_map=None):
+        self.turns = turns
+        self.speakers = speakers
+        self.speaker_map = speaker_map or {}  # Diarization label -> display name
+        self.total_words = 0
+        self.words_by_speaker = {speaker: 0 for speaker in speakers}
+        self.speaker_texts = {}
+        for turn in turns:
+            self.total_words += turn.word_count
+            self.words_by_speaker[turn.speaker] += turn.word_count
+            self.speaker_texts.setdefault(turn.speaker, []).append(turn.text)
+
+    @classmethod
+    def from_result(cls, result, uniq_speakers=None):
+        """
+        Merge consecutive segments of the same speaker into turns.
+
+        Diarization labels are renamed to "Speaker 1", "Speaker 2", ... in the order of
+        `uniq_speakers`, or in order of appearance when it is not given.
+        """
+        logging.info("Build the transcript from the diarized result.")
+        speaker_map = {speaker: f"Speaker {i + 1}" for i, speaker in enumerate(uniq_speakers if uniq_speakers is not None else [])}
+
+        turns = []
+        current = None
+        texts = []
+        for segment in result['segments']:
+            label = segment.get('speaker')
+            if label not in speaker_map:
+                speaker_map[label] = f"Speaker {len(speaker_map) + 1}"
+            speaker = speaker_map[label]
+            text = segment['text'].strip()
+            word_count = len(text.split())
+
+            if current is not None and current.speaker == speaker:
+                texts.append(text)
+                current.end = segment.get('end', current.end)
+                current.word_count += word_count
+            else:
+                if current is not None:
+                    current.text = " ".join(texts).strip()
+                current = Turn(speaker, segment.get('start'), segment.get('end'), "", word_count)
+                texts = [text]
+                turns.append(current)
+        if current is not None:
+            current.text = " ".join(texts).strip()
+
+        speakers = list(dict.fromkeys(turn.speaker for turn in turns))
+        return cls(turns, speakers, speaker_map)
+
+    def to_dict(self):
+        """JSON-serialisable form, e.g. to return the transcript from a remote worker."""
+        return {"turns": [turn.to_dict() for turn in self.turns], "speakers": self.speakers,
+                "speaker_map": self.speaker_map}
+
+    @classmethod
+    def from_dict(cls, data):
+        turns = [Turn(**turn) for turn in data["turns"]]
+        return cls(turns, list(data["speakers"]), dict(data["speaker_map"]))
+
+    def lines(self):
+        """Plain "Speaker N: text" lines."""
+        return [f"{turn.speaker}: {turn.text}" for turn in self.turns]
+
+    def to_html(self):
+        """Lines rendered as "<strong>Speaker N:</strong> text" for the UI."""
+        return [f"<strong>{turn.speaker}:</strong> {html.escape(turn.text, quote=False)}" for turn in self.turns]
+
+    def write_exports(self, directory='transcriptions'):
+        """Write the transcription with and without speaker names, returning the directory."""
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'transcription_with_speakers.txt'), 'w') as file_full:
+            file_full.writelines(f"{line}\n" for line in self.lines())
+        with open(os.path.join(directory, 'transcription_with_no_speakers.txt'), 'w') as file_no_speakers:
+            file_no_speakers.writelines(f"{turn.text} " for turn in self.turns)
+        return directory
@@ -0,0 +1,161 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from src.logger import logging
+from src.constants import TRANSCRIPT_STORE_PATH, SEARCH_MAX_LIMIT
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id TEXT PRIMARY KEY,
+    filename TEXT,
+    created_at REAL NOT NULL,
+    audio_duration REAL,
+    total_words INTEGER,
+    words_by_speaker TEXT,
+    summary TEXT
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    recording_id TEXT NOT NULL REFERENCES recordings(id) ON DELETE CASCADE,
+    turn_index INTEGER NOT NULL,
+    speaker TEXT,
+    start REAL,
+    end REAL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_recording ON turns(recording_id, turn_index);
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(
+    text, content='turns', content_rowid='id', tokenize='porter unicode61'
+);
+"""
+
+
+def to_match_query(query):
+    """Turn free text into an FTS5 query matching every word, so user input can't break the syntax."""
+    terms = re.findall(r"\w+", query, flags=re.UNICODE)
+    return " ".join(f'"{term}"' for term in terms)
+
+
+class TranscriptStore:
+    """
+    SQLite store of processed recordings with full-text search over their turns.
+
+    Every recording is written in a single transaction; turns are indexed with FTS5
+    and search results are ranked by BM25.
+    """
+    def __init__(self, path=TRANSCRIPT_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+        return connection
+
+    def ingest(self, recording_id, transcript, summary_data=None, audio_duration=None, filename=None):
+        """Store a recording and all of its turns in one transaction, replacing an earlier copy."""
+        start_time = time.time()
+        rows = [(recording_id, i, turn.speaker, turn.start, turn.end, turn.text) for i, turn in enumerate(transcript.turns)]
+        with self._connection() as connection:
+            self._delete(connection, recording_id)
+            connection.execute(
+                "INSERT INTO recordings (id, filename, created_at, audio_duration, total_words, words_by_speaker, summary) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (recording_id, filename, time.time(), audio_duration, transcript.total_words,
+                 json.dumps(transcript.words_by_speaker), json.dumps(summary_data)),
+            )
+            connection.executemany(
+                "INSERT INTO turns (recording_id, turn_index, speaker, start, end, text) VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            connection.execute(
+                "INSERT INTO turns_fts (rowid, text) SELECT id, text FROM turns WHERE recording_id = ?", (recording_id,)
+            )
+        logging.info(f"Stored {len(rows)} turns of recording {recording_id} in {time.time() - start_time:.3f} seconds.")
+
+    @staticmethod
+    def _delete(connection, recording_id):
+        # External content FTS tables need the old values to remove them from the index
+        connection.execute(
+            "INSERT INTO turns_fts (turns_fts, rowid, text) SELECT 'delete', id, text FROM turns WHERE recording_id = ?",
+            (recording_id,),
+        )
+        connection.execute("DELETE FROM turns WHERE recording_id = ?", (recording_id,))
+        connection.execute("DELETE FROM recordings WHERE id = ?", (recording_id,))
+
+    def delete(self, recording_id):
+        with self._connection() as connection:
+            self._delete(connection, recording_id)
+
+    def get_recording(self, recording_id):
+        row = self._connection().execute(
+            "SELECT id, filename, created_at, audio_duration, total_words, words_by_speaker, summary FROM recordings WHERE id = ?",
+            (recording_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "recording_id": row[0],
+            "filename": row[1],
+            "created_at": row[2],
+            "audio_duration": row[3],
+            "total_words": row[4],
+            "words_by_speaker": json.loads(row[5]),
+            "summary_data": json.loads(row[6]),
+        }
+
+    def search(self, query, limit=20, offset=0, speaker=None):
+        """
+        Rank turns matching every word of `query`.
+
+        :return: Dictionary with the total number of matches and one page of results
+        """
+        match = to_match_query(query)
+        if not match:
+            return {"total": 0, "results": []}
+        limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+        speaker_filter = "AND t.speaker = ?" if speaker else ""
+        params = [match] + ([speaker] if speaker else [])
+        connection = self._connection()
+        total = connection.execute(
+            f"SELECT count(*) FROM turns_fts JOIN turns t ON t.id = turns_fts.rowid WHERE turns_fts MATCH ? {speaker_filter}",
+            params,
+        ).fetchone()[0]
+        rows = connection.execute(
+            f"""
+            SELECT t.recording_id, r.filename, r.created_at, t.turn_index, t.speaker, t.start, t.end,
+                   snippet(turns_fts, 0, '<mark>', '</mark>', '…', 16), bm25(turns_fts) AS rank
+            FROM turns_fts
+            JOIN turns t ON t.id = turns_fts.rowid
+            JOIN recordings r ON r.id = t.recording_id
+            WHERE turns_fts MATCH ? {speaker_filter}
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+            """,
+            params + [limit, offset],
+        ).fetchall()
+        results = [
+            {
+                "recording_id": row[0],
+                "filename": row[1],
+                "created_at": row[2],
+                "turn_index": row[3],
+                "speaker": row[4],
+                "start": row[5],
+                "end": row[6],
+                "snippet": row[7],
+                "score": -row[8],
+            }
+            for row in rows
+        ]
+        return {"total": total, "limit": limit, "offset": offset, "results": results}
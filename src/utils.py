@@ -1,57 +1,29 @@
-from os import path
-from pydub import AudioSegment
-from pytube import YouTube
-from moviepy.editor import *
+import importlib
 import os
-import assemblyai as aai
 import json
 import wave
 import re
 from src.logger import logging
 
+# Helpers for YouTube audio and hosted transcription live in src.media_utils
+# and are only imported when first used
+_LAZY_ATTRIBUTES = {
+    "extract_audio_from_youtube": "src.media_utils",
+    "get_transcript_using_assemblyai": "src.media_utils",
+}
 
-def convertmp3_to_wav(input_file_path, output_file_path):
-    # Convert MP3 to WAV
-    sound = AudioSegment.from_mp3(input_file_path)
-    sound.export(output_file_path, format="wav")
-
-    return output_file_path
-
-
-def extract_audio_from_youtube(youtube_url):
-    try:
-        # Create a YouTube object with the provided URL
-        video = YouTube(youtube_url)
 
-        # Filter for audio streams and select the first available one
-        audio_stream = video.streams.filter(only_audio=True).first()
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-        # Download the audio stream
-        audio_stream.download()
 
-        video_path =audio_stream.default_filename
-        audio_path = video_path.replace(".mp4",".mp3")
-
-        clip = AudioFileClip(video_path) # type: ignore
-        clip.write_audiofile(audio_path)
-        
-        os.remove(video_path)
-        return audio_path
-
-    except Exception as e:
-        print(f"An error occurred: {e}")
-
-def get_transcript_using_assemblyai(assembly_api_key, mp3file_path):
-    aai.settings.api_key = assembly_api_key 
-
-    transcriber = aai.Transcriber()
-    transcript = transcriber.transcribe(mp3file_path)
+def convertmp3_to_wav(input_file_path, output_file_path):
+    # Convert MP3 (or any format ffmpeg reads) to 16 kHz mono WAV, streamed through ffmpeg
+    from src.ingest import normalize_audio_file
+    return normalize_audio_file(input_file_path, output_file_path)
 
-    if transcript.status == aai.TranscriptStatus.error:
-        return transcript.error
-    else:
-        return transcript.text
-    
 
 def extract_audio_duration(file_path):
     logging.info("Extracts the duration of an audio file in seconds.")
@@ -83,13 +55,13 @@ def count_words(transcript):
         # Assuming each segment is formatted as "<strong>Speaker X:</strong> text"
         if ':' in segment:
             speaker, text = segment.split(':', 1)
-            text = text.strip()
+            text = text.strip().removeprefix('</strong>')
             word_count = len(text.split())
             
             total_words += word_count
             
             # Update speaker word count
-            speaker_name = speaker.strip('<strong>')  # Remove markdown formatting
+            speaker_name = speaker.strip().removeprefix('<strong>')  # Remove HTML formatting
             if speaker_name not in speaker_word_count:
                 speaker_word_count[speaker_name] = 0
             speaker_word_count[speaker_name] += word_count
@@ -98,11 +70,15 @@ def count_words(transcript):
 
     return total_words, speaker_word_count
 
-def display_conversation(filename='data.json', uniq_speakers=None):
-    logging.info("Display the conversation from the JSON file.")
-    
-    with open(filename, 'r') as file:
-        data = json.load(file)
+def display_conversation(filename='data.json', uniq_speakers=None, result=None):
+    """Build the conversation from a diarized result, read from `filename` unless `result` is given."""
+    logging.info("Display the conversation from the diarized result.")
+
+    if result is not None:
+        data = result
+    else:
+        with open(filename, 'r') as file:
+            data = json.load(file)
 
     # Create dynamic speaker mapping based on unique speakers
     if uniq_speakers is None:
@@ -154,8 +130,7 @@ def extract_speaker_texts(conversation):
 
     return speaker_texts
 
-def save_transcription(conversation):
-    directory = 'transcriptions'
+def save_transcription(conversation, directory='transcriptions'):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
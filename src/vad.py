@@ -0,0 +1,142 @@
+from src.constants import SAMPLE_RATE, VAD_PAD_SECONDS, VAD_GAP_SECONDS
+
+
+def detect_speech_regions(audio, sample_rate=SAMPLE_RATE, frame_ms=30, relative_threshold_db=-35.0,
+                          floor_threshold_db=-60.0, min_silence_seconds=0.5, min_speech_seconds=0.25):
+    """
+    Find speech regions in a waveform with a short-time energy detector.
+
+    A frame counts as speech when its energy is within `relative_threshold_db` of the
+    loudest frame and above `floor_threshold_db`. Gaps shorter than `min_silence_seconds`
+    are bridged and regions shorter than `min_speech_seconds` are dropped.
+
+    :return: List of (start, end) tuples in seconds
+    """
+    import numpy as np
+
+    frame_length = int(sample_rate * frame_ms / 1000)
+    num_frames = len(audio) // frame_length
+    if num_frames == 0:
+        return []
+
+    frames = np.asarray(audio[:num_frames * frame_length], dtype=np.float32).reshape(num_frames, frame_length)
+    energy = np.einsum('ij,ij->i', frames, frames) / frame_length
+    energy_db = 10 * np.log10(energy + 1e-10)
+    threshold = max(energy_db.max() + relative_threshold_db, floor_threshold_db)
+    is_speech = energy_db > threshold
+
+    # Frame indices where speech starts and stops
+    edges = np.diff(np.concatenate(([0], is_speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    frame_seconds = frame_length / sample_rate
+    regions = []
+    for start, end in zip(starts * frame_seconds, ends * frame_seconds):
+        if regions and start - regions[-1][1] < min_silence_seconds:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+
+    total_seconds = len(audio) / sample_rate
+    return [(float(start), float(min(end, total_seconds)))
+            for start, end in regions if end - start >= min_speech_seconds]
+
+
+def split_into_windows(regions, max_window_seconds):
+    """
+    Group consecutive speech regions into windows no longer than `max_window_seconds`.
+
+    Windows start and end on region boundaries, so they are cut in silence; a single
+    region longer than the limit is cut into equal parts.
+
+    :return: List of (start, end) tuples in seconds
+    """
+    windows = []
+    for start, end in regions:
+        if end - start > max_window_seconds:
+            parts = int(-(-(end - start) // max_window_seconds))
+            step = (end - start) / parts
+            pieces = [(start + i * step, start + (i + 1) * step) for i in range(parts)]
+        else:
+            pieces = [(start, end)]
+
+        for piece_start, piece_end in pieces:
+            if windows and piece_end - windows[-1][0] <= max_window_seconds:
+                windows[-1] = (windows[-1][0], piece_end)
+            else:
+                windows.append((piece_start, piece_end))
+    return windows
+
+
+def whisperx_speech_regions(audio, vad_model, sample_rate=SAMPLE_RATE, onset=0.5, chunk_seconds=30):
+    """
+    Find speech regions with whisperx's neural VAD (`model.vad_model` of a loaded whisperx pipeline).
+
+    Unlike the energy detector it tells speech from hold music and background noise.
+
+    :return: List of (start, end) tuples in seconds
+    """
+    import numpy as np
+    import torch
+    from whisperx.vad import merge_chunks
+
+    waveform = torch.from_numpy(np.ascontiguousarray(audio, dtype=np.float32)).unsqueeze(0)
+    segments = vad_model({"waveform": waveform, "sample_rate": sample_rate})
+    chunks = merge_chunks(segments, chunk_seconds, onset=onset)
+    return [(float(start), float(end)) for chunk in chunks for start, end in chunk["segments"]]
+
+
+class SpeechMap:
+    """
+    Speech regions of a recording and the mapping between compacted and original time.
+
+    `compact` joins the (padded) regions, separated by `gap_seconds` of silence, into a
+    shorter waveform; `to_original` maps times measured on that waveform back onto the
+    recording. Times inside a gap map to the end of the preceding region.
+    """
+    def __init__(self, regions, total_seconds, sample_rate=SAMPLE_RATE, pad_seconds=VAD_PAD_SECONDS,
+                 gap_seconds=VAD_GAP_SECONDS):
+        import numpy as np
+
+        merged = []
+        for start, end in sorted(regions):
+            start, end = max(0.0, start - pad_seconds), min(total_seconds, end + pad_seconds)
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+
+        self.regions = merged
+        self.total_seconds = total_seconds
+        self.sample_rate = sample_rate
+        self.gap_samples = int(round(gap_seconds * sample_rate))
+        # Sample positions are the source of truth so compaction and mapping agree exactly
+        self._original_starts = np.array([int(round(start * sample_rate)) for start, _ in merged], dtype=np.int64)
+        self._lengths = np.array([int(round(end * sample_rate)) for _, end in merged], dtype=np.int64) - self._original_starts
+        self._compact_starts = np.concatenate(([0], np.cumsum(self._lengths + self.gap_samples)[:-1])).astype(np.int64)
+
+    @property
+    def speech_seconds(self):
+        return float(self._lengths.sum()) / self.sample_rate
+
+    def compact(self, audio):
+        """Waveform of the speech regions only."""
+        import numpy as np
+
+        pieces = []
+        gap = np.zeros(self.gap_samples, dtype=audio.dtype)
+        for i, (start, length) in enumerate(zip(self._original_starts, self._lengths)):
+            if i:
+                pieces.append(gap)
+            pieces.append(audio[start:start + length])
+        return np.concatenate(pieces) if pieces else audio[:0]
+
+    def to_original(self, times):
+        """Map times (seconds, scalar or array) on the compacted waveform to the original recording."""
+        import numpy as np
+
+        samples = np.asarray(times, dtype=np.float64) * self.sample_rate
+        index = np.clip(np.searchsorted(self._compact_starts, samples, side='right') - 1, 0, len(self._lengths) - 1)
+        offset = np.clip(samples - self._compact_starts[index], 0, self._lengths[index])
+        return (self._original_starts[index] + offset) / self.sample_rate
@@ -0,0 +1,149 @@
+from src.logger import logging
+
+
+class WordIndex:
+    """
+    Columnar, time-sorted index of the aligned words of a recording.
+
+    Words are stored as NumPy columns (start, end, score, speaker code) plus one string
+    buffer addressed by offsets. Time-range, per-speaker turn and talk-time queries are
+    answered with binary searches instead of rescanning the whisperx JSON.
+    """
+    def __init__(self, starts, ends, scores, speaker_codes, text, offsets, speakers):
+        import numpy as np
+        self.starts = starts
+        self.ends = ends
+        self.scores = scores
+        self.speaker_codes = speaker_codes
+        self.text = text          # All words joined, word i is text[offsets[i]:offsets[i + 1]]
+        self.offsets = offsets
+        self.speakers = speakers  # Speaker code -> speaker name
+
+        # Running maximum of end times: non-decreasing, so it can be binary searched
+        self._max_ends = np.maximum.accumulate(ends) if len(ends) else ends
+
+        # Turns are runs of consecutive words with the same speaker
+        boundaries = np.flatnonzero(np.diff(speaker_codes)) + 1
+        self.turn_first_word = np.concatenate(([0], boundaries)).astype(np.int64) if len(speaker_codes) else np.empty(0, dtype=np.int64)
+        self.turn_last_word = np.append(self.turn_first_word[1:], len(speaker_codes)).astype(np.int64)
+        self.turn_speaker = speaker_codes[self.turn_first_word]
+
+        # Per speaker: word starts and cumulative word durations for talk time queries
+        durations = ends - starts
+        self._speaker_words = {}
+        for code in range(len(speakers)):
+            mask = speaker_codes == code
+            self._speaker_words[code] = (starts[mask], np.concatenate(([0.0], np.cumsum(durations[mask]))))
+
+    @classmethod
+    def from_result(cls, result, speaker_map=None):
+        """
+        Build the index from a diarized whisperx result.
+
+        Words without timestamps (e.g. digits whisperx could not align) are skipped.
+        `speaker_map` renames diarization labels, such as `Transcript.speaker_map`.
+        """
+        import numpy as np
+        speaker_map = speaker_map or {}
+        words = result.get('word_segments') or [word for segment in result['segments'] for word in segment.get('words', [])]
+        words = [word for word in words if 'start' in word and 'end' in word]
+
+        speakers, codes = [], {}
+        starts = np.empty(len(words), dtype=np.float64)
+        ends = np.empty(len(words), dtype=np.float64)
+        scores = np.empty(len(words), dtype=np.float32)
+        speaker_codes = np.empty(len(words), dtype=np.int16)
+        for i, word in enumerate(words):
+            name = speaker_map.get(word.get('speaker'), word.get('speaker') or "Unknown")
+            if name not in codes:
+                codes[name] = len(speakers)
+                speakers.append(name)
+            starts[i] = word['start']
+            ends[i] = word['end']
+            scores[i] = word.get('score', np.nan)
+            speaker_codes[i] = codes[name]
+
+        order = np.argsort(starts, kind='stable')
+        texts = [words[i]['word'] for i in order]
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in texts], out=offsets[1:])
+        logging.info(f"Built word index with {len(words)} words and {len(speakers)} speakers.")
+        return cls(starts[order], ends[order], scores[order], speaker_codes[order], "".join(texts), offsets, speakers)
+
+    def to_dict(self):
+        """JSON-serialisable columns, e.g. to return the index from a remote worker."""
+        import numpy as np
+        return {
+            "starts": self.starts.tolist(),
+            "ends": self.ends.tolist(),
+            "scores": [None if np.isnan(score) else float(score) for score in self.scores],
+            "speaker_codes": self.speaker_codes.tolist(),
+            "text": self.text,
+            "offsets": self.offsets.tolist(),
+            "speakers": list(self.speakers),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        import numpy as np
+        return cls(np.asarray(data["starts"], dtype=np.float64), np.asarray(data["ends"], dtype=np.float64),
+                   np.asarray([np.nan if score is None else score for score in data["scores"]], dtype=np.float32),
+                   np.asarray(data["speaker_codes"], dtype=np.int16), data["text"],
+                   np.asarray(data["offsets"], dtype=np.int64), list(data["speakers"]))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def word(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def _word_range(self, start_time, end_time):
+        """Index range of the words that overlap [start_time, end_time)."""
+        import numpy as np
+        first = int(np.searchsorted(self._max_ends, start_time, side='right'))
+        last = int(np.searchsorted(self.starts, end_time, side='left'))
+        return first, max(first, last)
+
+    def words_between(self, start_time, end_time):
+        """Words overlapping [start_time, end_time), in time order."""
+        import numpy as np
+        first, last = self._word_range(start_time, end_time)
+        return [
+            {
+                "word": self.word(i),
+                "start": float(self.starts[i]),
+                "end": float(self.ends[i]),
+                "score": None if np.isnan(self.scores[i]) else round(float(self.scores[i]), 3),
+                "speaker": self.speakers[self.speaker_codes[i]],
+            }
+            for i in range(first, last) if self.ends[i] > start_time
+        ]
+
+    def turns(self, speaker=None):
+        """Turns of `speaker` (every turn when None) with their time span and text."""
+        import numpy as np
+        if speaker is None:
+            selected = np.arange(len(self.turn_first_word))
+        elif speaker in self.speakers:
+            selected = np.flatnonzero(self.turn_speaker == self.speakers.index(speaker))
+        else:
+            return []
+        return [
+            {
+                "speaker": self.speakers[self.turn_speaker[t]],
+                "start": float(self.starts[self.turn_first_word[t]]),
+                "end": float(self.ends[self.turn_first_word[t]:self.turn_last_word[t]].max()),
+                "text": " ".join(self.word(i) for i in range(self.turn_first_word[t], self.turn_last_word[t])),
+            }
+            for t in selected
+        ]
+
+    def talk_time(self, start_time=None, end_time=None):
+        """Seconds spoken by each speaker, counting the words that start in [start_time, end_time)."""
+        import numpy as np
+        talk_time = {}
+        for code, (starts, cumulative) in self._speaker_words.items():
+            first = 0 if start_time is None else int(np.searchsorted(starts, start_time, side='left'))
+            last = len(starts) if end_time is None else int(np.searchsorted(starts, end_time, side='left'))
+            talk_time[self.speakers[code]] = round(float(cumulative[max(first, last)] - cumulative[first]), 3)
+        return talk_time
@@ -0,0 +1,166 @@
+"""
+Standalone transcription worker consuming jobs from the broker queue.
+
+    transcribe-worker --broker sqlite:///shared/jobs.db --concurrency 2
+
+Models are loaded once at start and stay warm between jobs. Every job is leased;
+the lease is renewed by a heartbeat while the pipeline runs, so the job of a crashed
+worker returns to the queue once its lease expires. A worker that loses the lease cancels
+the job at its next progress update and leaves it to the worker now holding it. The transcript travels back with
+the result and is indexed for search by the HTTP tier.
+"""
+import argparse
+import os
+import signal
+import socket
+import threading
+from dotenv import load_dotenv
+from src.logger import logging
+from src.constants import (BUCKET_NAME, PRELOAD_LANGUAGES, JOB_BROKER_URL, JOB_MAX_WORKERS, JOB_LEASE_SECONDS,
+                           JOB_HEARTBEAT_SECONDS, WORKER_POLL_SECONDS)
+from src.job_queue import build_broker, fetch_audio, discard_audio
+
+
+class LeaseLost(Exception):
+    """Raised inside a job whose lease the worker no longer holds."""
+
+
+class TranscriptionWorker:
+    def __init__(self, broker, worker_id, hugging_face_token, groq_api_key, s3_sync, artifact_uploader, device="cpu",
+                 result_cache=None, transcript_store=None, router=None, concurrency=JOB_MAX_WORKERS,
+                 lease_seconds=JOB_LEASE_SECONDS, heartbeat_seconds=JOB_HEARTBEAT_SECONDS, poll_seconds=WORKER_POLL_SECONDS):
+        self.broker = broker
+        self.worker_id = worker_id
+        self.hugging_face_token = hugging_face_token
+        self.groq_api_key = groq_api_key
+        self.s3_sync = s3_sync
+        self.artifact_uploader = artifact_uploader
+        self.device = device
+        self.result_cache = result_cache
+        self.transcript_store = transcript_store
+        self.router = router
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+        self._stopping = threading.Event()
+
+    def stop(self):
+        """Finish the running jobs, then exit; no new job is leased."""
+        logging.info(f"Worker {self.worker_id} stopping.")
+        self._stopping.set()
+
+    def run(self):
+        threads = [threading.Thread(target=self._consume, name=f"{self.worker_id}-{i}") for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _consume(self):
+        worker_id = threading.current_thread().name
+        while not self._stopping.is_set():
+            job = self.broker.lease(worker_id, self.lease_seconds)
+            if job is None:
+                self._stopping.wait(self.poll_seconds)
+                continue
+            self.process(job, worker_id)
+
+    def _heartbeat(self, job_id, worker_id, done, lost):
+        while not done.wait(self.heartbeat_seconds):
+            if not self.broker.heartbeat(job_id, worker_id, self.lease_seconds):
+                logging.warning(f"Lost the lease on job {job_id}, cancelling it.")
+                lost.set()
+                return
+
+    def process(self, job, worker_id):
+        from src.pipeline import run_transcription_pipeline, serialize_result
+        from src.workspace import JobWorkspace
+
+        job_id, payload = job["id"], job["payload"]
+        logging.info(f"Worker {worker_id} running job {job_id} (attempt {job['attempts']}).")
+        done, lost = threading.Event(), threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, worker_id, done, lost), daemon=True)
+        heartbeat.start()
+
+        def progress(message, event=None):
+            # Every stage reports progress, so a job whose lease was lost stops at the next stage
+            if lost.is_set():
+                raise LeaseLost(f"Lost the lease on job {job_id}.")
+            self.broker.publish(job_id, message, event)
+
+        workspace = JobWorkspace(job_id)
+        try:
+            fetch_audio(payload["audio_uri"], workspace.audio_path, self.s3_sync)
+            result = run_transcription_pipeline(
+                workspace, progress, self.hugging_face_token, self.groq_api_key, self.artifact_uploader,
+                device=self.device, stream=payload.get("stream", False), result_cache=self.result_cache,
+                transcript_store=self.transcript_store, filename=payload.get("filename"),
+                min_speakers=payload.get("min_speakers"), max_speakers=payload.get("max_speakers"), router=self.router)
+            progress("Processing complete")
+            if self.broker.complete(job_id, worker_id, serialize_result(result)):
+                discard_audio(payload["audio_uri"], self.s3_sync)
+            else:
+                logging.warning(f"Dropped the result of job {job_id}, its lease was lost.")
+        except Exception as e:
+            workspace.cleanup()
+            if lost.is_set():
+                # The job and its audio belong to the worker that leased it next
+                logging.warning(f"Cancelled job {job_id}: {e}")
+                return
+            logging.exception(f"Job {job_id} failed: {e}")
+            # Publish before the status changes so streams never miss the final event
+            if job["attempts"] >= job["max_attempts"]:
+                progress(f"Processing failed: {e}")
+            else:
+                progress(f"Attempt {job['attempts']} failed, retrying: {e}")
+            if self.broker.fail(job_id, worker_id, str(e)):
+                discard_audio(payload["audio_uri"], self.s3_sync)
+        finally:
+            done.set()
+            heartbeat.join()
+
+
+def main(argv=None):
+    from src.s3_syncer import S3Sync
+    from src.result_cache import build_result_cache
+    from src.artifact_uploader import ArtifactUploader
+    from src.dairization import preload_models
+    from src.asr_backends import build_backend_router
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run transcription jobs from the broker queue.")
+    parser.add_argument("--broker", default=JOB_BROKER_URL, help="sqlite:///path or redis://host:port/db")
+    parser.add_argument("--concurrency", type=int, default=JOB_MAX_WORKERS, help="Jobs run at once.")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--device", default=os.getenv("DEVICE", "cpu"))
+    args = parser.parse_args(argv)
+    if not args.broker:
+        parser.error("Set JOB_BROKER_URL or pass --broker.")
+
+    hugging_face_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
+    s3_sync = S3Sync(os.getenv("AWS_ACCESS_KEY_ID"), os.getenv("AWS_SECRET_ACCESS_KEY"), os.getenv("AWS_REGION"))
+    artifact_uploader = ArtifactUploader(s3_sync, BUCKET_NAME)
+    broker = build_broker(args.broker)
+    result_cache = build_result_cache(s3_sync)
+    # Overflow to remote speech-to-text services is driven by the depth of the shared queue
+    router = build_backend_router(hugging_face_token, args.device, result_cache, queue_depth=broker.depth)
+    worker = TranscriptionWorker(broker, args.worker_id, hugging_face_token, os.getenv("GROQ_API_KEY"), s3_sync,
+                                 artifact_uploader, device=args.device, result_cache=result_cache, router=router,
+                                 concurrency=args.concurrency)
+
+    # Keep the models warm for the lifetime of the worker
+    preload_models(hugging_face_token, args.device, None, PRELOAD_LANGUAGES)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+
+    artifact_uploader.start()
+    try:
+        worker.run()
+    finally:
+        router.close()
+        artifact_uploader.stop(flush=True)
+
+
+if __name__ == "__main__":
+    main()
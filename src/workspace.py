@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import uuid
+from src.logger import logging
+from src.constants import JOB_WORKSPACE_ROOT, TRANSCRIPTION_S3_PREFIX
+
+
+class JobWorkspace:
+    """
+    Private working directory holding every file of one job.
+
+    Concurrent jobs never share the uploaded audio or the transcription exports.
+    The directory is removed by `cleanup()` or when used as a context manager.
+    """
+    def __init__(self, job_id=None, root=JOB_WORKSPACE_ROOT):
+        self.job_id = job_id or uuid.uuid4().hex
+        if root:
+            os.makedirs(root, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix=f"job_{self.job_id}_", dir=root)
+
+    def path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    @property
+    def audio_path(self):
+        return self.path("uploaded_audio.wav")
+
+    @property
+    def transcriptions_dir(self):
+        return self.path("transcriptions")
+
+    @property
+    def s3_prefix(self):
+        return f"{TRANSCRIPTION_S3_PREFIX}/{self.job_id}"
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        logging.info(f"Removed workspace of job {self.job_id}.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
@@ -0,0 +1,259 @@
+import json
+import httpx
+import pytest
+from src.asr_backends import (AssemblyAIBackend, BackendRouter, DeepgramBackend, LocalBackend, RemoteTranscriptionFailed,
+                              TranscriptionBackend)
+
+
+@pytest.fixture
+def audio_path(tmp_path):
+    path = tmp_path / "call.wav"
+    path.write_bytes(b"RIFF" + b"\x00" * 2000)
+    return str(path)
+
+
+def backend_with(backend_class, handler, **kwargs):
+    return backend_class("secret", base_url="https://asr.test", transport=httpx.MockTransport(handler), **kwargs)
+
+
+DEEPGRAM_RESPONSE = {
+    "metadata": {"duration": 4.5},
+    "results": {
+        "channels": [{"detected_language": "en"}],
+        "utterances": [
+            {"start": 0.0, "end": 1.5, "speaker": 0, "transcript": "Hello there.",
+             "words": [{"word": "hello", "punctuated_word": "Hello", "start": 0.0, "end": 0.5, "confidence": 0.9},
+                       {"word": "there", "punctuated_word": "there.", "start": 0.6, "end": 1.5, "confidence": 0.8}]},
+            {"start": 2.0, "end": 4.5, "speaker": 1, "transcript": "Hi.",
+             "words": [{"word": "hi", "start": 2.0, "end": 2.4}]},
+        ],
+    },
+}
+
+
+def test_deepgram_request_and_result(audio_path):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json=DEEPGRAM_RESPONSE)
+
+    backend = backend_with(DeepgramBackend, handler, model="nova-2")
+    try:
+        result, speakers = backend.transcribe(audio_path)
+    finally:
+        backend.close()
+
+    request, = requests
+    assert request.method == "POST" and request.url.path == "/v1/listen"
+    assert request.url.params["model"] == "nova-2" and request.url.params["diarize"] == "true"
+    assert request.url.params["utterances"] == "true"
+    assert request.headers["authorization"] == "Token secret"
+    assert request.headers["content-type"] == "audio/x-wav"
+    assert request.headers["content-length"] == "2004"
+    with open(audio_path, "rb") as file:
+        assert request.content == file.read()
+
+    assert speakers == ["SPEAKER_00", "SPEAKER_01"]
+    assert result["language"] == "en" and result["duration"] == 4.5
+    first, second = result["segments"]
+    assert first["speaker"] == "SPEAKER_00" and first["text"] == "Hello there."
+    assert first["words"][0] == {"word": "Hello", "start": 0.0, "end": 0.5, "speaker": "SPEAKER_00", "score": 0.9}
+    assert "score" not in second["words"][0]
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 429, 500])
+def test_deepgram_http_errors_are_mapped(audio_path, status_code):
+    backend = backend_with(DeepgramBackend, lambda request: httpx.Response(status_code, json={"err_msg": "nope"}))
+    try:
+        with pytest.raises(RemoteTranscriptionFailed, match="deepgram"):
+            backend.transcribe(audio_path)
+    finally:
+        backend.close()
+
+
+def test_connection_errors_are_mapped(audio_path):
+    def handler(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    backend = backend_with(DeepgramBackend, handler)
+    try:
+        with pytest.raises(RemoteTranscriptionFailed):
+            backend.transcribe(audio_path)
+    finally:
+        backend.close()
+
+
+class AssemblyAIServer:
+    """Upload, transcript creation and polling endpoints; the transcript completes on the third poll."""
+    def __init__(self, final_status="completed"):
+        self.final_status = final_status
+        self.requests = []
+        self.polls = 0
+
+    def __call__(self, request):
+        self.requests.append(request)
+        assert request.headers["authorization"] == "secret"
+        if request.url.path == "/v2/upload":
+            return httpx.Response(200, json={"upload_url": "https://cdn.asr.test/upload/1"})
+        if request.url.path == "/v2/transcript":
+            return httpx.Response(200, json={"id": "t1", "status": "queued"})
+        if request.url.path == "/v2/transcript/t1":
+            self.polls += 1
+            if self.polls < 3:
+                return httpx.Response(200, json={"id": "t1", "status": "processing"})
+            if self.final_status == "error":
+                return httpx.Response(200, json={"id": "t1", "status": "error", "error": "Audio is empty"})
+            return httpx.Response(200, json={
+                "id": "t1", "status": "completed", "audio_duration": 3, "language_code": "en",
+                "utterances": [
+                    {"start": 0, "end": 1200, "speaker": "B", "text": "Morning.",
+                     "words": [{"text": "Morning.", "start": 0, "end": 1200, "confidence": 0.7}]},
+                    {"start": 1500, "end": 3000, "speaker": "A", "text": "Hello.", "words": []},
+                    {"start": 3000, "end": 3200, "speaker": "B", "text": "Yes.", "words": []},
+                ],
+            })
+        return httpx.Response(404)
+
+
+def test_assemblyai_uploads_creates_and_polls(audio_path):
+    server = AssemblyAIServer()
+    backend = backend_with(AssemblyAIBackend, server, poll_seconds=0)
+    try:
+        result, speakers = backend.transcribe(audio_path, min_speakers=2, max_speakers=3)
+    finally:
+        backend.close()
+
+    upload, create = server.requests[:2]
+    with open(audio_path, "rb") as file:
+        assert upload.content == file.read()
+    assert json.loads(create.content) == {
+        "audio_url": "https://cdn.asr.test/upload/1", "speaker_labels": True, "language_detection": True,
+        "speaker_options": {"min_speakers_expected": 2, "max_speakers_expected": 3},
+    }
+    assert server.polls == 3
+
+    # Letters become whisperx labels in order of appearance
+    assert speakers == ["SPEAKER_00", "SPEAKER_01"]
+    assert [segment["speaker"] for segment in result["segments"]] == ["SPEAKER_00", "SPEAKER_01", "SPEAKER_00"]
+    assert result["segments"][0]["words"][0] == {"word": "Morning.", "start": 0.0, "end": 1.2, "speaker": "SPEAKER_00",
+                                                 "score": 0.7}
+    assert result["segments"][1]["start"] == 1.5
+
+
+def test_assemblyai_without_speaker_bounds_sends_no_options(audio_path):
+    server = AssemblyAIServer()
+    backend = backend_with(AssemblyAIBackend, server, poll_seconds=0)
+    try:
+        backend.transcribe(audio_path)
+    finally:
+        backend.close()
+    assert "speaker_options" not in json.loads(server.requests[1].content)
+
+
+def test_assemblyai_failed_transcripts_are_mapped(audio_path):
+    backend = backend_with(AssemblyAIBackend, AssemblyAIServer(final_status="error"), poll_seconds=0)
+    try:
+        with pytest.raises(RemoteTranscriptionFailed, match="Audio is empty"):
+            backend.transcribe(audio_path)
+    finally:
+        backend.close()
+
+
+class FakeBackend(TranscriptionBackend):
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+        self.calls = 0
+
+    def transcribe(self, audio_path, min_speakers=None, max_speakers=None):
+        self.calls += 1
+        if self.fail:
+            raise RemoteTranscriptionFailed(f"{self.name} is down")
+        return {"segments": []}, []
+
+
+def make_router(depth=0, **kwargs):
+    local = LocalBackend(None)
+    remotes = [FakeBackend("assemblyai"), FakeBackend("deepgram")]
+    router = BackendRouter(local, remotes, queue_depth=lambda: depth, max_local_backlog=2, remote_min_seconds=3600,
+                           costs={"deepgram": 0.0043, "assemblyai": 0.0062}, **kwargs)
+    return router, local, {backend.name: backend for backend in remotes}
+
+
+def test_router_keeps_jobs_local_until_the_backlog_overflows():
+    router, local, remotes = make_router(depth=2)
+    assert router.select(60) is local
+    router.queue_depth = lambda: 3
+    assert router.select(60) is remotes["deepgram"]
+    assert router.select(60, stream=True) is local
+
+
+def test_router_sends_long_recordings_remote():
+    router, local, remotes = make_router(depth=0)
+    assert router.select(3601) is remotes["deepgram"]
+    assert router.select(None) is local
+
+
+def test_router_skips_failed_backends_for_the_cooldown():
+    router, local, remotes = make_router(depth=10, failure_cooldown=300)
+    remotes["deepgram"].fail = True
+    with pytest.raises(RemoteTranscriptionFailed):
+        router.transcribe(remotes["deepgram"], "call.wav", 60)
+    assert router.select(60) is remotes["assemblyai"]
+
+    remotes["assemblyai"].fail = True
+    with pytest.raises(RemoteTranscriptionFailed):
+        router.transcribe(remotes["assemblyai"], "call.wav", 60)
+    assert router.select(60) is local
+
+
+def test_router_without_remotes_stays_local():
+    local = LocalBackend(None)
+    assert BackendRouter(local, queue_depth=lambda: 100).select(10_000) is local
+
+
+class FakeTranscriber:
+    stream_result = ({"segments": ["streamed"]}, ["SPEAKER_00"])
+
+    def __init__(self):
+        self.stages = []
+
+    def audio_seconds(self):
+        return 10.0
+
+    def load_model(self):
+        self.stages.append("load_model")
+
+    def transcribe_audio(self):
+        self.stages.append("transcribe")
+
+    def align_transcription(self):
+        self.stages.append("align")
+
+    def diarize_audio(self):
+        self.stages.append("diarize")
+        return {"segments": ["diarized"]}, ["SPEAKER_00"]
+
+    def transcribe_stream(self):
+        self.stages.append("stream")
+        yield {"text": "one"}
+        yield {"text": "two"}
+
+
+def test_local_backend_runs_every_stage_and_reports_progress():
+    transcriber, messages = FakeTranscriber(), []
+    result, speakers = LocalBackend.run(transcriber, lambda message, event=None: messages.append((event, message)))
+    assert transcriber.stages == ["load_model", "transcribe", "align", "diarize"]
+    assert result == {"segments": ["diarized"]} and speakers == ["SPEAKER_00"]
+    assert (None, "Diarization completed") in messages
+    assert [json.loads(message)["stage"] for event, message in messages if event == "metrics"] == \
+        ["load_model", "transcribe", "align", "diarize"]
+
+
+def test_local_backend_streams_segments():
+    transcriber, segments = FakeTranscriber(), []
+    result, _ = LocalBackend.run(transcriber, stream=True, on_segment=segments.append)
+    assert transcriber.stages == ["load_model", "stream"]
+    assert segments == [{"text": "one"}, {"text": "two"}]
+    assert result == {"segments": ["streamed"]}
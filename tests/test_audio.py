@@ -0,0 +1,45 @@
+import os
+import threading
+import wave
+import numpy as np
+from src.audio import decode_audio, file_sha256, read_normalized_wav, wav_seconds
+from src.constants import SAMPLE_RATE
+
+
+def write_wav(path, samples):
+    with wave.open(str(path), "wb") as audio_file:
+        audio_file.setnchannels(1)
+        audio_file.setsampwidth(2)
+        audio_file.setframerate(SAMPLE_RATE)
+        audio_file.writeframes((samples * 32767).astype("<i2").tobytes())
+
+
+def test_normalized_wav_is_read_without_ffmpeg(tmp_path):
+    samples = np.sin(np.linspace(0, 100, SAMPLE_RATE)).astype(np.float32)
+    write_wav(tmp_path / "a.wav", samples)
+    assert np.allclose(read_normalized_wav(str(tmp_path / "a.wav")), samples, atol=1e-3)
+    assert wav_seconds(str(tmp_path / "a.wav")) == 1.0
+
+
+def test_concurrent_decodes_of_the_same_content_share_one_cache_entry(tmp_path):
+    samples = np.random.default_rng(0).uniform(-1, 1, SAMPLE_RATE * 5).astype(np.float32)
+    write_wav(tmp_path / "a.wav", samples)
+    cache_dir = str(tmp_path / "cache")
+    content_hash = file_sha256(str(tmp_path / "a.wav"))
+    results, errors = [], []
+
+    def decode():
+        try:
+            results.append(decode_audio(str(tmp_path / "a.wav"), cache_dir=cache_dir, content_hash=content_hash))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=decode) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert all(np.array_equal(result, results[0]) for result in results)
+    assert os.listdir(cache_dir) == [f"{content_hash}.npy"]
@@ -0,0 +1,10 @@
+from src.batch import BatchItem, list_sources
+
+
+def test_files_differing_only_in_extension_get_their_own_output_directories(tmp_path):
+    (tmp_path / "calls").mkdir()
+    for name in ("calls/a.wav", "calls/a.mp3", "b.flac"):
+        (tmp_path / name).write_bytes(b"audio")
+
+    names = [BatchItem(source).output_name for source in list_sources(str(tmp_path))]
+    assert names == ["b_flac", "calls/a_mp3", "calls/a_wav"]
@@ -0,0 +1,105 @@
+import sys
+import types
+import pytest
+import src.dairization as dairization
+
+
+class FakeWhisperModel:
+    """Stands in for whisperx.asr.WhisperModel, the faster-whisper subclass FasterWhisperPipeline needs."""
+    def __init__(self, model_path, **kwargs):
+        self.model_path = model_path
+        self.kwargs = kwargs
+
+
+@pytest.fixture
+def fake_whisperx(monkeypatch, tmp_path):
+    whisperx = types.ModuleType("whisperx")
+    asr = types.ModuleType("whisperx.asr")
+    asr.WhisperModel = FakeWhisperModel
+    whisperx.asr = asr
+    whisperx.calls = []
+
+    def load_model(whisper_arch, device, **kwargs):
+        whisperx.calls.append((whisper_arch, device, kwargs))
+        return object()
+
+    whisperx.load_model = load_model
+    monkeypatch.setitem(sys.modules, "whisperx", whisperx)
+    monkeypatch.setitem(sys.modules, "whisperx.asr", asr)
+    monkeypatch.setattr(dairization, "MODEL_DIR", str(tmp_path / "models"))
+    monkeypatch.setattr(dairization, "MODEL_PATH", str(tmp_path / "models" / "missing"))
+    monkeypatch.setattr(dairization, "model_registry", dairization.ModelRegistry())
+    return whisperx
+
+
+def test_load_whisper_model_passes_whisperx_model(fake_whisperx):
+    profile = dairization.get_compute_profile("cpu")
+    dairization.load_whisper_model("cpu", "int8")
+
+    (_, device, kwargs), = fake_whisperx.calls
+    model = kwargs["model"]
+    assert device == "cpu"
+    assert type(model) is FakeWhisperModel
+    assert model.kwargs["cpu_threads"] == profile.cpu_threads
+    assert model.kwargs["num_workers"] == profile.num_workers
+    assert model.kwargs["compute_type"] == "int8"
+    assert kwargs["threads"] == profile.cpu_threads
+
+
+def test_load_whisper_model_is_loaded_once(fake_whisperx):
+    first = dairization.load_whisper_model("cpu", "int8")
+    assert dairization.load_whisper_model("cpu", "int8") is first
+    assert len(fake_whisperx.calls) == 1
+
+
+def test_whisper_model_counts_towards_the_memory_budget(fake_whisperx):
+    # The CTranslate2 pipeline has no parameters() to measure, so the static estimate applies
+    dairization.load_whisper_model("cpu", "int8")
+    assert dairization.model_registry.memory_usage_mb() == dairization.MODEL_MEMORY_ESTIMATES_MB["whisper"]
+
+
+def test_alignment_cache_is_keyed_by_vad_method(tmp_path, monkeypatch):
+    import numpy as np
+    from src.result_cache import DiskCacheBackend, ResultCache
+
+    whisperx = types.ModuleType("whisperx")
+    whisperx.align = lambda segments, *args, **kwargs: {"segments": [dict(segment) for segment in segments]}
+    monkeypatch.setitem(sys.modules, "whisperx", whisperx)
+    monkeypatch.setattr(dairization, "load_align_model", lambda language, device: (None, None))
+
+    audio_file = tmp_path / "call.wav"
+    audio_file.write_bytes(b"audio")
+    cache = ResultCache([DiskCacheBackend(str(tmp_path / "cache"), max_bytes=10 ** 6)])
+
+    def align(vad_method, text):
+        transcriber = dairization.WhisperTranscriber(str(audio_file), None, audio=np.zeros(16000, dtype=np.float32),
+                                                     result_cache=cache, vad_method=vad_method)
+        transcriber.result_trans = {"language": "en", "segments": [{"start": 0.0, "end": 1.0, "text": text}]}
+        transcriber.align_transcription()
+        return transcriber.result_align["segments"][0]["text"]
+
+    assert align("energy", "trimmed") == "trimmed"
+    assert align("off", "untrimmed") == "untrimmed"
+    assert align("energy", "ignored") == "trimmed"
+
+
+def test_sharded_diarization_passes_only_max_speakers_to_shards(monkeypatch):
+    import numpy as np
+    from concurrent.futures import Future
+    import src.sharded_diarization as sharded
+
+    calls = []
+
+    class FakePool:
+        def submit(self, fn, *args):
+            calls.append(args[1:])
+            future = Future()
+            future.set_result(([(0.0, 0.5, "A")], {"A": None}))
+            return future
+
+    monkeypatch.setattr(sharded, "_get_pool", lambda *args: FakePool())
+    segments = sharded.diarize_sharded(np.zeros(16000 * 3, dtype=np.float32), None, max_speakers=4,
+                                       shard_seconds=1, overlap_seconds=0)
+    # A shard with one voice must not be forced to split it
+    assert calls and all(call == (4,) for call in calls)
+    assert set(segments["speaker"]) == {"SPEAKER_00"}
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+from benchmarks.import_time import BUDGETS, REPO_DIR, measure_import
+
+HEAVY_MODULES = ("torch", "whisperx", "pyannote")
+
+
+def test_main_imports_no_model_libraries_and_stays_in_budget():
+    runs = [measure_import("main") for _ in range(3)]
+    for _, imports in runs:
+        heavy = sorted({name for _, name in imports if name.split(".")[0] in HEAVY_MODULES})
+        assert heavy == []
+    # Best of a few runs, like the benchmark, so a busy machine does not fail the check
+    assert min(total for total, _ in runs) <= BUDGETS["main"]
+
+
+def test_importing_main_creates_no_state(tmp_path):
+    state_dir = tmp_path / "state"
+    state_dir.mkdir()
+    env = dict(os.environ, TRANSCRIPT_STORE_PATH=str(state_dir / "transcripts.db"),
+               ARTIFACT_SPOOL_DIR=str(state_dir / "artifact_spool"), RESULT_CACHE_DIR=str(state_dir / "result_cache"),
+               JOB_BROKER_URL=f"sqlite:///{state_dir / 'jobs.db'}")
+    subprocess.run([sys.executable, "-c", "import main"], cwd=REPO_DIR, env=env, check=True)
+    assert list(state_dir.iterdir()) == []
@@ -0,0 +1,246 @@
+import asyncio
+import os
+import sys
+import threading
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import src.ingest as ingest
+from src.ingest import (ChunkReader, FetchFailed, MissingUpload, RequestFileReader, UnsupportedAudioFormat, UploadTooLarge,
+                        URLNotAllowed, check_url, ingest_upload, ingest_url, sniff_format)
+
+FAKE_FFMPEG = """
+import shutil, sys
+source, destination = sys.argv[sys.argv.index("-i") + 1], sys.argv[-1]
+with (sys.stdin.buffer if source == "pipe:0" else open(source, "rb")) as input_file, open(destination, "wb") as output:
+    shutil.copyfileobj(input_file, output)
+"""
+
+
+def wav_bytes(path, seconds=1):
+    with wave.open(str(path), "wb") as audio_file:
+        audio_file.setnchannels(1)
+        audio_file.setsampwidth(2)
+        audio_file.setframerate(16000)
+        audio_file.writeframes(b"\x01\x00" * 16000 * seconds)
+    return path.read_bytes()
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """Copies its input to the output, standing in for the normalization ffmpeg performs."""
+    script = tmp_path / "ffmpeg"
+    script.write_text(f"#!{sys.executable}\n{FAKE_FFMPEG}")
+    script.chmod(0o755)
+    monkeypatch.setattr(ingest, "FFMPEG_BINARY", str(script))
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Local HTTP server; `server.routes` maps paths to a body, a redirect target or a chunk generator."""
+    events = {"aborted": threading.Event()}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            route = httpd.routes.get(self.path)
+            if route is None:
+                self.send_error(404)
+            elif isinstance(route, tuple):
+                self.send_response(302)
+                self.send_header("Location", route[1])
+                self.end_headers()
+            elif callable(route):
+                self.send_response(200)
+                self.end_headers()
+                try:
+                    for chunk in route():
+                        self.wfile.write(chunk)
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    events["aborted"].set()
+            else:
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(route)))
+                self.end_headers()
+                self.wfile.write(route)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.routes = {}
+    httpd.events = events
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def allow_local(monkeypatch):
+    monkeypatch.setattr(ingest, "URL_ALLOWED_PRIVATE_HOSTS", ("127.0.0.1",))
+
+
+@pytest.mark.parametrize("url", [
+    "file:///etc/passwd", "ftp://example.com/a.wav", "http:///a.wav", "http://127.0.0.1/a.wav", "http://localhost:8000/",
+    "http://169.254.169.254/latest/meta-data/", "http://10.1.2.3/a.wav", "http://192.168.0.10/a.wav",
+    "http://[::1]/a.wav", "http://[::ffff:127.0.0.1]/a.wav", "http://0.0.0.0/a.wav",
+])
+def test_check_url_refuses_local_and_private_targets(url):
+    with pytest.raises(URLNotAllowed):
+        check_url(url)
+
+
+def test_check_url_accepts_allowed_hosts():
+    check_url("http://127.0.0.1:8000/a.wav", allowed_hosts=("127.0.0.1",))
+
+
+def test_sniff_format():
+    assert sniff_format(b"RIFF\x00\x00\x00\x00WAVEfmt ") == "wav"
+    assert sniff_format(b"ID3\x04") == "mp3"
+    assert sniff_format(b"\x00\x00\x00\x20ftypM4A ") == "mp4"
+    assert sniff_format(b"<html>") is None
+
+
+def test_url_is_streamed_into_the_destination(tmp_path, server, fake_ffmpeg, allow_local):
+    audio = wav_bytes(tmp_path / "call.wav")
+    server.routes["/call.wav"] = audio
+    server.routes["/moved"] = ("redirect", "/call.wav")
+
+    destination = str(tmp_path / "out.wav")
+    assert asyncio.run(ingest_url(f"{server.url}/moved", destination)) == len(audio)
+    with open(destination, "rb") as file:
+        assert file.read() == audio
+
+
+def test_redirects_into_private_networks_are_refused(tmp_path, server, fake_ffmpeg, allow_local):
+    server.routes["/moved"] = ("redirect", "http://169.254.169.254/latest/meta-data/")
+    destination = str(tmp_path / "out.wav")
+    with pytest.raises(URLNotAllowed):
+        asyncio.run(ingest_url(f"{server.url}/moved", destination))
+    assert not os.path.exists(destination)
+
+
+def test_http_errors_and_non_audio_are_rejected(tmp_path, server, fake_ffmpeg, allow_local):
+    server.routes["/page"] = b"<html>not audio</html>"
+    with pytest.raises(FetchFailed):
+        asyncio.run(ingest_url(f"{server.url}/missing.wav", str(tmp_path / "a.wav")))
+    with pytest.raises(UnsupportedAudioFormat):
+        asyncio.run(ingest_url(f"{server.url}/page", str(tmp_path / "b.wav")))
+
+
+def test_oversized_download_is_aborted_and_closed(tmp_path, server, fake_ffmpeg, allow_local):
+    header = wav_bytes(tmp_path / "call.wav")[:44]
+    server.routes["/endless.wav"] = lambda: iter([header] + [b"\x00" * 65536] * 100_000)
+
+    destination = str(tmp_path / "out.wav")
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(ingest_url(f"{server.url}/endless.wav", destination, max_bytes=1024 * 1024))
+    assert not os.path.exists(destination)
+    assert server.events["aborted"].wait(10)
+
+
+def test_chunk_reader_closes_its_generator():
+    closed = []
+
+    def chunks():
+        try:
+            yield b"abc"
+            yield b"def"
+        finally:
+            closed.append(True)
+
+    reader = ChunkReader(chunks())
+    assert asyncio.run(reader.read(2)) == b"ab"
+    reader.close()
+    assert closed == [True]
+
+
+def test_upload_is_rejected_past_the_limit(tmp_path, fake_ffmpeg):
+    audio = wav_bytes(tmp_path / "call.wav", seconds=2)
+
+    class Upload:
+        def __init__(self, data):
+            self.data = data
+
+        async def read(self, size):
+            chunk, self.data = self.data[:size], self.data[size:]
+            return chunk
+
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(ingest_upload(Upload(audio), str(tmp_path / "out.wav"), max_bytes=len(audio) - 1, chunk_size=4096))
+    assert asyncio.run(ingest_upload(Upload(audio), str(tmp_path / "out.wav"), chunk_size=4096)) == len(audio)
+
+
+def multipart_body(parts, boundary="bound"):
+    body = b""
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        body += f"--{boundary}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + data + b"\r\n"
+    return body + f"--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+def body_stream(body, chunk_size, pulled=None):
+    async def chunks():
+        for start in range(0, len(body), chunk_size):
+            if pulled is not None:
+                pulled.append(start)
+            yield body[start:start + chunk_size]
+    return chunks()
+
+
+def test_request_reader_streams_the_file_part(tmp_path, fake_ffmpeg):
+    audio = wav_bytes(tmp_path / "call.wav")
+    body, content_type = multipart_body([("note", None, b"hi"), ("file", "call.wav", audio), ("after", None, b"x")])
+    # Small chunks split the boundaries and headers across reads
+    reader = RequestFileReader(body_stream(body, 7), content_type)
+    assert asyncio.run(ingest_upload(reader, str(tmp_path / "out.wav"), chunk_size=4096)) == len(audio)
+    assert reader.filename == "call.wav"
+    assert (tmp_path / "out.wav").read_bytes() == audio
+
+    raw = RequestFileReader(body_stream(audio, 1000), "audio/wav")
+    assert asyncio.run(ingest_upload(raw, str(tmp_path / "raw.wav"))) == len(audio) and raw.filename is None
+
+
+def test_request_reader_rejects_before_the_body_is_read(tmp_path, fake_ffmpeg):
+    pulled = []
+    body, content_type = multipart_body([("file", "notes.txt", b"not audio at all " * 10000)])
+    with pytest.raises(UnsupportedAudioFormat):
+        asyncio.run(ingest_upload(RequestFileReader(body_stream(body, 1024, pulled), content_type), str(tmp_path / "out")))
+    assert len(pulled) < 10
+
+    pulled = []
+    body, content_type = multipart_body([("file", "call.wav", wav_bytes(tmp_path / "call.wav", seconds=4))])
+    reader = RequestFileReader(body_stream(body, 1024, pulled), content_type, max_bytes=32 * 1024)
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(ingest_upload(reader, str(tmp_path / "out.wav"), chunk_size=4096))
+    assert len(pulled) == 33
+
+
+def test_request_reader_requires_a_file_field():
+    body, content_type = multipart_body([("note", None, b"hi")])
+    with pytest.raises(MissingUpload):
+        asyncio.run(RequestFileReader(body_stream(body, 7), content_type).read(16))
+    with pytest.raises(MissingUpload):
+        asyncio.run(RequestFileReader(body_stream(body, 7), "multipart/form-data").read(16))
+
+
+def test_dns_rebinding_to_a_private_address_is_refused(tmp_path, server, fake_ffmpeg, monkeypatch):
+    server.routes["/call.wav"] = wav_bytes(tmp_path / "call.wav")
+    port = server.server_address[1]
+    resolve = ingest.socket.getaddrinfo
+    answers = []
+
+    def rebinding_getaddrinfo(host, *args, **kwargs):
+        if host != "rebind.test":
+            return resolve(host, *args, **kwargs)
+        # Public for the check, loopback for the connection that follows
+        answers.append(host)
+        address = "93.184.216.34" if len(answers) == 1 else "127.0.0.1"
+        return [(ingest.socket.AF_INET, ingest.socket.SOCK_STREAM, 6, "", (address, port))]
+
+    monkeypatch.setattr(ingest.socket, "getaddrinfo", rebinding_getaddrinfo)
+    with pytest.raises(URLNotAllowed):
+        asyncio.run(ingest_url(f"http://rebind.test:{port}/call.wav", str(tmp_path / "out.wav")))
+    assert len(answers) == 2
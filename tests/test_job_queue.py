@@ -0,0 +1,225 @@
+import asyncio
+import time
+import pytest
+from src.job_queue import SQLiteBroker, RemoteJobManager, BrokerJob, retry_delay
+
+
+@pytest.fixture
+def broker(tmp_path):
+    return SQLiteBroker(str(tmp_path / "jobs.db"), max_attempts=3, backoff_seconds=0)
+
+
+def collect(manager, job):
+    async def run():
+        return [event async for event in manager.stream_events(job, poll_interval=0.01)]
+    return asyncio.run(run())
+
+
+def test_lease_hands_each_job_to_one_worker(broker):
+    broker.enqueue("a", {"audio_uri": "a.wav"})
+    job = broker.lease("worker-1", lease_seconds=60)
+    assert job["id"] == "a" and job["attempts"] == 1 and job["payload"] == {"audio_uri": "a.wav"}
+    assert broker.lease("worker-2", lease_seconds=60) is None
+    assert broker.depth() == 1
+
+
+def test_heartbeat_extends_the_lease(broker):
+    broker.enqueue("a", {})
+    broker.lease("worker-1", lease_seconds=0.2)
+    time.sleep(0.1)
+    assert broker.heartbeat("a", "worker-1", lease_seconds=60)
+    time.sleep(0.15)
+    # Without the heartbeat the lease would have expired by now
+    assert broker.lease("worker-2", lease_seconds=60) is None
+    assert broker.get("a")["worker_id"] == "worker-1"
+    assert not broker.heartbeat("a", "worker-2", lease_seconds=60)
+
+
+def test_expired_lease_is_retried_and_the_old_worker_loses_it(broker):
+    broker.enqueue("a", {})
+    broker.lease("worker-1", lease_seconds=0.01)
+    time.sleep(0.02)
+
+    job = broker.lease("worker-2", lease_seconds=60)
+    assert job["id"] == "a" and job["attempts"] == 2 and job["worker_id"] == "worker-2"
+    assert not broker.heartbeat("a", "worker-1", lease_seconds=60)
+    assert not broker.complete("a", "worker-1", {"stale": True})
+    assert broker.complete("a", "worker-2", {"ok": True})
+    assert broker.get("a")["status"] == "completed"
+    assert broker.get("a")["result"] == {"ok": True}
+    assert broker.latest_completed() == "a"
+    assert broker.depth() == 0
+
+
+def test_expired_lease_is_lost_before_another_worker_reclaims_it(broker):
+    broker.enqueue("a", {})
+    broker.lease("worker-1", lease_seconds=0.01)
+    time.sleep(0.02)
+
+    assert not broker.heartbeat("a", "worker-1", lease_seconds=60)
+    assert not broker.complete("a", "worker-1", {"stale": True})
+    assert broker.fail("a", "worker-1", "boom") is False
+    assert broker.lease("worker-2", lease_seconds=60)["attempts"] == 2
+
+
+def test_events_of_finished_jobs_are_pruned_after_the_retention(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "jobs.db"), event_retention_seconds=0.05)
+    for job_id in ("old", "new"):
+        broker.enqueue(job_id, {})
+        broker.publish(job_id, "Job queued")
+    broker.lease("worker-1", lease_seconds=60)
+    broker.complete("old", "worker-1", {})
+    time.sleep(0.1)
+
+    broker.lease("worker-1", lease_seconds=60)
+    broker.complete("new", "worker-1", {})
+    assert broker.events_since("old", 0) == []
+    assert broker.events_since("new", 0) == [(None, "Job queued")]
+
+
+def test_failures_are_retried_until_dead_lettered(broker):
+    broker.enqueue("a", {})
+    for attempt in (1, 2):
+        job = broker.lease("worker-1", lease_seconds=60)
+        assert job["attempts"] == attempt
+        assert broker.fail("a", "worker-1", f"boom {attempt}") is False
+        assert broker.get("a")["status"] == "queued"
+
+    broker.lease("worker-1", lease_seconds=60)
+    assert broker.fail("a", "worker-1", "boom 3") is True
+    record = broker.get("a")
+    assert record["status"] == "failed" and record["attempts"] == 3 and record["error"] == "boom 3"
+    assert [job["id"] for job in broker.dead_letters()] == ["a"]
+    assert broker.lease("worker-1", lease_seconds=60) is None
+
+
+def test_expired_leases_count_towards_dead_lettering(broker):
+    broker.enqueue("a", {})
+    for _ in range(3):
+        broker.lease("worker-1", lease_seconds=0.01)
+        time.sleep(0.02)
+    assert broker.lease("worker-1", lease_seconds=60) is None
+    assert broker.get("a")["status"] == "failed"
+    assert broker.get("a")["error"] == "Lease expired"
+
+
+def test_retries_back_off_exponentially(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "jobs.db"), backoff_seconds=30)
+    broker.enqueue("a", {})
+    broker.lease("worker-1", lease_seconds=60)
+    broker.fail("a", "worker-1", "boom")
+    assert broker.lease("worker-1", lease_seconds=60) is None
+    assert [retry_delay(attempts, 30) for attempts in (1, 2, 3)] == [30, 60, 120]
+
+
+def test_brokers_share_one_database(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    SQLiteBroker(path).enqueue("a", {})
+    assert SQLiteBroker(path).lease("worker-1", lease_seconds=60)["id"] == "a"
+
+
+def test_remote_job_manager_replays_events_to_late_subscribers(broker):
+    manager = RemoteJobManager(broker, max_pending=1)
+    job = manager.enqueue({"audio_uri": "a.wav"}, job_id="a")
+    assert isinstance(job, BrokerJob) and job.status == "queued"
+    assert manager.is_full()
+
+    broker.lease("worker-1", lease_seconds=60)
+    broker.publish("a", "Transcribing audio...")
+    broker.publish("a", '{"start": 0.0}', event="segment")
+    broker.publish("a", "Processing complete")
+    broker.complete("a", "worker-1", {"summary_data": {}})
+
+    expected = ["data: Job queued\n\n", "data: Transcribing audio...\n\n",
+                'event: segment\ndata: {"start": 0.0}\n\n', "data: Processing complete\n\n"]
+    assert collect(manager, manager.get("a")) == expected
+    # A second subscriber sees the whole history again
+    assert collect(manager, manager.get("a")) == expected
+    assert manager.latest_completed().id == "a"
+    assert manager.get("missing") is None
+
+
+def test_remote_job_manager_streams_until_the_job_fails(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "jobs.db"), max_attempts=1)
+    manager = RemoteJobManager(broker)
+    job = manager.enqueue({}, job_id="a")
+    broker.lease("worker-1", lease_seconds=60)
+
+    async def run():
+        events = []
+
+        async def finish():
+            await asyncio.sleep(0.05)
+            broker.publish("a", "Processing failed: boom")
+            broker.fail("a", "worker-1", "boom")
+
+        task = asyncio.ensure_future(finish())
+        async for event in manager.stream_events(job, poll_interval=0.01):
+            events.append(event)
+        await task
+        return events
+
+    assert asyncio.run(run()) == ["data: Job queued\n\n", "data: Processing failed: boom\n\n"]
+
+
+def test_remote_job_manager_indexes_worker_transcripts(broker, tmp_path):
+    from src.pipeline import serialize_result
+    from src.transcript import Transcript
+    from src.transcript_store import TranscriptStore
+    from src.word_index import WordIndex
+
+    diarized = {"segments": [
+        {"start": 0.0, "end": 1.0, "text": " Shipping is delayed", "speaker": "SPEAKER_00",
+         "words": [{"word": "Shipping", "start": 0.0, "end": 0.4, "speaker": "SPEAKER_00"}]},
+        {"start": 1.0, "end": 2.0, "text": " Refund please", "speaker": "SPEAKER_01", "words": []},
+    ]}
+    transcript = Transcript.from_result(diarized)
+    result = {"conversation": transcript.to_html(), "summary_data": {"overall": "Late parcel"}, "audio_duration": 0.03,
+              "total_words": transcript.total_words, "words_by_speaker": transcript.words_by_speaker,
+              "word_index": WordIndex.from_result(diarized, transcript.speaker_map), "transcript": transcript}
+
+    store = TranscriptStore(str(tmp_path / "transcripts.db"))
+    manager = RemoteJobManager(broker, transcript_store=store)
+    manager.enqueue({"filename": "call.wav"}, job_id="a")
+    broker.lease("worker-1", lease_seconds=60)
+    broker.complete("a", "worker-1", serialize_result(result))
+
+    assert manager.index_completed() is False
+    hits = store.search("refund")
+    assert hits["total"] == 1 and hits["results"][0]["recording_id"] == "a"
+    assert store.get_recording("a")["filename"] == "call.wav"
+    # Already indexed jobs are skipped, also by a manager started afresh
+    assert manager.broker.completed_since(manager._index_cursor) == []
+    RemoteJobManager(broker, transcript_store=store).index_completed()
+    assert store.search("refund")["total"] == 1
+    assert manager.get("a").result["transcript"].lines() == transcript.lines()
+
+
+def test_worker_cancels_a_job_whose_lease_was_lost(broker, tmp_path, monkeypatch):
+    import src.pipeline
+    from src.worker import TranscriptionWorker
+
+    audio = tmp_path / "a.wav"
+    audio.write_bytes(b"RIFF")
+    broker.enqueue("a", {"audio_uri": str(audio)})
+    job = broker.lease("worker-1", lease_seconds=60)
+    stages = []
+
+    def pipeline(workspace, progress, *args, **kwargs):
+        progress("Transcribing")
+        stages.append("transcribe")
+        # Another worker takes the job over, the next heartbeat notices
+        broker._connection().execute("UPDATE queue_jobs SET worker_id = 'worker-2' WHERE id = 'a'")
+        time.sleep(0.1)
+        progress("Diarizing")
+        stages.append("diarize")
+        return {}
+
+    monkeypatch.setattr(src.pipeline, "run_transcription_pipeline", pipeline)
+    worker = TranscriptionWorker(broker, "worker", None, None, None, None, heartbeat_seconds=0.01)
+    worker.process(job, "worker-1")
+
+    assert stages == ["transcribe"]
+    assert broker.get("a")["status"] == "running" and broker.get("a")["worker_id"] == "worker-2"
+    assert broker.events_since("a", 0) == [(None, "Transcribing")]
+    assert audio.exists()
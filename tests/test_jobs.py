@@ -0,0 +1,44 @@
+import threading
+import time
+import pytest
+from src.jobs import JobManager, JobQueueFull
+
+
+def wait_for(job, timeout=5):
+    deadline = time.time() + timeout
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_io_bound_jobs_do_not_take_cpu_worker_slots():
+    manager = JobManager(max_workers=1, max_pending=0, max_io_workers=2)
+    release = threading.Event()
+    try:
+        local = manager.submit(lambda progress: release.wait(5))
+        assert manager.is_full() and manager.local_backlog() == 1
+        with pytest.raises(JobQueueFull):
+            manager.submit(lambda progress: None)
+
+        # The remote job runs although every CPU worker is busy, and does not add to the local backlog
+        remote = wait_for(manager.submit(lambda progress: "remote", io_bound=True))
+        assert remote.status == "completed" and remote.result == "remote"
+        assert manager.local_backlog() == 1
+        assert not manager.is_full(io_bound=True)
+    finally:
+        release.set()
+    assert wait_for(local).status == "completed"
+
+
+def test_io_bound_jobs_fall_back_to_the_cpu_workers():
+    manager = JobManager(max_workers=1, max_pending=0, max_io_workers=1)
+    threads = []
+
+    def transcribe_locally():
+        threads.append(threading.current_thread().name)
+        return "local"
+
+    job = wait_for(manager.submit(lambda progress: manager.run_on_workers(transcribe_locally), io_bound=True))
+    assert job.result == "local"
+    assert threads[0].startswith("transcription-job")
+    manager.shutdown(wait=True)
@@ -0,0 +1,73 @@
+import os
+import threading
+from src.result_cache import DiskCacheBackend, ResultCache
+
+
+def test_concurrent_writers_of_one_key_never_fail(tmp_path):
+    backend = DiskCacheBackend(str(tmp_path), max_bytes=10 ** 9)
+    values = [bytes([65 + i]) * 200_000 for i in range(8)]
+    errors = []
+
+    def write(data):
+        try:
+            for _ in range(20):
+                backend.put("ab" + "0" * 62, data)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(data,)) for data in values]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert backend.get("ab" + "0" * 62) in values
+    assert not [name for name in os.listdir(tmp_path / "ab") if name.endswith(".tmp")]
+
+
+def test_corrupt_entry_is_a_miss_and_is_dropped(tmp_path):
+    cache = ResultCache([DiskCacheBackend(str(tmp_path), max_bytes=10 ** 6)])
+    key = cache.key("transcribe", "abc")
+    cache.put(key, {"segments": [1, 2, 3]})
+    path = cache.backends[0]._path(key)
+    with open(path, "wb") as file:
+        file.write(b'{"segments": [1, 2')
+
+    assert cache.get(key) is None
+    assert not os.path.exists(path)
+    assert cache.get_or_compute(key, lambda: {"segments": []}) == {"segments": []}
+    assert cache.get(key) == {"segments": []}
+
+
+def test_corrupt_entry_falls_through_to_the_next_backend(tmp_path):
+    first = DiskCacheBackend(str(tmp_path / "first"), max_bytes=10 ** 6)
+    second = DiskCacheBackend(str(tmp_path / "second"), max_bytes=10 ** 6)
+    cache = ResultCache([first, second])
+    key = cache.key("align", "abc")
+    first.put(key, b"\xff\xfe")
+    second.put(key, b'{"ok": true}')
+
+    assert cache.get(key) == {"ok": True}
+    assert first.get(key) == b'{"ok": true}'
+
+
+def test_eviction_runs_only_past_the_limit(tmp_path, monkeypatch):
+    backend = DiskCacheBackend(str(tmp_path), max_bytes=1000)
+    walks = []
+    entries = backend._entries
+    monkeypatch.setattr(backend, "_entries", lambda: walks.append(1) or entries())
+
+    for i in range(9):
+        backend.put(f"{i:02d}" + "0" * 62, b"x" * 100)
+    assert walks == []
+
+    oldest = backend._path("00" + "0" * 62)
+    os.utime(oldest, (1, 1))
+    backend.put("09" + "0" * 62, b"x" * 200)
+    assert len(walks) == 1
+    assert not os.path.exists(oldest)
+    assert backend._bytes == 1000
+
+    # Entries written by another process are counted by the initial scan
+    assert DiskCacheBackend(str(tmp_path), max_bytes=1000)._bytes == 1000
@@ -0,0 +1,92 @@
+import os
+import time
+import boto3
+import pytest
+from moto import mock_aws
+from src.s3_syncer import S3Sync, local_etag
+
+BUCKET = "focus-transcribe-test"
+
+
+@pytest.fixture
+def s3_sync(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        yield S3Sync("testing", "testing", "us-east-1", max_workers=4)
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def test_client_is_created_lazily():
+    s3_sync = S3Sync("testing", "testing", "us-east-1")
+    assert s3_sync._s3_client is None
+    with mock_aws():
+        assert s3_sync.s3_client is s3_sync.s3_client
+        assert s3_sync.s3_client.meta.config.max_pool_connections == s3_sync.max_workers * 2
+
+
+def test_list_objects_follows_every_page(s3_sync):
+    for i in range(1050):
+        s3_sync.s3_client.put_object(Bucket=BUCKET, Key=f"calls/{i:04d}.json", Body=b"{}")
+    s3_sync.s3_client.put_object(Bucket=BUCKET, Key="other/skip.json", Body=b"{}")
+
+    objects = s3_sync.list_objects(BUCKET, "calls/")
+    assert len(objects) == 1050
+    assert "calls/1049.json" in objects
+    assert objects["calls/0000.json"]["Size"] == 2
+
+
+def test_sync_to_s3_uploads_only_new_and_changed_files(s3_sync, tmp_path):
+    folder = tmp_path / "job"
+    write(str(folder / "transcript.txt"), b"hello")
+    write(str(folder / "nested" / "summary.json"), b"{}")
+    uploaded = s3_sync.sync_folder_to_s3(str(folder), BUCKET, "jobs/1")
+    assert sorted(uploaded) == ["jobs/1/nested/summary.json", "jobs/1/transcript.txt"]
+
+    # Unchanged files are skipped, even when touched after the upload
+    later = time.time() + 60
+    os.utime(folder / "transcript.txt", (later, later))
+    assert s3_sync.sync_folder_to_s3(str(folder), BUCKET, "jobs/1") == []
+
+    # Same size, different content and a newer mtime: the ETag decides
+    write(str(folder / "transcript.txt"), b"HELLO")
+    os.utime(folder / "transcript.txt", (later, later))
+    assert s3_sync.sync_folder_to_s3(str(folder), BUCKET, "jobs/1") == ["jobs/1/transcript.txt"]
+    body = s3_sync.s3_client.get_object(Bucket=BUCKET, Key="jobs/1/transcript.txt")["Body"].read()
+    assert body == b"HELLO"
+
+
+def test_sync_from_s3_downloads_concurrently_and_skips_up_to_date_files(s3_sync, tmp_path):
+    for i in range(20):
+        s3_sync.s3_client.put_object(Bucket=BUCKET, Key=f"models/part-{i}.bin", Body=os.urandom(1024))
+    folder = str(tmp_path / "models")
+
+    assert len(s3_sync.sync_folder_from_s3(folder, BUCKET, "models/")) == 20
+    path = os.path.join(folder, "models", "part-3.bin")
+    remote = s3_sync.list_objects(BUCKET, "models/")["models/part-3.bin"]
+    assert local_etag(path) == remote["ETag"].strip('"')
+    assert os.path.getmtime(path) == pytest.approx(remote["LastModified"].timestamp())
+
+    assert s3_sync.sync_folder_from_s3(folder, BUCKET, "models/") == []
+    write(path, b"corrupt")
+    assert s3_sync.sync_folder_from_s3(folder, BUCKET, "models/") == ["models/part-3.bin"]
+
+
+def test_sync_from_s3_downloads_objects_overwritten_with_the_same_size(s3_sync, tmp_path):
+    s3_sync.s3_client.put_object(Bucket=BUCKET, Key="models/weights.bin", Body=b"version-1")
+    folder = str(tmp_path / "models")
+    assert s3_sync.sync_folder_from_s3(folder, BUCKET, "models/") == ["models/weights.bin"]
+
+    # LastModified has a resolution of one second
+    time.sleep(1.1)
+    s3_sync.s3_client.put_object(Bucket=BUCKET, Key="models/weights.bin", Body=b"version-2")
+    assert s3_sync.sync_folder_from_s3(folder, BUCKET, "models/") == ["models/weights.bin"]
+    with open(os.path.join(folder, "models", "weights.bin"), "rb") as file:
+        assert file.read() == b"version-2"
+    assert s3_sync.sync_folder_from_s3(folder, BUCKET, "models/") == []
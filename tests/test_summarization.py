@@ -0,0 +1,153 @@
+import asyncio
+import pytest
+import src.summarization as summarization
+from src.result_cache import DiskCacheBackend, ResultCache
+from src.summarization import SummarizationEngine, chunk_turns, estimate_tokens
+
+
+class Response:
+    def __init__(self, content):
+        self.content = content
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+class FakeLLM:
+    """Chat model recording every call; `failures` calls raise before it starts answering."""
+    def __init__(self, delay=0.01, failures=0, error=RateLimited):
+        self.delay = delay
+        self.failures = failures
+        self.error = error
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    async def ainvoke(self, messages):
+        self.calls.append(messages)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if self.failures:
+                self.failures -= 1
+                raise self.error("Rate limit reached" if self.error is RateLimited else "Invalid request")
+            prompt = messages[1]["content"]
+            kind = "reduce" if prompt.lstrip().startswith("Combine") else "map"
+            return Response(f"Summary: {kind} {len(prompt)}")
+        finally:
+            self.active -= 1
+
+
+def test_chunk_turns_breaks_between_turns_within_the_budget():
+    turns = [f"Speaker {i % 2 + 1}: " + "word " * 30 for i in range(10)]
+    chunks = chunk_turns(turns, max_tokens=100)
+    assert [turn for chunk in chunks for turn in chunk] == turns
+    assert all(sum(estimate_tokens(turn) for turn in chunk) <= 100 for chunk in chunks)
+    assert len(chunks) > 1
+
+
+def test_chunk_turns_splits_a_turn_over_the_budget_between_words():
+    turn = " ".join(f"w{i}" for i in range(500))
+    chunks = chunk_turns([turn], max_tokens=50)
+    assert len(chunks) > 1
+    assert " ".join(piece for chunk in chunks for piece in chunk).split() == turn.split()
+
+
+def test_summaries_run_concurrently_within_the_bound():
+    llm = FakeLLM(delay=0.05)
+    engine = SummarizationEngine(llm=llm, max_concurrency=2)
+    speaker_texts = {f"Speaker {i}": [f"turn of speaker {i}"] for i in range(1, 6)}
+
+    table = engine.summarise_conversation(speaker_texts, ["Speaker 1: hello"])
+    assert table["Speaker"] == list(speaker_texts) + ["Total Summary"]
+    assert all(summary.startswith("map") for summary in table["Summary"])
+    assert len(llm.calls) == 6
+    assert llm.max_active == 2
+
+
+def test_rate_limits_are_retried_with_backoff(monkeypatch):
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(seconds):
+        delays.append(seconds)
+        await real_sleep(0)
+
+    llm = FakeLLM(delay=0, failures=2)
+    engine = SummarizationEngine(llm=llm, max_retries=3, backoff_seconds=1.0)
+    monkeypatch.setattr(summarization.asyncio, "sleep", sleep)
+    assert engine.summarise("short transcript").startswith("map")
+    assert len(llm.calls) == 3
+    assert 1.0 <= delays[0] <= 2.0 and 2.0 <= delays[1] <= 4.0
+
+
+def test_rate_limits_give_up_after_max_retries(monkeypatch):
+    async def sleep(seconds):
+        pass
+
+    monkeypatch.setattr(summarization.asyncio, "sleep", sleep)
+    engine = SummarizationEngine(llm=FakeLLM(delay=0, failures=10), max_retries=2)
+    with pytest.raises(RateLimited):
+        engine.summarise("short transcript")
+    assert len(engine.llm.calls) == 3
+
+
+def test_other_errors_are_not_retried():
+    engine = SummarizationEngine(llm=FakeLLM(delay=0, failures=1, error=ValueError), max_retries=3)
+    with pytest.raises(ValueError):
+        engine.summarise("short transcript")
+    assert len(engine.llm.calls) == 1
+
+
+def test_long_transcripts_are_summarised_map_reduce():
+    llm = FakeLLM(delay=0)
+    engine = SummarizationEngine(llm=llm, chunk_tokens=200)
+    turns = [f"Speaker {i % 2 + 1}: " + "words " * 60 for i in range(20)]
+
+    summary = engine.summarise(turns)
+    prompts = [call[1]["content"] for call in llm.calls]
+    maps = [prompt for prompt in prompts if not prompt.lstrip().startswith("Combine")]
+    assert len(maps) == len(chunk_turns(turns, 200))
+    assert len(prompts) > len(maps)
+    assert summary.startswith("reduce")
+
+
+
+def test_summaries_longer_than_a_chunk_are_reduced_pairwise():
+    class VerboseLLM(FakeLLM):
+        async def ainvoke(self, messages):
+            response = await super().ainvoke(messages)
+            return Response(response.content + " detail" * 100)
+
+    llm = VerboseLLM(delay=0.001)
+    engine = SummarizationEngine(llm=llm, chunk_tokens=50)
+    turns = [f"Speaker {i % 2 + 1}: " + "words " * 30 for i in range(8)]
+
+    async def run():
+        # Splitting the summaries between words never shrank the list, so this used to loop forever
+        return await asyncio.wait_for(engine.asummarise(turns), timeout=10)
+
+    summary = asyncio.run(run())
+    maps = len(chunk_turns(turns, 50))
+    assert summary.startswith("reduce")
+    # Each pairwise reduction combines two summaries into one
+    assert len(llm.calls) == 2 * maps - 1
+
+def test_cached_summaries_are_keyed_by_prompt_version(tmp_path, monkeypatch):
+    cache = ResultCache([DiskCacheBackend(str(tmp_path), max_bytes=10 ** 6)])
+    llm = FakeLLM(delay=0)
+    engine = SummarizationEngine(llm=llm)
+    speaker_texts = {"Speaker 1": ["hello"]}
+
+    first = engine.summarise_conversation(speaker_texts, ["Speaker 1: hello"], result_cache=cache)
+    assert engine.summarise_conversation(speaker_texts, ["Speaker 1: hello"], result_cache=cache) == first
+    assert len(llm.calls) == 2
+
+    version = engine.prompt_version()
+    monkeypatch.setattr(summarization, "SYSTEM_PROMPT", "Summarise in one sentence.")
+    assert engine.prompt_version() != version
+    engine.summarise_conversation(speaker_texts, ["Speaker 1: hello"], result_cache=cache)
+    assert len(llm.calls) == 4